@@ -146,6 +146,15 @@ REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_DB = 0
 
+# shared by API processes and celery workers, order book depth cached by
+# the API is invalidated through it when workers expire or clear orders
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}/1',
+    }
+}
+
 # celery
 CELERY_BROKER_URL = 'redis://localhost:6379'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379'
@@ -153,6 +162,95 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# seconds between runs of the order expiry task
+ORDER_EXPIRY_INTERVAL = 1
+# seconds between clearings of instruments in call auction mode
+ORDER_AUCTION_INTERVAL = 60
+# seconds between runs of the emulation history retention task
+STATS_RETENTION_INTERVAL = 60 * 60
+
+CELERY_BEAT_SCHEDULE = {
+    'expire-orders': {
+        'task': 'expire_orders',
+        'schedule': ORDER_EXPIRY_INTERVAL,
+    },
+    'clear-auctions': {
+        'task': 'clear_auctions',
+        'schedule': ORDER_AUCTION_INTERVAL,
+    },
+    'apply-stats-retention': {
+        'task': 'apply_stats_retention',
+        'schedule': STATS_RETENTION_INTERVAL,
+    },
+}
+
+# retention of emulation history tables. Points of rounds whose last point
+# is older than `downsample_after` days are reduced to `points` per
+# instrument, every replaced run of points is summarized as 'avg' or 'last'.
+# Rounds older than `delete_after` days are deleted, None keeps them.
+# `archive` appends raw rows to gzipped csv under STATS_ARCHIVE_PATH first
+STATS_RETENTION = {
+    'OrderPriceHistory': {
+        'downsample_after': 7,
+        'points': 500,
+        'summary': 'avg',
+        'delete_after': 180,
+        'archive': False,
+    },
+    'LiquidityHistory': {
+        'downsample_after': 7,
+        'points': 500,
+        'summary': 'avg',
+        'delete_after': 180,
+        'archive': False,
+    },
+    'PlacedAssetsHistory': {
+        'downsample_after': 7,
+        'points': 500,
+        'summary': 'last',
+        'delete_after': 180,
+        'archive': False,
+    },
+}
+# rows removed by one statement of the retention task
+STATS_RETENTION_BATCH_SIZE = 1000
+STATS_ARCHIVE_PATH = os.path.join(BASE_DIR, 'stats_archive')
+# seconds the `until` cursor of stats endpoint lags behind now, longer than
+# transactions writing history points take to commit
+STATS_CURSOR_LAG = 5
+
+# matching engine: 'database' matches against rows locked in postgres,
+# 'memory' keeps per instrument order books in process memory
+ORDER_BOOK_ENGINE = 'database'
+# 'file' or 'redis' keeps snapshots and event logs of in-memory books, so
+# they are recovered without loading every active order, 'off' disables it
+ORDER_BOOK_JOURNAL = 'off'
+ORDER_BOOK_JOURNAL_PATH = os.path.join(BASE_DIR, 'orderbooks')
+# number of logged events after which book is snapshotted again
+ORDER_BOOK_SNAPSHOT_EVERY = 1000
+
+# levels of both book sides cached by the depth endpoint and how long
+# they live at most, cache is dropped on every change of the book anyway
+ORDER_BOOK_DEPTH_LEVELS = 50
+ORDER_BOOK_DEPTH_TTL = 60
+
+# most OHLCV bars returned by one request of the candles endpoint
+CANDLES_MAX_BARS = 1000
+
+# 'off' matches in the request worker, 'redis' puts orders on per instrument
+# streams consumed by `manage.py run_matching_worker`, 'local' runs a
+# matching thread per instrument inside of the process
+ORDER_SEQUENCER = 'off'
+# seconds HTTP request waits for the matching result before returning 202
+ORDER_SEQUENCER_TIMEOUT = 10
+# shards of `manage.py run_matching_worker --shard`, instruments are spread
+# over them by consistent hashing, `manage.py matching_shards` changes the
+# map at runtime and workers hand instruments over under leases
+ORDER_SHARDS = []
+ORDER_SHARD_REPLICAS = 64
+ORDER_SHARD_LEASE_TTL = 30
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
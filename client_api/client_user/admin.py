@@ -7,5 +7,24 @@ from . import models
 admin.site.register(models.ClientUser)
 admin.site.register(models.Instrument)
 admin.site.register(models.Order)
+admin.site.register(models.OrderTotals)
+admin.site.register(models.Candle)
 admin.site.register(models.InstrumentBalance)
 admin.site.register(models.Currency)
+
+
+@admin.register(models.Trade)
+class TradeAdmin(admin.ModelAdmin):
+    """
+    Fills are written by matching only and never change, so they are
+    shown read-only
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,73 @@
+from typing import TYPE_CHECKING
+
+# numpy is imported on first clearing, so instruments that never run an
+# auction do not pay for it and the app loads without it
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def as_array(units) -> 'np.ndarray':
+    """
+    Integer units (see fixedpoint) to int64 array, cumulative sums of
+    curves built over it stay exact
+    """
+    import numpy as np
+    return np.fromiter(units, dtype=np.int64)
+
+
+def _curves(bid_prices, bid_sums, ask_prices, ask_sums,
+            prices) -> ('np.ndarray', 'np.ndarray'):
+    """
+    Demand and supply at every one of prices
+    """
+    import numpy as np
+    bid_order = np.argsort(bid_prices, kind='stable')
+    sorted_bids = bid_prices[bid_order]
+    bid_cumsum = np.concatenate([[0], np.cumsum(bid_sums[bid_order])])
+    # bids willing to pay at least the price
+    demand = bid_cumsum[-1] - bid_cumsum[np.searchsorted(
+        sorted_bids, prices, side='left')]
+    ask_order = np.argsort(ask_prices, kind='stable')
+    sorted_asks = ask_prices[ask_order]
+    ask_cumsum = np.concatenate([[0], np.cumsum(ask_sums[ask_order])])
+    # asks willing to sell at most at the price
+    supply = ask_cumsum[np.searchsorted(sorted_asks, prices, side='right')]
+    return demand, supply
+
+
+def clearing_price(bid_prices: 'np.ndarray',
+                   bid_sums: 'np.ndarray',
+                   ask_prices: 'np.ndarray',
+                   ask_sums: 'np.ndarray',
+                   tick: int = 1) -> (int, int):
+    """
+    Finds uniform price executing the largest volume. Ties are broken by
+    the smallest imbalance between demand and supply and then by the
+    candidate price closest to the middle of the remaining price range,
+    the lower one of two equally close.
+    All arguments are int64 arrays of integer units.
+    :param tick: tick size in units, the price is a multiple of it
+    :return: price and volume traded at it in units, (None, 0) when the
+    book does not cross
+    """
+    import numpy as np
+    if not len(bid_prices) or not len(ask_prices):
+        return None, 0
+    prices = np.unique(np.concatenate([bid_prices, ask_prices]))
+    demand, supply = _curves(bid_prices, bid_sums, ask_prices, ask_sums,
+                             prices)
+    volume = np.minimum(demand, supply)
+    best_volume = volume.max()
+    if best_volume <= 0:
+        return None, 0
+    candidates = volume == best_volume
+    imbalance = np.abs(demand - supply)
+    candidates &= imbalance == imbalance[candidates].min()
+    candidate_prices = prices[candidates]
+    middle = (int(candidate_prices.min()) + int(candidate_prices.max())) // 2
+    price = int(candidate_prices[np.argmin(np.abs(candidate_prices - middle))])
+    # orders placed before the tick grid was enforced may be off it
+    price -= price % tick
+    demand, supply = _curves(bid_prices, bid_sums, ask_prices, ask_sums,
+                             np.array([price]))
+    return price, int(min(demand[0], supply[0]))
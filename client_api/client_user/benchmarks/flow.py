@@ -0,0 +1,216 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from client_user import models
+from client_user.benchmarks.sweep import Rollback, _create_user
+from client_user.orderbook import order_books
+
+DIRECT = 'direct'
+HTTP = 'http'
+DRIVERS = (DIRECT, HTTP)
+DISTRIBUTIONS = ('normal', 'uniform')
+
+ORDERS_URL = '/api/v1/user/orders/'
+# statements emitted by the benchmark's own outer transaction
+SAVEPOINT_SQL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class FlowConfig:
+    """
+    Shape of a synthetic order flow
+    """
+
+    def __init__(self,
+                 orders=1000,
+                 depth=100,
+                 users=20,
+                 buy_ratio=0.5,
+                 price_mid=100,
+                 price_spread=5,
+                 distribution='normal',
+                 max_amount=10,
+                 seed=0):
+        """
+        :param orders: number of measured orders
+        :param depth: number of resting orders placed before measuring
+        :param users: number of users placing orders
+        :param buy_ratio: share of buy orders
+        :param price_mid: center of the price distribution
+        :param price_spread: standard deviation of normal distribution,
+        half width of uniform one
+        :param distribution: normal or uniform
+        :param max_amount: orders are sized uniformly from 1 to max_amount
+        :param seed: same seed gives the same flow
+        """
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f'Unknown price distribution {distribution}')
+        self.orders = orders
+        self.depth = depth
+        self.users = users
+        self.buy_ratio = buy_ratio
+        self.price_mid = price_mid
+        self.price_spread = price_spread
+        self.distribution = distribution
+        self.max_amount = max_amount
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def generate_flow(config: FlowConfig) -> [dict]:
+    """
+    Generates resting book followed by measured orders
+    :return: orders as dicts with user index, type, price and total_sum
+    """
+    rng = random.Random(config.seed)
+    flow = []
+    for index in range(config.depth + config.orders):
+        is_buy = rng.random() < config.buy_ratio
+        if config.distribution == 'normal':
+            price = rng.gauss(config.price_mid, config.price_spread)
+        else:
+            price = rng.uniform(config.price_mid - config.price_spread,
+                                config.price_mid + config.price_spread)
+        if index < config.depth:
+            # resting book must not cross, buys go below mid, sells above
+            offset = abs(price - config.price_mid)
+            price = config.price_mid + (-offset if is_buy else offset)
+        flow.append({
+            'user':
+            rng.randrange(config.users),
+            'type': (models.OrderType.BUY.value
+                     if is_buy else models.OrderType.SELL.value),
+            'price':
+            Decimal(max(price, 0.01)).quantize(Decimal('0.01')),
+            'total_sum':
+            Decimal(rng.randint(1, config.max_amount)),
+        })
+    return flow
+
+
+def _setup(config: FlowConfig, flow: [dict]):
+    instrument = models.Instrument.objects.create(
+        name=f'benchmark {uuid.uuid4().hex[:8]}')
+    users = [_create_user('flow') for _ in range(config.users)]
+    # every user can afford the whole flow, funds never limit matching
+    fiat = sum(o['total_sum'] * o['price'] for o in flow)
+    amount = sum(o['total_sum'] for o in flow)
+    models.FiatBalance.objects.filter(
+        user__in=users,
+        currency__title=models.TRADING_CURRENCY).update(amount=fiat)
+    models.InstrumentBalance.objects.filter(
+        instrument=instrument, user__in=users).update(amount=amount)
+    return instrument, users
+
+
+def _build_order(data, instrument, users) -> models.Order:
+    return models.Order(user=users[data['user']],
+                        instrument=instrument,
+                        type=data['type'],
+                        price=data['price'],
+                        total_sum=data['total_sum'],
+                        remaining_sum=data['total_sum'],
+                        expires_in=timedelta(days=1).total_seconds())
+
+
+def _place_direct(engine):
+    def place(data, instrument, users):
+        models.Order.place_order(_build_order(data, instrument, users),
+                                 engine=engine)
+
+    return place
+
+
+def _place_http():
+    client = APIClient()
+
+    def place(data, instrument, users):
+        payload = {
+            'instrument_id': instrument.id,
+            'type': data['type'],
+            'price': str(data['price']),
+            'total_sum': str(data['total_sum']),
+            'expires_in': timedelta(days=1).total_seconds(),
+        }
+        client.force_authenticate(users[data['user']])
+        response = client.post(ORDERS_URL, payload, format='json')
+        if response.status_code >= 300:
+            raise AssertionError(
+                f'Order was rejected: {response.status_code} {response.data}')
+
+    return place
+
+
+def _run(config: FlowConfig, flow: [dict], place) -> dict:
+    instrument, users = _setup(config, flow)
+    order_books.discard(instrument.id)
+    for data in flow[:config.depth]:
+        place(data, instrument, users)
+    latencies, statements = [], 0
+    started = time.perf_counter()
+    for data in flow[config.depth:]:
+        with CaptureQueriesContext(connection) as queries:
+            order_started = time.perf_counter()
+            place(data, instrument, users)
+            latencies.append(time.perf_counter() - order_started)
+        statements += sum(1 for q in queries.captured_queries
+                          if not q['sql'].startswith(SAVEPOINT_SQL))
+    elapsed = time.perf_counter() - started
+    order_books.discard(instrument.id)
+    latencies = np.array(latencies) * 1000
+    return {
+        'orders': len(latencies),
+        'trades': models.Trade.objects.filter(instrument=instrument).count(),
+        'seconds': elapsed,
+        'orders_per_sec': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'statements_per_order': statements / len(latencies),
+    }
+
+
+def run_flow_benchmark(config: FlowConfig,
+                       drivers=DRIVERS,
+                       engine=None) -> dict:
+    """
+    Replays the same synthetic flow through every driver: `direct` calls
+    Order.place_order, `http` posts to the order endpoint through the
+    whole django stack. Everything created is rolled back, statements of
+    the benchmark's own transaction are not counted.
+    :param engine: matching engine of the direct driver, the endpoint
+    always uses ORDER_BOOK_ENGINE setting
+    :return: JSON serializable report
+    """
+    flow = generate_flow(config)
+    report = {
+        'created_at':
+        timezone.now().isoformat(),
+        'database':
+        connection.vendor,
+        'engine':
+        engine or getattr(settings, 'ORDER_BOOK_ENGINE',
+                          models.OrderBookEngine.DATABASE.value),
+        'config':
+        config.as_dict(),
+        'results': {},
+    }
+    for driver in drivers:
+        place = _place_direct(engine) if driver == DIRECT else _place_http()
+        try:
+            with transaction.atomic():
+                report['results'][driver] = _run(config, flow, place)
+                raise Rollback
+        except Rollback:
+            pass
+    return report
@@ -0,0 +1,92 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from client_user import models
+from client_user.orderbook import order_books
+
+
+class Rollback(Exception):
+    pass
+
+
+def _create_user(prefix):
+    return models.ClientUser.objects.create_user(
+        f'{prefix}-{uuid.uuid4().hex[:12]}@benchmark.local')
+
+
+def _measure_sweep(depth, engine):
+    """
+    Places one order crossing `depth` resting orders of distinct users
+    :return: (number of sql statements, seconds)
+    """
+    instrument = models.Instrument.objects.create(
+        name=f'benchmark {uuid.uuid4().hex[:8]}')
+    makers = [_create_user('maker') for _ in range(depth)]
+    taker = _create_user('taker')
+    models.InstrumentBalance.objects.filter(instrument=instrument,
+                                            user__in=makers).update(amount=1)
+    models.FiatBalance.objects.filter(
+        user=taker,
+        currency__title=models.TRADING_CURRENCY).update(amount=depth)
+    models.Order.objects.bulk_create([
+        models.Order(user=maker,
+                     instrument=instrument,
+                     type=models.OrderType.SELL.value,
+                     price=1,
+                     total_sum=1,
+                     remaining_sum=1,
+                     expires_in=timedelta(days=1).total_seconds())
+        for maker in makers
+    ])
+    order = models.Order(user=taker,
+                         instrument=instrument,
+                         type=models.OrderType.BUY.value,
+                         price=1,
+                         total_sum=depth,
+                         remaining_sum=depth,
+                         expires_in=timedelta(days=1).total_seconds())
+    order_books.discard(instrument.id)
+    if engine == models.OrderBookEngine.MEMORY.value:
+        # book loading is a one time cost, it is not part of the sweep
+        order_books.get(instrument.id, models.Order.load_order_book)
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        models.Order.place_order(order, engine=engine)
+        elapsed = time.perf_counter() - started
+    if order.status != models.OrderStatus.COMPLETED.value:
+        raise AssertionError(f'Sweep of depth {depth} was not filled')
+    order_books.discard(instrument.id)
+    return len(queries), elapsed
+
+
+def run_sweep_benchmark(depths, repeat=3, engine=None) -> [dict]:
+    """
+    Measures how statement count and latency of a single placement grow
+    with the number of resting orders it crosses. Everything created by
+    the benchmark is rolled back.
+    :param depths: numbers of crossed orders
+    :param repeat: runs per depth, median latency is reported
+    :param engine: matching engine, ORDER_BOOK_ENGINE setting by default
+    """
+    results = []
+    try:
+        with transaction.atomic():
+            for depth in depths:
+                runs = [_measure_sweep(depth, engine) for _ in range(repeat)]
+                results.append({
+                    'depth':
+                    depth,
+                    'statements':
+                    runs[-1][0],
+                    'median_ms':
+                    statistics.median(r[1] for r in runs) * 1000,
+                })
+            raise Rollback
+    except Rollback:
+        pass
+    return results
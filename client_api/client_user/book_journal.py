@@ -0,0 +1,198 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from enum import Enum
+
+import redis as _redis
+from django.conf import settings
+
+from client_user.orderbook import OrderBook
+
+SNAPSHOT_KEY = 'orderbook:snapshot:{}'
+LOG_KEY = 'orderbook:log:{}'
+
+
+class JournalMode(Enum):
+    OFF = 'off'
+    FILE = 'file'
+    REDIS = 'redis'
+
+
+class BookJournal(ABC):
+    """
+    Keeps snapshot of every in-memory book and log of events applied to
+    it since the snapshot, so a book is recovered in O(recent events)
+    instead of being loaded from all active orders.
+    Events are numbered by `OrderBook.seq`, events already contained in
+    the snapshot are skipped on replay and a gap makes recovery fail.
+    """
+
+    def __init__(self, snapshot_every=None):
+        self.snapshot_every = snapshot_every or getattr(
+            settings, 'ORDER_BOOK_SNAPSHOT_EVERY', 1000)
+        self._snapshot_seqs = {}
+
+    @abstractmethod
+    def append(self, instrument_id, events: [list]):
+        pass
+
+    @abstractmethod
+    def write_snapshot(self, instrument_id, snapshot: bytes):
+        """
+        Replaces snapshot and drops the log it covers
+        """
+
+    @abstractmethod
+    def read(self, instrument_id) -> (bytes, [list]):
+        """
+        Returns snapshot, None if there is none, and logged events
+        """
+
+    @abstractmethod
+    def reset(self, instrument_id):
+        pass
+
+    def save_snapshot(self, book: OrderBook):
+        self.write_snapshot(book.instrument_id, book.snapshot())
+        self._snapshot_seqs[book.instrument_id] = book.seq
+
+    def record(self, book: OrderBook, events: [list]):
+        """
+        Logs events that were just applied to the book, book is snapshotted
+        once enough events were logged
+        """
+        if not events:
+            return
+        first_seq = book.seq - len(events) + 1
+        self.append(book.instrument_id,
+                    [[first_seq + i, event] for i, event in enumerate(events)])
+        snapshot_seq = self._snapshot_seqs.get(book.instrument_id, 0)
+        if book.seq - snapshot_seq >= self.snapshot_every:
+            self.save_snapshot(book)
+
+    def recover(self, instrument_id) -> OrderBook:
+        """
+        Restores book from snapshot and log, None when it can not be done
+        """
+        snapshot, log = self.read(instrument_id)
+        if snapshot is None:
+            return None
+        book = OrderBook.restore(instrument_id, snapshot)
+        self._snapshot_seqs[instrument_id] = book.seq
+        for seq, event in log:
+            if seq <= book.seq:
+                continue
+            if seq != book.seq + 1:
+                return None
+            book.apply(event)
+        return book
+
+
+class FileBookJournal(BookJournal):
+    """
+    Snapshot and JSON lines log per instrument in a local directory
+    """
+
+    def __init__(self, path=None, snapshot_every=None):
+        super().__init__(snapshot_every)
+        self.path = path or settings.ORDER_BOOK_JOURNAL_PATH
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, instrument_id, extension):
+        return os.path.join(self.path, f'{instrument_id}.{extension}')
+
+    def append(self, instrument_id, events: [list]):
+        with open(self._file(instrument_id, 'log'), 'a') as log:
+            log.write(''.join(json.dumps(event) + '\n' for event in events))
+
+    def write_snapshot(self, instrument_id, snapshot: bytes):
+        path = self._file(instrument_id, 'snapshot')
+        with open(path + '.tmp', 'wb') as file:
+            file.write(snapshot)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+        # log left over by a crash right here is skipped by its seq
+        open(self._file(instrument_id, 'log'), 'w').close()
+
+    def read(self, instrument_id) -> (bytes, [list]):
+        try:
+            with open(self._file(instrument_id, 'snapshot'), 'rb') as file:
+                snapshot = file.read()
+        except FileNotFoundError:
+            return None, []
+        events = []
+        try:
+            with open(self._file(instrument_id, 'log')) as log:
+                for line in log:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # line torn by a crash in the middle of a write
+                        break
+        except FileNotFoundError:
+            pass
+        return snapshot, events
+
+    def reset(self, instrument_id):
+        for extension in ('snapshot', 'log'):
+            try:
+                os.remove(self._file(instrument_id, extension))
+            except FileNotFoundError:
+                pass
+        self._snapshot_seqs.pop(instrument_id, None)
+
+
+class RedisBookJournal(BookJournal):
+    """
+    Snapshot is a redis key, log is a redis list, snapshot replaces the
+    log in one MULTI block
+    """
+
+    def __init__(self, connection=None, snapshot_every=None):
+        super().__init__(snapshot_every)
+        self.redis = connection or _redis.Redis(host=settings.REDIS_HOST,
+                                                port=settings.REDIS_PORT,
+                                                db=settings.REDIS_DB)
+
+    def append(self, instrument_id, events: [list]):
+        self.redis.rpush(LOG_KEY.format(instrument_id),
+                         *[json.dumps(event) for event in events])
+
+    def write_snapshot(self, instrument_id, snapshot: bytes):
+        pipe = self.redis.pipeline()
+        pipe.set(SNAPSHOT_KEY.format(instrument_id), snapshot)
+        pipe.delete(LOG_KEY.format(instrument_id))
+        pipe.execute()
+
+    def read(self, instrument_id) -> (bytes, [list]):
+        pipe = self.redis.pipeline()
+        pipe.get(SNAPSHOT_KEY.format(instrument_id))
+        pipe.lrange(LOG_KEY.format(instrument_id), 0, -1)
+        snapshot, log = pipe.execute()
+        return snapshot, [json.loads(event) for event in log]
+
+    def reset(self, instrument_id):
+        self.redis.delete(SNAPSHOT_KEY.format(instrument_id),
+                          LOG_KEY.format(instrument_id))
+        self._snapshot_seqs.pop(instrument_id, None)
+
+
+_journals = {}
+
+
+def get_journal() -> BookJournal:
+    """
+    Returns journal chosen by ORDER_BOOK_JOURNAL setting, None when disabled
+    """
+    mode = getattr(settings, 'ORDER_BOOK_JOURNAL', JournalMode.OFF.value)
+    if mode == JournalMode.OFF.value:
+        return None
+    if mode not in _journals:
+        if mode == JournalMode.FILE.value:
+            _journals[mode] = FileBookJournal()
+        elif mode == JournalMode.REDIS.value:
+            _journals[mode] = RedisBookJournal()
+        else:
+            raise ValueError(f'Unknown order book journal mode {mode}')
+    return _journals[mode]
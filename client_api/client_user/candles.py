@@ -0,0 +1,64 @@
+from collections import namedtuple
+from datetime import datetime
+from enum import Enum
+
+from django.utils import timezone
+
+
+class CandleResolution(Enum):
+    MINUTE = '1m'
+    FIVE_MINUTES = '5m'
+    HOUR = '1h'
+    DAY = '1d'
+
+
+# finest first, every resolution is rolled up from the previous one
+RESOLUTION_SECONDS = {
+    CandleResolution.MINUTE.value: 60,
+    CandleResolution.FIVE_MINUTES.value: 5 * 60,
+    CandleResolution.HOUR.value: 60 * 60,
+    CandleResolution.DAY.value: 24 * 60 * 60,
+}
+
+Bar = namedtuple('Bar', 'start open high low close volume')
+
+
+def bucket_start(moment: datetime, resolution: str) -> datetime:
+    """
+    Start of the bar of `resolution` containing moment, bars are aligned
+    to the epoch, so days start at UTC midnight
+    """
+    seconds = RESOLUTION_SECONDS[resolution]
+    timestamp = int(moment.timestamp()) // seconds * seconds
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def roll_up(bars: [Bar], resolution: str) -> [Bar]:
+    """
+    Merges bars ordered by time into bars of a coarser resolution
+    """
+    result = []
+    for bar in bars:
+        start = bucket_start(bar.start, resolution)
+        if result and result[-1].start == start:
+            last = result[-1]
+            result[-1] = Bar(start, last.open, max(last.high, bar.high),
+                             min(last.low, bar.low), bar.close,
+                             last.volume + bar.volume)
+        else:
+            result.append(bar._replace(start=start))
+    return result
+
+
+def trade_bars(trades) -> {str: [Bar]}:
+    """
+    Bars of every resolution made of fills ordered by time, given as
+    (created_at_dt, price, quantity)
+    """
+    # only rolled up bars are kept in memory, not fills themselves
+    bars = (Bar(created_at_dt, price, price, price, price, quantity)
+            for created_at_dt, price, quantity in trades)
+    result = {}
+    for resolution in RESOLUTION_SECONDS:
+        bars = result[resolution] = roll_up(bars, resolution)
+    return result
@@ -0,0 +1,65 @@
+from decimal import Decimal
+
+# every price, amount and balance column has 8 decimal places, so any
+# stored value is an exact integer number of units
+SCALE = 10**8
+PLACES = 8
+
+
+def to_units(value) -> int:
+    """
+    Decimal or int to integer units, digits beyond 8 places are dropped
+    """
+    return int(Decimal(value).scaleb(PLACES))
+
+
+def from_units(units: int) -> Decimal:
+    return Decimal(units).scaleb(-PLACES)
+
+
+def multiply(amount: int, price: int) -> int:
+    """
+    Cost of amount at price in units, rounded half to even just like
+    DecimalField rounds on save. It is exact for amounts and prices on
+    the grid of their instrument.
+    """
+    units, remainder = divmod(amount * price, SCALE)
+    if remainder * 2 > SCALE or (remainder * 2 == SCALE and units % 2):
+        units += 1
+    return units
+
+
+class BalanceChange:
+    """
+    Pending change of a balance as integer units
+    """
+    __slots__ = ('amount', 'reserved')
+
+    def __init__(self):
+        self.amount = 0
+        self.reserved = 0
+
+    def __bool__(self):
+        return bool(self.amount or self.reserved)
+
+    def clear(self):
+        self.amount = 0
+        self.reserved = 0
+
+
+class OrderUnits:
+    """
+    Price, remaining and held sums of an order as integer units while
+    matching changes it
+    """
+    __slots__ = ('order', 'price', 'remaining', 'held')
+
+    def __init__(self, order):
+        self.order = order
+        self.price = to_units(order.price)
+        self.remaining = to_units(order.remaining_sum)
+        self.held = to_units(order.held_sum)
+
+    def sync(self):
+        self.order.remaining_sum = from_units(self.remaining)
+        self.order.held_sum = from_units(self.held)
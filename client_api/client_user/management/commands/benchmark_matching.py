@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from client_user import models
+from client_user.benchmarks.flow import (DISTRIBUTIONS, DRIVERS, FlowConfig,
+                                         run_flow_benchmark)
+
+
+class Command(BaseCommand):
+    help = ('Replays a synthetic order flow through place_order and the '
+            'order endpoint, reports throughput, latency and SQL statements')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--depth', type=int, default=100)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--buy-ratio', type=float, default=0.5)
+        parser.add_argument('--price-mid', type=float, default=100)
+        parser.add_argument('--price-spread', type=float, default=5)
+        parser.add_argument('--distribution',
+                            choices=DISTRIBUTIONS,
+                            default='normal')
+        parser.add_argument('--max-amount', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--driver',
+                            nargs='+',
+                            choices=DRIVERS,
+                            default=list(DRIVERS))
+        parser.add_argument(
+            '--engine', choices=[tag.value for tag in models.OrderBookEngine])
+        parser.add_argument('--output', help='file to save JSON report to')
+
+    def handle(self, *args, **options):
+        config = FlowConfig(orders=options['orders'],
+                            depth=options['depth'],
+                            users=options['users'],
+                            buy_ratio=options['buy_ratio'],
+                            price_mid=options['price_mid'],
+                            price_spread=options['price_spread'],
+                            distribution=options['distribution'],
+                            max_amount=options['max_amount'],
+                            seed=options['seed'])
+        report = run_flow_benchmark(config,
+                                    drivers=options['driver'],
+                                    engine=options['engine'])
+        self.stdout.write(f'{"driver":>8} {"orders/s":>10} {"p50 ms":>8} '
+                          f'{"p99 ms":>8} {"stmts/order":>12}')
+        for driver, row in report['results'].items():
+            self.stdout.write(f'{driver:>8} {row["orders_per_sec"]:>10.1f} '
+                              f'{row["p50_ms"]:>8.2f} {row["p99_ms"]:>8.2f} '
+                              f'{row["statements_per_order"]:>12.2f}')
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f'Report saved to {options["output"]}')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from client_user import models
+from client_user.benchmarks.sweep import run_sweep_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Shows how SQL statement count and latency of one placement grow '
+            'with the number of resting orders it sweeps')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth',
+                            nargs='+',
+                            type=int,
+                            default=[1, 10, 50, 100])
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument(
+            '--engine', choices=[tag.value for tag in models.OrderBookEngine])
+
+    def handle(self, *args, **options):
+        results = run_sweep_benchmark(options['depth'],
+                                      repeat=options['repeat'],
+                                      engine=options['engine'])
+        self.stdout.write(f'{"depth":>8} {"statements":>12} {"median ms":>12}')
+        for row in results:
+            self.stdout.write(f'{row["depth"]:>8} {row["statements"]:>12} '
+                              f'{row["median_ms"]:>12.2f}')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from client_user import models
+from client_user.sequencer import RedisSequencer
+
+
+class Command(BaseCommand):
+    help = ('Shows which matching shard owns every instrument, given shards '
+            'replace the shard map and running workers rebalance to it')
+
+    def add_arguments(self, parser):
+        parser.add_argument('shards', nargs='*')
+
+    def handle(self, *args, **options):
+        sequencer = RedisSequencer()
+        if options['shards']:
+            sequencer.set_shards(options['shards'])
+        shard_map = sequencer.shard_map()
+        if not len(shard_map):
+            self.stdout.write('Shard map has no shards')
+            return
+        instrument_ids = models.Instrument.objects.order_by('id').values_list(
+            'id', flat=True)
+        for shard, owned in shard_map.assignment(instrument_ids).items():
+            self.stdout.write(f'{shard}: {owned}')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from client_user import models
+
+
+class Command(BaseCommand):
+    help = ('Recomputes OHLCV candles of instruments from their trades, '
+            'instruments should not be traded meanwhile')
+
+    def add_arguments(self, parser):
+        parser.add_argument('instrument_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        written = models.Candle.rebuild(options['instrument_ids'] or None)
+        self.stdout.write(f'Wrote {written} candles')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from client_user import models
+
+
+class Command(BaseCommand):
+    help = ('Recomputes running order totals of instruments from orders and '
+            'reports instruments whose totals were off')
+
+    def add_arguments(self, parser):
+        parser.add_argument('instrument_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        fixed = models.OrderTotals.rebuild(options['instrument_ids'] or None)
+        if fixed:
+            self.stdout.write(f'Fixed totals of instruments {fixed}')
+        else:
+            self.stdout.write('Totals match orders')
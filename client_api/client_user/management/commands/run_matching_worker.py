@@ -0,0 +1,31 @@
+import socket
+
+from django.core.management.base import BaseCommand, CommandError
+
+from client_user.sequencer import RedisSequencer
+
+
+class Command(BaseCommand):
+    help = ('Consumes order commands of given instruments, or of instruments '
+            'the shard map assigns to --shard, from redis streams')
+
+    def add_arguments(self, parser):
+        parser.add_argument('instrument_ids', nargs='*', type=int)
+        parser.add_argument('--shard')
+        parser.add_argument('--consumer')
+
+    def handle(self, *args, **options):
+        if bool(options['instrument_ids']) == bool(options['shard']):
+            raise CommandError('Give either instrument ids or --shard')
+        if options['shard']:
+            consumer = options['consumer'] or options['shard']
+            self.stdout.write(
+                f'Matching shard {options["shard"]} as {consumer}')
+            RedisSequencer().run_shard_worker(options['shard'],
+                                              consumer=consumer)
+            return
+        consumer = options['consumer'] or socket.gethostname()
+        self.stdout.write(
+            f'Matching instruments {options["instrument_ids"]} as {consumer}')
+        RedisSequencer().run_worker(options['instrument_ids'],
+                                    consumer=consumer)
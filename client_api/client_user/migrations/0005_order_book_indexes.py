@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0004_auto_20190428_1851'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'active'),
+                                                  ('type', 'sell')),
+                               fields=['instrument', 'price', 'created_at_dt'],
+                               name='order_book_sell_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(
+                condition=models.Q(('status', 'active'), ('type', 'buy')),
+                fields=['instrument', '-price', 'created_at_dt'],
+                name='order_book_buy_idx'),
+        ),
+    ]
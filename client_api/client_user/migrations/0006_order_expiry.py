@@ -0,0 +1,46 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:08
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def fill_expires_at_dt(apps, schema_editor):
+    Order = apps.get_model('client_user', 'Order')
+    orders = Order.objects.filter(status='active', expires_at_dt__isnull=True)
+    for order in orders.iterator():
+        order.expires_at_dt = order.created_at_dt + timedelta(
+            seconds=order.expires_in)
+        order.save(update_fields=['expires_at_dt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0005_order_book_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='expires_at_dt',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('ACTIVE', 'active'),
+                                            ('COMPLETED', 'completed'),
+                                            ('DELETED', 'deleted'),
+                                            ('EXPIRED', 'expired')],
+                                   default='active',
+                                   max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(status='active'),
+                               fields=['expires_at_dt'],
+                               name='order_expiry_idx'),
+        ),
+        migrations.RunPython(fill_expires_at_dt, migrations.RunPython.noop),
+    ]
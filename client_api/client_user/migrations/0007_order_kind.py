@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0006_order_expiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='kind',
+            field=models.CharField(choices=[('LIMIT', 'limit'),
+                                            ('MARKET', 'market'),
+                                            ('IOC', 'ioc'), ('FOK', 'fok')],
+                                   default='limit',
+                                   max_length=15),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('ACTIVE', 'active'),
+                                            ('COMPLETED', 'completed'),
+                                            ('DELETED', 'deleted'),
+                                            ('EXPIRED', 'expired'),
+                                            ('CANCELLED', 'cancelled')],
+                                   default='active',
+                                   max_length=30),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0007_order_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='emulation_uuid',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0008_order_emulation_uuid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fiatbalance',
+            name='reserved',
+            field=models.DecimalField(decimal_places=8,
+                                      default=0,
+                                      max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='instrumentbalance',
+            name='reserved',
+            field=models.DecimalField(decimal_places=8,
+                                      default=0,
+                                      max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='held_sum',
+            field=models.DecimalField(decimal_places=8,
+                                      default=0,
+                                      max_digits=20),
+        ),
+    ]
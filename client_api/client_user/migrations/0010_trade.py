@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0009_fund_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trade',
+            fields=[
+                ('id',
+                 models.AutoField(auto_created=True,
+                                  primary_key=True,
+                                  serialize=False,
+                                  verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=8,
+                                              max_digits=20)),
+                ('quantity',
+                 models.DecimalField(decimal_places=8, max_digits=20)),
+                ('created_at_dt', models.DateTimeField(auto_now_add=True)),
+                ('instrument',
+                 models.ForeignKey(on_delete=django.db.models.deletion.PROTECT,
+                                   to='client_user.Instrument')),
+                ('maker',
+                 models.ForeignKey(on_delete=django.db.models.deletion.PROTECT,
+                                   related_name='maker_trades',
+                                   to='client_user.Order')),
+                ('taker',
+                 models.ForeignKey(on_delete=django.db.models.deletion.PROTECT,
+                                   related_name='taker_trades',
+                                   to='client_user.Order')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['instrument', 'created_at_dt'],
+                               name='trade_instrument_time_idx'),
+        ),
+    ]
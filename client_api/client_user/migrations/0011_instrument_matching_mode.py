@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0010_trade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instrument',
+            name='matching_mode',
+            field=models.CharField(choices=[('CONTINUOUS', 'continuous'),
+                                            ('AUCTION', 'auction')],
+                                   default='continuous',
+                                   max_length=15),
+        ),
+    ]
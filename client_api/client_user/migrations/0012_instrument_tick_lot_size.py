@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:26
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0011_instrument_matching_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instrument',
+            name='lot_size',
+            field=models.DecimalField(decimal_places=8,
+                                      default=Decimal('0.0001'),
+                                      max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='instrument',
+            name='tick_size',
+            field=models.DecimalField(decimal_places=8,
+                                      default=Decimal('0.0001'),
+                                      max_digits=20),
+        ),
+    ]
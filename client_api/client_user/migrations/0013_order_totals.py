@@ -0,0 +1,56 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_order_totals(apps, schema_editor):
+    Instrument = apps.get_model('client_user', 'Instrument')
+    Order = apps.get_model('client_user', 'Order')
+    OrderTotals = apps.get_model('client_user', 'OrderTotals')
+    sums = {
+        row['instrument_id']: row
+        for row in Order.objects.exclude(status='cancelled').order_by().values(
+            'instrument_id').annotate(volume=models.Sum('total_sum'),
+                                      price_volume=models.Sum(
+                                          models.F('price') *
+                                          models.F('total_sum')))
+    }
+    OrderTotals.objects.bulk_create([
+        OrderTotals(
+            instrument_id=instrument_id,
+            volume=sums.get(instrument_id, {}).get('volume') or 0,
+            price_volume=sums.get(instrument_id, {}).get('price_volume') or 0)
+        for instrument_id in Instrument.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0012_instrument_tick_lot_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderTotals',
+            fields=[
+                ('instrument',
+                 models.OneToOneField(
+                     on_delete=django.db.models.deletion.CASCADE,
+                     primary_key=True,
+                     related_name='order_totals',
+                     serialize=False,
+                     to='client_user.Instrument')),
+                ('volume',
+                 models.DecimalField(decimal_places=8,
+                                     default=0,
+                                     max_digits=30)),
+                ('price_volume',
+                 models.DecimalField(decimal_places=16,
+                                     default=0,
+                                     max_digits=40)),
+            ],
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
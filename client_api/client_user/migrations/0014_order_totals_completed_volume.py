@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+def fill_completed_volume(apps, schema_editor):
+    Order = apps.get_model('client_user', 'Order')
+    OrderTotals = apps.get_model('client_user', 'OrderTotals')
+    completed = Order.objects.filter(
+        status='completed').order_by().values('instrument_id').annotate(
+            volume=models.Sum('total_sum'))
+    for row in completed:
+        OrderTotals.objects.filter(instrument_id=row['instrument_id']).update(
+            completed_volume=row['volume'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0013_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordertotals',
+            name='completed_volume',
+            field=models.DecimalField(decimal_places=8,
+                                      default=0,
+                                      max_digits=30),
+        ),
+        migrations.RunPython(fill_completed_volume, migrations.RunPython.noop),
+    ]
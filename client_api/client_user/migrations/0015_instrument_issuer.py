@@ -0,0 +1,42 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_issuer(apps, schema_editor):
+    """
+    Issuer used to be the newest user with "bank" in email who has balance
+    of the instrument
+    """
+    Instrument = apps.get_model('client_user', 'Instrument')
+    InstrumentBalance = apps.get_model('client_user', 'InstrumentBalance')
+    for instrument in Instrument.objects.filter(issuer__isnull=True):
+        balance = InstrumentBalance.objects.filter(
+            user__email__contains='bank',
+            instrument=instrument).order_by('user__created_at_dt').last()
+        if balance is not None:
+            instrument.issuer_id = balance.user_id
+            instrument.save(update_fields=['issuer'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0014_order_totals_completed_volume'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instrument',
+            name='issuer',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='issued_instruments',
+                to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_issuer, migrations.RunPython.noop),
+    ]
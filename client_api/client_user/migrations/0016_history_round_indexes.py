@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0015_instrument_issuer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='liquidityhistory',
+            index=models.Index(fields=['uuid', 'instrument', 'created_at_dt'],
+                               name='liquidity_history_round_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderpricehistory',
+            index=models.Index(fields=['uuid', 'instrument', 'created_at_dt'],
+                               name='price_history_round_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='placedassetshistory',
+            index=models.Index(fields=['uuid', 'instrument', 'created_at_dt'],
+                               name='placed_history_round_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from client_user.candles import trade_bars
+
+
+def fill_candles(apps, schema_editor):
+    Instrument = apps.get_model('client_user', 'Instrument')
+    Trade = apps.get_model('client_user', 'Trade')
+    Candle = apps.get_model('client_user', 'Candle')
+    for instrument_id in Instrument.objects.values_list('id', flat=True):
+        trades = Trade.objects.filter(instrument_id=instrument_id).order_by(
+            'created_at_dt', 'id').values_list('created_at_dt', 'price',
+                                               'quantity').iterator()
+        Candle.objects.bulk_create([
+            Candle(instrument_id=instrument_id,
+                   resolution=resolution,
+                   start_dt=bar.start,
+                   open=bar.open,
+                   high=bar.high,
+                   low=bar.low,
+                   close=bar.close,
+                   volume=bar.volume)
+            for resolution, bars in trade_bars(trades).items() for bar in bars
+        ],
+                                   batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0016_history_round_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id',
+                 models.AutoField(auto_created=True,
+                                  primary_key=True,
+                                  serialize=False,
+                                  verbose_name='ID')),
+                ('resolution',
+                 models.CharField(choices=[('MINUTE', '1m'),
+                                           ('FIVE_MINUTES', '5m'),
+                                           ('HOUR', '1h'), ('DAY', '1d')],
+                                  max_length=15)),
+                ('start_dt', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('high', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('low', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('close', models.DecimalField(decimal_places=8,
+                                              max_digits=20)),
+                ('volume',
+                 models.DecimalField(decimal_places=8,
+                                     default=0,
+                                     max_digits=30)),
+                ('instrument',
+                 models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                   to='client_user.Instrument')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='candle',
+            constraint=models.UniqueConstraint(fields=('instrument',
+                                                       'resolution',
+                                                       'start_dt'),
+                                               name='candle_bar_uniq'),
+        ),
+        migrations.RunPython(fill_candles, migrations.RunPython.noop),
+    ]
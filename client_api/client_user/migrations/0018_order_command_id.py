@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_user', '0017_candles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='command_id',
+            field=models.CharField(blank=True,
+                                   max_length=32,
+                                   null=True,
+                                   unique=True),
+        ),
+    ]
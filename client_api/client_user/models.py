@@ -1,14 +1,25 @@
 import uuid
+from datetime import timedelta
+from decimal import Decimal
 from enum import Enum
+from functools import reduce
+from operator import or_
 
 import pyotp
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models, transaction
-from django.db.utils import DataError
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
 from django.utils import timezone
 
+from client_user import auction, book_journal
+from client_user.candles import CandleResolution, trade_bars
+from client_user.fixedpoint import (BalanceChange, OrderUnits, from_units,
+                                    multiply, to_units)
+from client_user.orderbook import BookEntry, OrderBook, order_books
+
 
 def generate_referral_code(length):
     d = uuid.uuid4()
@@ -123,19 +134,161 @@ class InstrumentBalance(models.Model):
     user = models.ForeignKey(ClientUser, on_delete=models.PROTECT)
     instrument = models.ForeignKey('Instrument', on_delete=models.PROTECT)
     amount = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    # held by active sell orders, part of amount
+    reserved = models.DecimalField(max_digits=20, decimal_places=8, default=0)
 
     def __str__(self):
         return f'{self.amount} {self.instrument}'
 
+    @property
+    def available(self):
+        return self.amount - self.reserved
+
 
 class FiatBalance(models.Model):
     user = models.ForeignKey(ClientUser, on_delete=models.PROTECT)
     currency = models.ForeignKey(Currency, on_delete=models.PROTECT)
     amount = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    # held by active buy orders, part of amount
+    reserved = models.DecimalField(max_digits=20, decimal_places=8, default=0)
 
     def __str__(self):
         return f'{self.amount} {self.currency}'
 
+    @property
+    def available(self):
+        return self.amount - self.reserved
+
+
+# orders are priced in the fiat balance of this currency only
+TRADING_CURRENCY = 'USD'
+
+
+class OrderRejected(ValueError):
+    pass
+
+
+class InsufficientFunds(OrderRejected):
+    pass
+
+
+class BalanceLedger:
+    """
+    Balance changes and orders touched by a single placement and trades it
+    made. Balances are neither read nor locked while matching, changes are
+    kept as integer units and applied by `save` with one conditional UPDATE
+    per balance model.
+    """
+
+    def __init__(self, instrument_id):
+        self.instrument_id = instrument_id
+        self._instrument_balances = {}
+        self._fiat_balances = {}
+        self._orders = {}
+        self.trades = []
+
+    def instrument_balance(self, user_id) -> BalanceChange:
+        balance = self._instrument_balances.get(user_id)
+        if balance is None:
+            balance = self._instrument_balances[user_id] = BalanceChange()
+        return balance
+
+    def fiat_balance(self, user_id) -> BalanceChange:
+        balance = self._fiat_balances.get(user_id)
+        if balance is None:
+            balance = self._fiat_balances[user_id] = BalanceChange()
+        return balance
+
+    def order(self, order: 'Order') -> OrderUnits:
+        # unsaved orders have no pk yet, so orders are told apart by identity
+        units = self._orders.get(id(order))
+        if units is None:
+            units = self._orders[id(order)] = OrderUnits(order)
+        return units
+
+    def order_balance(self, order: 'Order') -> BalanceChange:
+        """
+        Balance an order pays from: fiat for buy orders, instrument for sell
+        """
+        if order.type == OrderType.BUY.value:
+            return self.fiat_balance(order.user_id)
+        return self.instrument_balance(order.user_id)
+
+    def hold(self, order: 'Order'):
+        """
+        Reserves everything order may spend, so its trades can not fail
+        for lack of funds later on. Funds are checked by `save`.
+        """
+        units = self.order(order)
+        if order.type == OrderType.BUY.value:
+            required = multiply(units.remaining, units.price)
+        else:
+            required = units.remaining
+        self.order_balance(order).reserved += required
+        units.held += required
+
+    def release(self, order: 'Order'):
+        """
+        Returns what is still held by order to available funds
+        """
+        units = self.order(order)
+        if units.held:
+            self.order_balance(order).reserved -= units.held
+            units.held = 0
+
+    def sync(self):
+        """
+        Writes order units back to model instances, nothing is saved
+        """
+        for units in self._orders.values():
+            units.sync()
+
+    def save(self):
+        """
+        Applies pending changes. A balance left with less than it holds
+        does not match the condition of its UPDATE, so fewer updated rows
+        than changed balances means insufficient funds and nothing is
+        changed by the caller's transaction.
+        """
+        self.sync()
+        for model, balances, error in (
+            (InstrumentBalance, self._instrument_balances,
+             'Not enough instrument balance'),
+            (FiatBalance, self._fiat_balances, 'Not enough fiat balance'),
+        ):
+            changes = {
+                user_id: change
+                for user_id, change in balances.items() if change
+            }
+            if not changes:
+                continue
+            amount = self._by_user(changes, 'amount')
+            reserved = self._by_user(changes, 'reserved')
+            rows = model.objects.filter(user_id__in=changes)
+            if model is InstrumentBalance:
+                rows = rows.filter(instrument_id=self.instrument_id)
+            else:
+                rows = rows.filter(currency__title=TRADING_CURRENCY)
+            updated = rows.filter(amount__gte=models.F('reserved') + reserved -
+                                  amount).update(
+                                      amount=models.F('amount') + amount,
+                                      reserved=models.F('reserved') + reserved)
+            if updated < len(changes):
+                raise InsufficientFunds(error)
+            for change in changes.values():
+                change.clear()
+
+    @staticmethod
+    def _by_user(changes: {int: BalanceChange}, field) -> models.Case:
+        return models.Case(*[
+            models.When(user_id=user_id,
+                        then=models.Value(from_units(getattr(change, field))))
+            for user_id, change in changes.items()
+        ],
+                           default=models.Value(0),
+                           output_field=models.DecimalField(max_digits=20,
+                                                            decimal_places=8))
+
 
 class InstrumentStatus(Enum):
     ACTIVE = 'active'
@@ -143,6 +296,17 @@ class InstrumentStatus(Enum):
     DELETED = 'deleted'
 
 
+class MatchingMode(Enum):
+    # every order is matched as soon as it is placed
+    CONTINUOUS = 'continuous'
+    # orders are collected and cleared at one price by `Order.clear_auction`
+    AUCTION = 'auction'
+
+
+DEFAULT_TICK_SIZE = Decimal('0.0001')
+DEFAULT_LOT_SIZE = Decimal('0.0001')
+
+
 class Instrument(models.Model):
     # TODO Create instrument balance for every user when instrument is created
     name = models.CharField(max_length=50)
@@ -150,6 +314,24 @@ class Instrument(models.Model):
                               choices=[(tag.name, tag.value)
                                        for tag in InstrumentStatus],
                               default=InstrumentStatus.ACTIVE.value)
+    # book has to be cleared before instrument goes back to continuous mode
+    matching_mode = models.CharField(max_length=15,
+                                     choices=[(tag.name, tag.value)
+                                              for tag in MatchingMode],
+                                     default=MatchingMode.CONTINUOUS.value)
+    # order prices are multiples of tick size, order amounts of lot size
+    tick_size = models.DecimalField(max_digits=20,
+                                    decimal_places=8,
+                                    default=DEFAULT_TICK_SIZE)
+    lot_size = models.DecimalField(max_digits=20,
+                                   decimal_places=8,
+                                   default=DEFAULT_LOT_SIZE)
+    # treasury account holding assets that are not placed yet
+    issuer = models.ForeignKey(ClientUser,
+                               on_delete=models.PROTECT,
+                               null=True,
+                               blank=True,
+                               related_name='issued_instruments')
     # these ones for underlying credit
     credit_created_at_d = models.DateField(null=True)
     credit_expires_at_d = models.DateField(null=True)
@@ -168,6 +350,7 @@ class Instrument(models.Model):
         if not self.pk:
             super().save(force_insert, force_update, using, update_fields)
             self.assign_balances(self.pk)
+            OrderTotals.objects.create(instrument=self)
         else:
             super().save(force_insert, force_update, using, update_fields)
 
@@ -181,6 +364,22 @@ class Instrument(models.Model):
                     'instrument_id': instrument_id
                 })
 
+    def check_order(self, order: 'Order'):
+        """
+        Rejects order that is not positive, priced off the tick grid or
+        sized off the lot grid. Negative amounts would hold negative funds
+        """
+        if order.total_sum <= 0:
+            raise OrderRejected('Amount should be positive')
+        if order.price <= 0:
+            raise OrderRejected('Price should be positive')
+        if to_units(order.price) % to_units(self.tick_size):
+            raise OrderRejected(
+                f'Price should be a multiple of tick size {self.tick_size}')
+        if to_units(order.total_sum) % to_units(self.lot_size):
+            raise OrderRejected(
+                f'Amount should be a multiple of lot size {self.lot_size}')
+
     def __str__(self):
         return self.name
 
@@ -194,6 +393,41 @@ class OrderStatus(Enum):
     ACTIVE = 'active'
     COMPLETED = 'completed'
     DELETED = 'deleted'
+    EXPIRED = 'expired'
+    CANCELLED = 'cancelled'
+
+
+class OrderKind(Enum):
+    # rests in the book until it is filled or expires
+    LIMIT = 'limit'
+    # sweeps the book up to the price of the worst order needed to fill it
+    MARKET = 'market'
+    # immediate or cancel, remainder is cancelled instead of resting
+    IOC = 'ioc'
+    # fill or kill, trades only when it can be filled completely
+    FOK = 'fok'
+
+
+DEPTH_CACHE_KEY = 'order_book_depth:{}'
+ISSUER_BALANCE_CACHE_KEY = 'issuer_balance:{}:{}'
+
+
+class OrderBookEngine(Enum):
+    DATABASE = 'database'
+    MEMORY = 'memory'
+
+
+class OrderQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Takes deleted orders out of running totals, admin deletes through
+        here as well
+        """
+        with transaction.atomic():
+            # locked first, so totals lose exactly the rows deleted below
+            list(self.select_for_update().values_list('id', flat=True))
+            OrderTotals.remove(self)
+            return super().delete()
 
 
 class Order(models.Model):
@@ -204,6 +438,10 @@ class Order(models.Model):
                               choices=[(tag.name, tag.value)
                                        for tag in OrderStatus],
                               default=OrderStatus.ACTIVE.value)
+    kind = models.CharField(max_length=15,
+                            choices=[(tag.name, tag.value)
+                                     for tag in OrderKind],
+                            default=OrderKind.LIMIT.value)
     price = models.DecimalField(max_digits=20, decimal_places=8)
     actual_price = models.DecimalField(max_digits=20,
                                        decimal_places=8,
@@ -219,13 +457,102 @@ class Order(models.Model):
     updated_at_dt = models.DateTimeField(auto_now=True)
     # num of seconds in which order expires
     expires_in = models.PositiveIntegerField()
+    expires_at_dt = models.DateTimeField(null=True)
     user = models.ForeignKey(ClientUser, on_delete=models.PROTECT)
+    # funds reserved for the unfilled part, fiat for buy orders and
+    # instrument for sell ones. Orders without holds are checked on trade
+    held_sum = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    emulation_uuid = models.UUIDField(null=True, blank=True, db_index=True)
+    # matching command that placed the order, so a redelivered command
+    # finds its order instead of placing it again
+    command_id = models.CharField(max_length=32,
+                                  null=True,
+                                  blank=True,
+                                  unique=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        # resting orders only, in the order the book is swept on each side
+        indexes = [
+            models.Index(fields=['instrument', 'price', 'created_at_dt'],
+                         name='order_book_sell_idx',
+                         condition=models.Q(status=OrderStatus.ACTIVE.value,
+                                            type=OrderType.SELL.value)),
+            models.Index(fields=['instrument', '-price', 'created_at_dt'],
+                         name='order_book_buy_idx',
+                         condition=models.Q(status=OrderStatus.ACTIVE.value,
+                                            type=OrderType.BUY.value)),
+            models.Index(fields=['expires_at_dt'],
+                         name='order_expiry_idx',
+                         condition=models.Q(status=OrderStatus.ACTIVE.value)),
+        ]
+
+    def save(self,
+             force_insert=False,
+             force_update=False,
+             using=None,
+             update_fields=None):
+        if self.expires_at_dt is None and self.expires_in is not None:
+            self.expires_at_dt = timezone.now() + timedelta(
+                seconds=self.expires_in)
+        status_saved = update_fields is None or 'status' in update_fields
+        if self._state.adding:
+            with transaction.atomic():
+                super().save(force_insert, force_update, using, update_fields)
+                OrderTotals.add(self.instrument_id, **self._totals())
+        elif status_saved and self._saved_status not in (None, self.status):
+            # order moved in or out of cancelled or completed ones
+            old, new = self._totals(status=self._saved_status), self._totals()
+            with transaction.atomic():
+                super().save(force_insert, force_update, using, update_fields)
+                OrderTotals.add(
+                    self.instrument_id, **{
+                        field: new.get(field, 0) - old.get(field, 0)
+                        for field in TOTALS_FIELDS
+                    })
+        else:
+            super().save(force_insert, force_update, using, update_fields)
+        if status_saved:
+            self._saved_status = self.status
+
+    def delete(self, using=None, keep_parents=False):
+        with transaction.atomic():
+            result = super().delete(using, keep_parents)
+            OrderTotals.add(self.instrument_id, **self._totals(-1))
+        return result
+
+    # status running totals were last changed for, None for new orders
+    _saved_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        order = super().from_db(db, field_names, values)
+        order._saved_status = dict(zip(field_names, values)).get('status')
+        return order
+
+    def _totals(self, sign=1, status=None) -> dict:
+        """
+        What the order adds to running totals of its instrument
+        :param status: own status by default
+        """
+        status = status or self.status
+        if status == OrderStatus.CANCELLED.value:
+            return {}
+        completed = status == OrderStatus.COMPLETED.value
+        return {
+            'volume': sign * self.total_sum,
+            'price_volume': sign * (self.price or 0) * self.total_sum,
+            'completed_volume': sign * self.total_sum if completed else 0,
+        }
 
     def __str__(self):
         return f'[{self.type}|{self.instrument}] @{self.price} ({self.remaining_sum}/{self.total_sum})'
 
     @classmethod
-    def _trade_orders(cls, first: 'Order', second: 'Order') -> (
+    def _trade_orders(
+        cls, first: 'Order', second: 'Order'
+    ) -> (
             'Order',
             'Order',
             InstrumentBalance,
@@ -234,137 +561,885 @@ class Order(models.Model):
             FiatBalance,
     ):
         """
-        Internal method that actually trades orders
+        Trades two orders on their own and applies balance changes right
+        away, orders are not saved
         """
-        # TODO Add fee
         with transaction.atomic():
-            trade_amount = min(first.remaining_sum, second.remaining_sum)
-            first_balance = InstrumentBalance.objects.select_for_update().get(
-                user=first.user, instrument=first.instrument)
-            second_balance = InstrumentBalance.objects.select_for_update().get(
-                user=second.user, instrument=first.instrument)
-            first_fiat_balance = FiatBalance.objects.select_for_update().get(
-                user=first.user)
-            second_fiat_balance = FiatBalance.objects.select_for_update().get(
-                user=second.user)
-            if not first_balance:
-                raise ValueError(
-                    f'Balance for user {first.user} in instrument not found')
-            if not second_balance:
-                raise ValueError(
-                    f'Balance for user {second.user} in instrument not found')
-            if first.type == OrderType.BUY.value and first_fiat_balance.amount < trade_amount * second.price:
-                raise ValueError(
-                    f'Not enough funds for {first_fiat_balance.user}')
-            if first.type == OrderType.SELL.value and second_fiat_balance.amount < trade_amount * second.price:
-                raise ValueError(
-                    f'Not enough funds for {second_fiat_balance.user}')
-            if first.type == OrderType.BUY.value and second_balance.amount < trade_amount:
-                raise ValueError(
-                    f'Not enough instrument balance for {second_balance.user}')
-            if first.type == OrderType.SELL.value and first_balance.amount < trade_amount:
-                raise ValueError(
-                    f'Not enough instrument balance for {first_balance.user}')
-            first.remaining_sum -= trade_amount
-            second.remaining_sum -= trade_amount
-            if first.type == OrderType.BUY.value:
-                first_balance.amount += trade_amount
-                second_balance.amount -= trade_amount
-                first_fiat_balance.amount -= trade_amount * second.price
-                second_fiat_balance.amount += trade_amount * second.price
-            else:
-                first_balance.amount -= trade_amount
-                second_balance.amount += trade_amount
-                first_fiat_balance.amount += trade_amount * second.price
-                second_fiat_balance.amount -= trade_amount * second.price
-            if first.remaining_sum == 0:
-                first.status = OrderStatus.COMPLETED.value
-                first.actual_price = second.price
-            if second.remaining_sum == 0:
-                second.status = OrderStatus.COMPLETED.value
-                second.actual_price = second.price
-            return first, second, first_balance, second_balance, first_fiat_balance, second_fiat_balance
+            ledger = BalanceLedger(first.instrument_id)
+            cls._trade(first, second, ledger)
+            ledger.save()
+        user_ids = [first.user_id, second.user_id]
+        instrument_balances = {
+            balance.user_id: balance
+            for balance in InstrumentBalance.objects.filter(
+                instrument_id=first.instrument_id, user_id__in=user_ids)
+        }
+        fiat_balances = {
+            balance.user_id: balance
+            for balance in FiatBalance.objects.filter(
+                user_id__in=user_ids, currency__title=TRADING_CURRENCY)
+        }
+        return (first, second, instrument_balances[first.user_id],
+                instrument_balances[second.user_id],
+                fiat_balances[first.user_id], fiat_balances[second.user_id])
+
+    @classmethod
+    def _trade(cls,
+               first: 'Order',
+               second: 'Order',
+               ledger: 'BalanceLedger',
+               price: int = None) -> ('Order', 'Order'):
+        """
+        Internal method that actually trades orders.
+        Arithmetic is done on integer units kept by the ledger, orders are
+        changed in memory only and funds are checked once the ledger is
+        saved, caller is responsible for the transaction and for saving.
+        :param price: execution price in units, price of the second order
+        by default
+        """
+        first_units, second_units = ledger.order(first), ledger.order(second)
+        if price is None:
+            price = second_units.price
+        # TODO Add fee
+        trade_amount = min(first_units.remaining, second_units.remaining)
+        first_balance = ledger.instrument_balance(first.user_id)
+        second_balance = ledger.instrument_balance(second.user_id)
+        first_fiat_balance = ledger.fiat_balance(first.user_id)
+        second_fiat_balance = ledger.fiat_balance(second.user_id)
+        cost = multiply(trade_amount, price)
+        first_units.remaining -= trade_amount
+        second_units.remaining -= trade_amount
+        ledger.trades.append(
+            Trade(instrument_id=first.instrument_id,
+                  maker=second,
+                  taker=first,
+                  price=from_units(price),
+                  quantity=from_units(trade_amount)))
+        if first.type == OrderType.BUY.value:
+            first_balance.amount += trade_amount
+            second_balance.amount -= trade_amount
+            first_fiat_balance.amount -= cost
+            second_fiat_balance.amount += cost
+            # buyer held its own limit price, the difference is released
+            cls._consume_hold(first_units, first_fiat_balance,
+                              multiply(trade_amount, first_units.price))
+            cls._consume_hold(second_units, second_balance, trade_amount)
+        else:
+            first_balance.amount -= trade_amount
+            second_balance.amount += trade_amount
+            first_fiat_balance.amount += cost
+            second_fiat_balance.amount -= cost
+            cls._consume_hold(first_units, first_balance, trade_amount)
+            cls._consume_hold(second_units, second_fiat_balance,
+                              multiply(trade_amount, second_units.price))
+        if first_units.remaining == 0:
+            first.status = OrderStatus.COMPLETED.value
+            first.actual_price = from_units(price)
+        if second_units.remaining == 0:
+            second.status = OrderStatus.COMPLETED.value
+            second.actual_price = from_units(price)
+        return first, second
+
+    @staticmethod
+    def _consume_hold(order: OrderUnits, balance: BalanceChange, amount: int):
+        amount = min(amount, order.held)
+        balance.reserved -= amount
+        order.held -= amount
 
     @classmethod
-    def place_order(cls, order: 'Order') -> 'Order':
+    def place_order(cls, order: 'Order', engine: str = None) -> 'Order':
         """
         Places order into orderbook
+        :param order: unsaved order
+        :param engine: matching engine, ORDER_BOOK_ENGINE setting by default
+        """
+        order.instrument.check_order(order)
+        if order.instrument.matching_mode == MatchingMode.AUCTION.value:
+            if order.kind != OrderKind.LIMIT.value:
+                raise OrderRejected(
+                    'Only limit orders are accepted during call auction')
+            return cls._collect_order(order)
+        engine = engine or getattr(settings, 'ORDER_BOOK_ENGINE',
+                                   OrderBookEngine.DATABASE.value)
+        if engine == OrderBookEngine.MEMORY.value:
+            return cls._place_order_in_memory(order)
+        return cls._place_order_in_database(order)
+
+    @classmethod
+    def _collect_order(cls, order: 'Order') -> 'Order':
+        """
+        Holds funds of order and leaves it for the next auction
         """
-        counter_order_type = OrderType.SELL.value if order.type == OrderType.BUY.value else OrderType.BUY.value
-        counter_orders = None
         with transaction.atomic():
-            if counter_order_type == OrderType.SELL.value:
-                counter_orders = cls.objects.select_for_update().filter(
-                    type=counter_order_type,
-                    instrument=order.instrument,
-                    price__lte=order.price).order_by('price', 'created_at_dt')
-            elif counter_order_type == OrderType.BUY.value:
-                counter_orders = cls.objects.select_for_update().filter(
-                    type=counter_order_type,
-                    instrument=order.instrument,
-                    price__gte=order.price).order_by('-price', 'created_at_dt')
-            if not counter_orders:
-                # place order into the order book
-                order.save()
-                return order
+            ledger = BalanceLedger(order.instrument_id)
+            ledger.hold(order)
+            ledger.save()
+            order.save()
+            cls.invalidate_depth([order.instrument_id])
+        return order
+
+    @classmethod
+    def clear_auction(cls, instrument_id) -> (Decimal, Decimal):
+        """
+        Executes every crossing order of instrument at a single price that
+        maximizes traded volume. Orders are paired in price-time priority,
+        the older order of each pair is the maker. Everything is written
+        in one transaction with one bulk statement per table.
+        :return: clearing price and traded volume, (None, 0) if nothing traded
+        """
+        with transaction.atomic():
+            orders = list(cls.objects.select_for_update().filter(
+                instrument_id=instrument_id,
+                status=OrderStatus.ACTIVE.value,
+                remaining_sum__gt=0).order_by('created_at_dt', 'id'))
+            ledger = BalanceLedger(instrument_id)
+            bids = [
+                ledger.order(o) for o in orders
+                if o.type == OrderType.BUY.value
+            ]
+            asks = [
+                ledger.order(o) for o in orders
+                if o.type == OrderType.SELL.value
+            ]
+            price, volume = auction.clearing_price(
+                auction.as_array(u.price for u in bids),
+                auction.as_array(u.remaining for u in bids),
+                auction.as_array(u.price for u in asks),
+                auction.as_array(u.remaining for u in asks),
+                to_units(
+                    Instrument.objects.values_list(
+                        'tick_size', flat=True).get(pk=instrument_id)))
+            if not volume:
+                return None, 0
+            # sorts are stable, so time priority is kept within a price
+            bids = sorted((u for u in bids if u.price >= price),
+                          key=lambda u: -u.price)
+            asks = sorted((u for u in asks if u.price <= price),
+                          key=lambda u: u.price)
+            traded_orders, i, j = [], 0, 0
+            while i < len(bids) and j < len(asks):
+                bid, ask = bids[i].order, asks[j].order
+                if (bid.created_at_dt, bid.pk) < (ask.created_at_dt, ask.pk):
+                    cls._trade(ask, bid, ledger, price)
+                else:
+                    cls._trade(bid, ask, ledger, price)
+                if bids[i].remaining == 0:
+                    traded_orders.append(bid)
+                    i += 1
+                if asks[j].remaining == 0:
+                    traded_orders.append(ask)
+                    j += 1
+            # at most one order is left partially filled
+            traded_orders.extend(u.order
+                                 for u in bids[i:i + 1] + asks[j:j + 1])
+            cls._save_trades(traded_orders, ledger)
+        # orders were changed behind the back of the in-memory book
+        cls.discard_order_book(instrument_id)
+        return from_units(price), from_units(volume)
+
+    @classmethod
+    def _book_side(cls, order: 'Order', price=None) -> models.QuerySet:
+        """
+        Active counter orders of given order, best first
+        :param price: limit price, all counter orders if not given
+        """
+        if order.type == OrderType.BUY.value:
+            orders = cls.objects.filter(type=OrderType.SELL.value,
+                                        status=OrderStatus.ACTIVE.value,
+                                        instrument_id=order.instrument_id)
+            if price is not None:
+                orders = orders.filter(price__lte=price)
+            return orders.order_by('price', 'created_at_dt')
+        orders = cls.objects.filter(type=OrderType.BUY.value,
+                                    status=OrderStatus.ACTIVE.value,
+                                    instrument_id=order.instrument_id)
+        if price is not None:
+            orders = orders.filter(price__gte=price)
+        return orders.order_by('-price', 'created_at_dt')
+
+    @classmethod
+    def price_market_order(cls, order: 'Order'):
+        """
+        Returns price of the worst counter order a market order has to reach
+        to get filled, None when the counter side of the book is empty
+        """
+        price, remaining_sum = None, order.remaining_sum
+        counter_orders = cls._book_side(order).values_list(
+            'price', 'remaining_sum')
+        for price, counter_sum in counter_orders.iterator():
+            remaining_sum -= counter_sum
+            if remaining_sum <= 0:
+                break
+        return price
+
+    @classmethod
+    def _place_order_in_database(cls, order: 'Order') -> 'Order':
+        """
+        Matches order against counter orders locked in the database
+        """
+        with transaction.atomic():
+            counter_orders = cls._book_side(order,
+                                            order.price).select_for_update()
+            # only balances of orders the sweep reaches have to be locked
+            swept_orders, remaining_sum = [], order.remaining_sum
             for counter_order in counter_orders:
-                order, counter_order, *balances = cls._trade_orders(
-                    order, counter_order)
-                order.save()
-                counter_order.save()
-                for balance in balances:
-                    balance.save()
-                if order.status == OrderStatus.COMPLETED:
-                    return order
+                if remaining_sum <= 0:
+                    break
+                swept_orders.append(counter_order)
+                remaining_sum -= counter_order.remaining_sum
+            # depth is checked on locked orders, so no fill can take it away
+            if order.kind == OrderKind.FOK.value and remaining_sum > 0:
+                return cls._kill(order)
+            ledger = BalanceLedger(order.instrument_id)
+            ledger.hold(order)
+            traded_orders = []
+            for counter_order in swept_orders:
+                order, counter_order = cls._trade(order, counter_order, ledger)
+                traded_orders.append(counter_order)
+            cls._save_sweep(order, traded_orders, ledger)
         return order
 
+    @classmethod
+    def _place_order_in_memory(cls, order: 'Order') -> 'Order':
+        """
+        Matches order against in-memory order book of the instrument and
+        persists resulting trades afterwards. The book is changed only after
+        the trades were written, so a failed trade leaves it untouched.
+        """
+        book = order_books.get(order.instrument_id, cls.load_order_book)
+        with book.lock:
+            expired = book.expire(timezone.now())
+            if expired:
+                cls._journal_book(
+                    book,
+                    [book.remove_event(entry.order_id) for entry in expired])
+                cls._close_orders(
+                    cls.objects.filter(
+                        pk__in=[entry.order_id for entry in expired],
+                        status=OrderStatus.ACTIVE.value),
+                    OrderStatus.EXPIRED.value)
+            remaining = to_units(order.remaining_sum)
+            fills = book.match(order.type == OrderType.BUY.value,
+                               to_units(order.price), remaining)
+            if order.kind == OrderKind.FOK.value and sum(
+                    amount for _, amount in fills) < remaining:
+                return cls._kill(order)
+            with transaction.atomic():
+                counter_orders = cls.objects.select_for_update().filter(
+                    status=OrderStatus.ACTIVE.value).in_bulk(
+                        [entry.order_id for entry, _ in fills])
+                # orders cancelled behind the back of the book make it stale
+                stale = len(counter_orders) < len(fills)
+                if not stale:
+                    ledger = BalanceLedger(order.instrument_id)
+                    ledger.hold(order)
+                    traded_orders = []
+                    for entry, _ in fills:
+                        order, counter_order = cls._trade(
+                            order, counter_orders[entry.order_id], ledger)
+                        traded_orders.append(counter_order)
+                    cls._save_sweep(order, traded_orders, ledger)
+            if not stale:
+                events = [
+                    book.fill_event(entry.order_id, trade_amount)
+                    for entry, trade_amount in fills
+                ]
+                if order.status == OrderStatus.ACTIVE.value:
+                    events.append(book.add_event(order.to_book_entry()))
+                for event in events:
+                    book.apply(event)
+                cls._journal_book(book, events)
+        if stale:
+            cls.discard_order_book(order.instrument_id)
+            return cls._place_order_in_memory(order)
+        return order
+
+    @staticmethod
+    def _journal_book(book: OrderBook, events: [list]):
+        journal = book_journal.get_journal()
+        if journal is not None:
+            journal.record(book, events)
+
+    @classmethod
+    def discard_order_book(cls, instrument_id):
+        """
+        Drops in-memory book together with its journal, next placement
+        loads it from active orders
+        """
+        order_books.discard(instrument_id)
+        journal = book_journal.get_journal()
+        if journal is not None:
+            journal.reset(instrument_id)
+
+    @classmethod
+    def cancel_orders(cls, **filters) -> (int, [int]):
+        """
+        Cancels active orders matching filters with a single update and
+        drops order books of affected instruments, so they are reloaded
+        without the cancelled orders
+        :return: number of cancelled orders and ids of affected instruments
+        """
+        cancelled, instrument_ids = cls._close_orders(
+            cls.objects.filter(status=OrderStatus.ACTIVE.value, **filters),
+            OrderStatus.CANCELLED.value)
+        for instrument_id in instrument_ids:
+            cls.discard_order_book(instrument_id)
+        return cancelled, instrument_ids
+
+    @classmethod
+    def _close_orders(cls,
+                      orders: models.QuerySet,
+                      status: str,
+                      now=None) -> (int, [int]):
+        """
+        Moves active orders to final status and releases their holds with
+        one update per balance model, whatever the number of orders
+        :return: number of closed orders and ids of affected instruments
+        """
+        now = now or timezone.now()
+        with transaction.atomic():
+            # locked first, so none of them is filled while holds are summed
+            locked = list(orders.select_for_update().values_list(
+                'id', 'instrument_id'))
+            if not locked:
+                return 0, []
+            # every statement below sees the locked orders only, orders
+            # matching the filter committed meanwhile are left active
+            ids, instrument_ids = zip(*locked)
+            closing = cls.objects.filter(pk__in=ids)
+            if status == OrderStatus.CANCELLED.value:
+                OrderTotals.remove(closing)
+            held = closing.filter(held_sum__gt=0).order_by()
+            buys = held.filter(type=OrderType.BUY.value)
+            FiatBalance.objects.filter(
+                user_id__in=buys.values('user_id'),
+                currency__title=TRADING_CURRENCY).update(
+                    reserved=models.F('reserved') -
+                    cls._held_by(buys, 'user_id'))
+            sells = held.filter(type=OrderType.SELL.value)
+            InstrumentBalance.objects.filter(
+                user_id__in=sells.values('user_id'),
+                instrument_id__in=sells.values('instrument_id')).update(
+                    reserved=models.F('reserved') -
+                    cls._held_by(sells, 'user_id', 'instrument_id'))
+            closed = closing.update(status=status,
+                                    held_sum=0,
+                                    updated_at_dt=now)
+            instrument_ids = sorted(set(instrument_ids))
+            cls.invalidate_depth(instrument_ids)
+        return closed, instrument_ids
+
+    @staticmethod
+    def _held_by(orders: models.QuerySet, *fields) -> Coalesce:
+        """
+        Sum of holds of orders sharing given fields with the updated balance
+        """
+        orders = orders.filter(**{
+            field: models.OuterRef(field)
+            for field in fields
+        }).values(*fields).annotate(held=models.Sum('held_sum')).values('held')
+        return Coalesce(models.Subquery(orders), 0)
+
+    @classmethod
+    def _kill(cls, order: 'Order') -> 'Order':
+        """
+        Records order that could not be filled as cancelled
+        """
+        order.status = OrderStatus.CANCELLED.value
+        order.save()
+        return order
+
+    @classmethod
+    def _save_sweep(cls, order: 'Order', counter_orders: ['Order'],
+                    ledger: 'BalanceLedger'):
+        """
+        Writes result of a placement with constant number of statements:
+        the order itself, one bulk update of counter orders, one bulk
+        insert of trades and one bulk update per balance model
+        """
+        if order.status == OrderStatus.ACTIVE.value and order.kind != OrderKind.LIMIT.value:
+            # only limit orders may rest in the book
+            order.status = OrderStatus.CANCELLED.value
+        if order.status != OrderStatus.ACTIVE.value:
+            # rounding leftovers of completed orders go back as well
+            ledger.release(order)
+        ledger.sync()
+        order.save()
+        for trade in ledger.trades:
+            # taker had no id yet when it traded
+            trade.taker_id = order.pk
+        cls._save_trades(counter_orders, ledger)
+
+    @classmethod
+    def _save_trades(cls, orders: ['Order'], ledger: 'BalanceLedger'):
+        """
+        Writes balances, traded orders and trades with one bulk statement
+        per table, whatever the number of trades
+        """
+        now = timezone.now()
+        for order in orders:
+            order.updated_at_dt = now
+            if order.status != OrderStatus.ACTIVE.value:
+                ledger.release(order)
+        # callers write in one transaction, so insufficient funds roll back
+        # the whole placement, the taker saved by _save_sweep as well
+        ledger.save()
+        # orders were active before, those completed now are new to totals
+        OrderTotals.add(ledger.instrument_id,
+                        completed_volume=sum(
+                            o.total_sum for o in orders
+                            if o.status == OrderStatus.COMPLETED.value))
+        cls.objects.bulk_update(orders, [
+            'remaining_sum', 'status', 'actual_price', 'held_sum',
+            'updated_at_dt'
+        ])
+        for order in orders:
+            order._saved_status = order.status
+        Trade.objects.bulk_create(ledger.trades)
+        Candle.add(ledger.instrument_id, ledger.trades)
+        cls.invalidate_depth([ledger.instrument_id])
+
+    @classmethod
+    def load_order_book(cls, instrument_id) -> OrderBook:
+        """
+        Recovers order book of instrument from its journal, builds it from
+        active orders when there is no journal or it does not match them
+        """
+        orders = cls.objects.filter(instrument_id=instrument_id,
+                                    status=OrderStatus.ACTIVE.value,
+                                    remaining_sum__gt=0)
+        journal = book_journal.get_journal()
+        if journal is not None:
+            book = journal.recover(instrument_id)
+            if book is not None:
+                # one aggregate catches events lost between commit and log
+                state = orders.aggregate(count=models.Count('id'),
+                                         total=models.Sum('remaining_sum'))
+                if state['count'] == len(book) and to_units(
+                        state['total'] or 0) == book.total():
+                    return book
+        book = OrderBook(instrument_id)
+        for order in orders.order_by('created_at_dt', 'id').iterator():
+            book.add(order.to_book_entry())
+        if journal is not None:
+            journal.save_snapshot(book)
+        return book
+
+    def to_book_entry(self) -> BookEntry:
+        return BookEntry(order_id=self.pk,
+                         user_id=self.user_id,
+                         is_buy=self.type == OrderType.BUY.value,
+                         price=to_units(self.price),
+                         remaining_sum=to_units(self.remaining_sum),
+                         created_at_dt=self.created_at_dt,
+                         expires_at_dt=self.expires_at_dt)
+
+    @classmethod
+    def expire_orders(cls, now=None) -> int:
+        """
+        Expires every active order whose deadline has passed with a single
+        update, the partial index on expires_at_dt keeps it O(expired)
+        :return: number of expired orders
+        """
+        now = now or timezone.now()
+        expired, _ = cls._close_orders(
+            cls.objects.filter(status=OrderStatus.ACTIVE.value,
+                               expires_at_dt__lte=now),
+            OrderStatus.EXPIRED.value, now)
+        return expired
+
+    @classmethod
+    def get_depth(cls, instrument_id, levels=10) -> dict:
+        """
+        Returns aggregated price levels of both sides, best first.
+        Levels are cached until the book of instrument changes.
+        :return: {'buy': [...], 'sell': [...]}, every level is a dict with
+        price, remaining_sum and number of orders
+        """
+        key = DEPTH_CACHE_KEY.format(instrument_id)
+        depth = cache.get(key)
+        if depth is None or depth['levels'] < levels:
+            depth = {
+                'levels':
+                max(levels, getattr(settings, 'ORDER_BOOK_DEPTH_LEVELS', 50))
+            }
+            for order_type in OrderType:
+                depth[order_type.value] = cls._aggregate_levels(
+                    instrument_id, order_type.value, depth['levels'])
+            cache.set(key, depth, getattr(settings, 'ORDER_BOOK_DEPTH_TTL',
+                                          60))
+        return {
+            order_type.value: depth[order_type.value][:levels]
+            for order_type in OrderType
+        }
+
+    @classmethod
+    def _aggregate_levels(cls, instrument_id, order_type, levels) -> [dict]:
+        # served by the partial order book indexes
+        ordering = '-price' if order_type == OrderType.BUY.value else 'price'
+        return list(
+            cls.objects.filter(
+                instrument_id=instrument_id,
+                type=order_type,
+                status=OrderStatus.ACTIVE.value,
+                remaining_sum__gt=0).values('price').annotate(
+                    remaining_sum=models.Sum('remaining_sum'),
+                    orders=models.Count('id')).order_by(ordering)[:levels])
+
+    @classmethod
+    def invalidate_depth(cls, instrument_ids):
+        """
+        Drops cached levels now and once more after commit, a reader may
+        have cached the old book in between
+        """
+        keys = [DEPTH_CACHE_KEY.format(i) for i in instrument_ids]
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
     @classmethod
     def get_avg_price(cls, instrument: Instrument) -> float:
         """
-        Returns volume weighted price
+        Returns volume weighted price of orders that were not cancelled,
+        read from running totals of the instrument
         :param instrument:
         :return:
         """
-        try:
-            avg_price = cls.objects.filter(
-                instrument=instrument,
-                # status=OrderStatus.COMPLETED.value
-            ).annotate(price_t_volume=models.F('price') *
-                       models.F('total_sum')).aggregate(
-                           avg_price=models.Sum('price_t_volume') /
-                           models.Sum('total_sum'))
-        except DataError:  # handle division by zero
-            return 0
-        return float(avg_price.get('avg_price', 0) or 0)
+        totals = OrderTotals.objects.filter(instrument=instrument).first()
+        return float(totals.avg_price) if totals else 0
 
     @classmethod
     def get_liquidity_rate(cls, instrument: Instrument) -> float:
         """
-        Returns liquidity rate weighted by order volume
+        Returns share of volume of orders that were not cancelled which is
+        completed, read from running totals of the instrument
         :param instrument:
         :return:
         """
-        completed_volume = cls.objects.filter(
-            instrument=instrument,
-            status=OrderStatus.COMPLETED.value).aggregate(
-                models.Sum('total_sum')).get('total_sum__sum', 0)
-        rate = cls.objects.filter(instrument=instrument).aggregate(
-            rate=completed_volume / models.Sum('total_sum'))
-        return float(rate.get('rate', 0) or 0)
+        totals = OrderTotals.objects.filter(instrument=instrument).first()
+        return float(totals.liquidity_rate) if totals else 0
 
     @classmethod
     def get_placed_assets_rate(cls, instrument: Instrument) -> float:
         """
-        Returns number of tokens "bank" user has
+        Returns number of tokens issuer of the instrument still has, id of
+        issuer balance is cached, so it is a single primary key read
         :param instrument:
         :return:
         """
-        bank_balance = InstrumentBalance.objects.filter(
-            user__email__contains='bank',
-            instrument=instrument).order_by('user__created_at_dt').last()
-        if bank_balance:
-            return float(bank_balance.amount)
-        return 0
+        if instrument.issuer_id is None:
+            return 0
+        key = ISSUER_BALANCE_CACHE_KEY.format(instrument.pk,
+                                              instrument.issuer_id)
+        balance_id = cache.get(key)
+        if balance_id is None:
+            balance_id = InstrumentBalance.objects.filter(
+                user_id=instrument.issuer_id,
+                instrument=instrument).values_list('id', flat=True).first()
+            if balance_id is None:
+                return 0
+            # balances are never deleted, issuer change changes the key
+            cache.set(key, balance_id, None)
+        amount = InstrumentBalance.objects.filter(pk=balance_id).values_list(
+            'amount', flat=True).first()
+        return float(amount or 0)
+
+    @classmethod
+    def record_statistics(cls, instrument_ids: [int], emulation_uuid) -> int:
+        """
+        Writes price, liquidity and placed assets of every instrument for
+        an emulation round. One query reads running totals, issuer balances
+        and last recorded prices of all instruments, writes are one bulk
+        insert per history table inside of one transaction.
+        Without orders last recorded price of the round is repeated.
+        :return: number of instruments recorded
+        """
+        instruments = Instrument.objects.filter(
+            pk__in=instrument_ids).select_related('order_totals').annotate(
+                placed_assets=models.Subquery(
+                    InstrumentBalance.objects.filter(
+                        instrument=models.OuterRef('pk'),
+                        user=models.OuterRef('issuer')).values('amount')[:1]),
+                last_price=models.Subquery(
+                    OrderPriceHistory.objects.filter(
+                        instrument=models.OuterRef('pk'),
+                        uuid=emulation_uuid).order_by('-created_at_dt').values(
+                            'price')[:1]))
+        prices, liquidity, placed_assets = [], [], []
+        for instrument in instruments:
+            try:
+                totals = instrument.order_totals
+            except ObjectDoesNotExist:
+                totals = OrderTotals(instrument=instrument)
+            price = totals.avg_price or instrument.last_price
+            if price:
+                prices.append(
+                    OrderPriceHistory(instrument=instrument,
+                                      price=price,
+                                      uuid=emulation_uuid))
+            liquidity.append(
+                LiquidityHistory(instrument=instrument,
+                                 value=totals.liquidity_rate,
+                                 uuid=emulation_uuid))
+            placed_assets.append(
+                PlacedAssetsHistory(instrument=instrument,
+                                    value=instrument.placed_assets or 0,
+                                    uuid=emulation_uuid))
+        with transaction.atomic():
+            OrderPriceHistory.objects.bulk_create(prices)
+            LiquidityHistory.objects.bulk_create(liquidity)
+            PlacedAssetsHistory.objects.bulk_create(placed_assets)
+        return len(liquidity)
+
+
+class Trade(models.Model):
+    """
+    Single fill between resting (maker) and incoming (taker) order,
+    rows are only ever inserted
+    """
+    instrument = models.ForeignKey(Instrument, on_delete=models.PROTECT)
+    maker = models.ForeignKey(Order,
+                              on_delete=models.PROTECT,
+                              related_name='maker_trades')
+    taker = models.ForeignKey(Order,
+                              on_delete=models.PROTECT,
+                              related_name='taker_trades')
+    price = models.DecimalField(max_digits=20, decimal_places=8)
+    quantity = models.DecimalField(max_digits=20, decimal_places=8)
+    created_at_dt = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['instrument', 'created_at_dt'],
+                         name='trade_instrument_time_idx'),
+        ]
+
+    def __str__(self):
+        return f'[{self.instrument}] {self.quantity} @{self.price}'
+
+
+class Candle(models.Model):
+    """
+    OHLCV bar of fills of an instrument, bars of every resolution are
+    changed in the same transaction as trades. `manage.py rebuild_candles`
+    recomputes them from trades.
+    """
+    instrument = models.ForeignKey(Instrument, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=15,
+                                  choices=[(tag.name, tag.value)
+                                           for tag in CandleResolution])
+    start_dt = models.DateTimeField()
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    volume = models.DecimalField(max_digits=30, decimal_places=8, default=0)
+
+    class Meta:
+        # bars of a range are read from this index in the order of time
+        constraints = [
+            models.UniqueConstraint(
+                fields=['instrument', 'resolution', 'start_dt'],
+                name='candle_bar_uniq'),
+        ]
+
+    @classmethod
+    def add(cls, instrument_id, trades: ['Trade']):
+        """
+        Merges saved trades ordered by time into bars of every resolution
+        with one insert of missing bars and one update, whatever the number
+        of trades
+        """
+        bars = [(resolution, bar)
+                for resolution, resolution_bars in trade_bars(
+                    (trade.created_at_dt, trade.price, trade.quantity)
+                    for trade in trades).items() for bar in resolution_bars]
+        if not bars:
+            return
+        # missing bars are created without volume, existing ones are kept
+        cls.objects.bulk_create([
+            cls(instrument_id=instrument_id,
+                resolution=resolution,
+                start_dt=bar.start,
+                open=bar.open,
+                high=bar.high,
+                low=bar.low,
+                close=bar.close) for resolution, bar in bars
+        ],
+                                ignore_conflicts=True)
+        keys = [
+            models.Q(resolution=resolution, start_dt=bar.start)
+            for resolution, bar in bars
+        ]
+
+        def by_bar(field) -> Cast:
+            # compared with stored prices as a number whatever the driver
+            # binds decimal parameters as
+            return Cast(
+                models.Case(*[
+                    models.When(key, then=models.Value(getattr(bar, field)))
+                    for key, (_, bar) in zip(keys, bars)
+                ]), models.DecimalField(max_digits=30, decimal_places=8))
+
+        cls.objects.filter(reduce(or_, keys),
+                           instrument_id=instrument_id).update(
+                               high=Greatest('high', by_bar('high')),
+                               low=Least('low', by_bar('low')),
+                               close=by_bar('close'),
+                               volume=models.F('volume') + by_bar('volume'))
+
+    @classmethod
+    def rebuild(cls, instrument_ids=None) -> int:
+        """
+        Recomputes bars from trades, instruments should not be traded
+        meanwhile
+        :param instrument_ids: all instruments by default
+        :return: number of bars written
+        """
+        instruments = Instrument.objects.all()
+        if instrument_ids is not None:
+            instruments = instruments.filter(id__in=instrument_ids)
+        written = 0
+        with transaction.atomic():
+            for instrument_id in instruments.values_list('id', flat=True):
+                cls.objects.filter(instrument_id=instrument_id).delete()
+                trades = Trade.objects.filter(
+                    instrument_id=instrument_id).order_by(
+                        'created_at_dt',
+                        'id').values_list('created_at_dt', 'price',
+                                          'quantity').iterator()
+                candles = [
+                    cls(instrument_id=instrument_id,
+                        resolution=resolution,
+                        start_dt=bar.start,
+                        open=bar.open,
+                        high=bar.high,
+                        low=bar.low,
+                        close=bar.close,
+                        volume=bar.volume) for resolution, resolution_bars in
+                    trade_bars(trades).items() for bar in resolution_bars
+                ]
+                cls.objects.bulk_create(candles, batch_size=1000)
+                written += len(candles)
+        return written
+
+    def __str__(self):
+        return f'[{self.instrument_id}] {self.resolution} {self.start_dt}'
+
+
+TOTALS_FIELDS = ('volume', 'price_volume', 'completed_volume')
+
+
+class OrderTotals(models.Model):
+    """
+    Running sums over orders of an instrument that were not cancelled and
+    over completed ones, changed in the same transaction as the orders, so
+    statistics are read without scanning orders.
+    `manage.py rebuild_order_totals` recomputes them from scratch.
+    """
+    instrument = models.OneToOneField(Instrument,
+                                      on_delete=models.CASCADE,
+                                      primary_key=True,
+                                      related_name='order_totals')
+    volume = models.DecimalField(max_digits=30, decimal_places=8, default=0)
+    # sum of price * total_sum, exact for 8 decimal places of both
+    price_volume = models.DecimalField(max_digits=40,
+                                       decimal_places=16,
+                                       default=0)
+    completed_volume = models.DecimalField(max_digits=30,
+                                           decimal_places=8,
+                                           default=0)
+
+    @classmethod
+    def add(cls, instrument_id, volume=0, price_volume=0, completed_volume=0):
+        if not (volume or price_volume or completed_volume):
+            return
+        updated = cls.objects.filter(instrument_id=instrument_id).update(
+            volume=models.F('volume') + volume,
+            price_volume=models.F('price_volume') + price_volume,
+            completed_volume=models.F('completed_volume') + completed_volume)
+        if not updated:
+            cls.objects.get_or_create(instrument_id=instrument_id)
+            cls.add(instrument_id, volume, price_volume, completed_volume)
+
+    @classmethod
+    def remove(cls, orders: models.QuerySet):
+        """
+        Takes orders out of totals of their instruments with one update,
+        cancelled ones are not in them
+        """
+        sums = orders.exclude(status=OrderStatus.CANCELLED.value).filter(
+            instrument_id=models.OuterRef('instrument_id')).order_by().values(
+                'instrument_id').annotate(
+                    volume=models.Sum('total_sum'),
+                    price_volume=models.Sum(
+                        models.F('price') * models.F('total_sum')),
+                    completed_volume=models.Sum(
+                        'total_sum',
+                        filter=models.Q(status=OrderStatus.COMPLETED.value)))
+        cls.objects.filter(
+            instrument_id__in=orders.values('instrument_id')).update(
+                volume=models.F('volume') -
+                Coalesce(models.Subquery(sums.values('volume')), 0),
+                price_volume=models.F('price_volume') -
+                Coalesce(models.Subquery(sums.values('price_volume')), 0),
+                completed_volume=models.F('completed_volume') -
+                Coalesce(models.Subquery(sums.values('completed_volume')), 0))
+
+    @classmethod
+    def rebuild(cls, instrument_ids=None) -> [int]:
+        """
+        Recomputes totals from orders
+        :param instrument_ids: all instruments by default
+        :return: ids of instruments whose totals were off
+        """
+        instruments = Instrument.objects.all()
+        if instrument_ids is not None:
+            instruments = instruments.filter(id__in=instrument_ids)
+        fixed = []
+        with transaction.atomic():
+            for instrument_id in instruments.values_list('id', flat=True):
+                cls.objects.get_or_create(instrument_id=instrument_id)
+            # placements wait on the locked rows, so orders they wrote
+            # are either committed and summed below or not written yet
+            totals = list(cls.objects.select_for_update().filter(
+                instrument__in=instruments).order_by('instrument_id'))
+            orders = Order.objects.filter(instrument__in=instruments).exclude(
+                status=OrderStatus.CANCELLED.value).order_by(
+                ).values('instrument_id').annotate(
+                    volume=models.Sum('total_sum'),
+                    price_volume=models.Sum(
+                        models.F('price') * models.F('total_sum')),
+                    completed_volume=models.Sum(
+                        'total_sum',
+                        filter=models.Q(status=OrderStatus.COMPLETED.value)))
+            sums = {row['instrument_id']: row for row in orders}
+            for row in totals:
+                expected = sums.get(row.instrument_id, {})
+                changed = False
+                for field in TOTALS_FIELDS:
+                    value = expected.get(field) or 0
+                    if getattr(row, field) != value:
+                        setattr(row, field, value)
+                        changed = True
+                if changed:
+                    row.save()
+                    fixed.append(row.instrument_id)
+        return fixed
+
+    @property
+    def avg_price(self) -> Decimal:
+        if not self.volume:
+            return Decimal(0)
+        return self.price_volume / self.volume
+
+    @property
+    def liquidity_rate(self) -> Decimal:
+        if not self.volume:
+            return Decimal(0)
+        return self.completed_volume / self.volume
+
+    def __str__(self):
+        return f'[{self.instrument_id}] {self.price_volume} / {self.volume}'
 
 
 class OrderPriceHistory(models.Model):
@@ -373,6 +1448,12 @@ class OrderPriceHistory(models.Model):
     created_at_dt = models.DateTimeField(auto_now_add=True)
     uuid = models.UUIDField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['uuid', 'instrument', 'created_at_dt'],
+                         name='price_history_round_idx'),
+        ]
+
 
 class LiquidityHistory(models.Model):
     instrument = models.ForeignKey(Instrument, on_delete=models.DO_NOTHING)
@@ -380,9 +1461,21 @@ class LiquidityHistory(models.Model):
     created_at_dt = models.DateTimeField(auto_now_add=True)
     uuid = models.UUIDField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['uuid', 'instrument', 'created_at_dt'],
+                         name='liquidity_history_round_idx'),
+        ]
+
 
 class PlacedAssetsHistory(models.Model):
     instrument = models.ForeignKey(Instrument, on_delete=models.DO_NOTHING)
     value = models.DecimalField(max_digits=20, decimal_places=5)
     created_at_dt = models.DateTimeField(auto_now_add=True)
     uuid = models.UUIDField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['uuid', 'instrument', 'created_at_dt'],
+                         name='placed_history_round_idx'),
+        ]
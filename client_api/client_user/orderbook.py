@@ -0,0 +1,303 @@
+import bisect
+import heapq
+import json
+import threading
+import zlib
+from collections import deque
+from datetime import datetime, timezone
+
+# book events, every change of a book is one of them, so replaying events
+# on a snapshot gives the same book
+ADD = 'add'
+FILL = 'fill'
+REMOVE = 'remove'
+
+
+class BookEntry:
+    """
+    Resting order as it is kept in memory, price and remaining sum are
+    integer units (see fixedpoint)
+    """
+    __slots__ = ('order_id', 'user_id', 'is_buy', 'price', 'remaining_sum',
+                 'created_at_dt', 'expires_at_dt')
+
+    def __init__(self,
+                 order_id,
+                 user_id,
+                 is_buy,
+                 price,
+                 remaining_sum,
+                 created_at_dt,
+                 expires_at_dt=None):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.is_buy = is_buy
+        self.price = price
+        self.remaining_sum = remaining_sum
+        self.created_at_dt = created_at_dt
+        self.expires_at_dt = expires_at_dt
+
+    def __repr__(self):
+        side = 'buy' if self.is_buy else 'sell'
+        return f'<BookEntry #{self.order_id} {side} {self.remaining_sum}@{self.price}>'
+
+    def to_row(self) -> list:
+        expires_at = self.expires_at_dt and self.expires_at_dt.timestamp()
+        return [
+            self.order_id, self.user_id, self.is_buy, self.price,
+            self.remaining_sum,
+            self.created_at_dt.timestamp(), expires_at
+        ]
+
+    @classmethod
+    def from_row(cls, row) -> 'BookEntry':
+        order_id, user_id, is_buy, price, remaining_sum, created, expires = row
+        return cls(order_id=order_id,
+                   user_id=user_id,
+                   is_buy=is_buy,
+                   price=price,
+                   remaining_sum=remaining_sum,
+                   created_at_dt=datetime.fromtimestamp(created, timezone.utc),
+                   expires_at_dt=expires
+                   and datetime.fromtimestamp(expires, timezone.utc))
+
+
+class PriceLevel:
+    """
+    FIFO queue of resting orders sharing the same price
+    """
+    __slots__ = ('price', 'orders', 'total')
+
+    def __init__(self, price):
+        self.price = price
+        self.orders = deque()
+        self.total = 0
+
+    def __len__(self):
+        return len(self.orders)
+
+    def append(self, entry: BookEntry):
+        self.orders.append(entry)
+        self.total += entry.remaining_sum
+
+    def remove(self, entry: BookEntry):
+        self.orders.remove(entry)
+        self.total -= entry.remaining_sum
+
+
+class OrderBook:
+    """
+    Price-time priority order book of a single instrument.
+
+    Price levels are kept in ascending lists per side, so the best bid is the
+    last bid price and the best ask is the first ask price. The book is not
+    thread safe by itself, callers are expected to hold `lock` around a
+    match and the following mutations.
+
+    Mutations made through `apply` are counted by `seq`, so a snapshot
+    plus the events applied after it restore the book exactly.
+
+    Deadlines of resting orders are kept in a heap, so expiring them costs
+    O(expired * log n) and matching never has to look at deadlines.
+    """
+
+    def __init__(self, instrument_id):
+        self.instrument_id = instrument_id
+        self.lock = threading.RLock()
+        self._levels = {True: {}, False: {}}
+        self._prices = {True: [], False: []}
+        self._orders = {}
+        self._deadlines = []
+        self.seq = 0
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id):
+        return order_id in self._orders
+
+    def get(self, order_id) -> BookEntry:
+        return self._orders.get(order_id)
+
+    def best_bid(self):
+        prices = self._prices[True]
+        return prices[-1] if prices else None
+
+    def best_ask(self):
+        prices = self._prices[False]
+        return prices[0] if prices else None
+
+    def add(self, entry: BookEntry):
+        if entry.order_id in self._orders:
+            raise ValueError(f'Order {entry.order_id} is already in the book')
+        levels = self._levels[entry.is_buy]
+        level = levels.get(entry.price)
+        if level is None:
+            level = levels[entry.price] = PriceLevel(entry.price)
+            bisect.insort(self._prices[entry.is_buy], entry.price)
+        level.append(entry)
+        self._orders[entry.order_id] = entry
+        if entry.expires_at_dt is not None:
+            heapq.heappush(self._deadlines,
+                           (entry.expires_at_dt, entry.order_id))
+
+    def remove(self, order_id) -> BookEntry:
+        """
+        Removes order from the book, returns None if it is not there
+        """
+        entry = self._orders.pop(order_id, None)
+        if entry is None:
+            return None
+        level = self._levels[entry.is_buy][entry.price]
+        level.remove(entry)
+        if not level:
+            self._drop_level(entry.is_buy, entry.price)
+        return entry
+
+    def fill(self, order_id, amount):
+        """
+        Decreases remaining sum of resting order, removes it when it is done
+        """
+        entry = self._orders[order_id]
+        level = self._levels[entry.is_buy][entry.price]
+        entry.remaining_sum -= amount
+        level.total -= amount
+        if entry.remaining_sum <= 0:
+            self.remove(order_id)
+
+    def expire(self, now) -> [BookEntry]:
+        """
+        Removes orders whose deadline is not later than `now`
+        :return: removed orders
+        """
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, order_id = heapq.heappop(self._deadlines)
+            # orders filled or cancelled earlier leave stale heap items
+            entry = self._orders.get(order_id)
+            if entry is not None:
+                self.apply(self.remove_event(order_id))
+                expired.append(entry)
+        return expired
+
+    def crossing_levels(self, is_buy, price):
+        """
+        Yields counter side levels that cross given price, best first
+        """
+        prices = self._prices[not is_buy]
+        levels = self._levels[not is_buy]
+        if is_buy:
+            for level_price in prices:
+                if level_price > price:
+                    return
+                yield levels[level_price]
+        else:
+            for level_price in reversed(prices):
+                if level_price < price:
+                    return
+                yield levels[level_price]
+
+    def match(self, is_buy, price, amount) -> [(BookEntry, int)]:
+        """
+        Returns list of (resting order, trade amount) pairs an incoming order
+        would trade against. The book itself is not changed.
+        """
+        fills = []
+        for level in self.crossing_levels(is_buy, price):
+            for entry in level.orders:
+                if amount <= 0:
+                    return fills
+                trade_amount = min(amount, entry.remaining_sum)
+                fills.append((entry, trade_amount))
+                amount -= trade_amount
+        return fills
+
+    def total(self):
+        return sum(entry.remaining_sum for entry in self._orders.values())
+
+    @staticmethod
+    def add_event(entry: BookEntry) -> list:
+        return [ADD, entry.to_row()]
+
+    @staticmethod
+    def fill_event(order_id, amount) -> list:
+        return [FILL, order_id, amount]
+
+    @staticmethod
+    def remove_event(order_id) -> list:
+        return [REMOVE, order_id]
+
+    def apply(self, event: list):
+        """
+        Applies JSON serializable event built by one of *_event methods
+        """
+        kind = event[0]
+        if kind == ADD:
+            self.add(BookEntry.from_row(event[1]))
+        elif kind == FILL:
+            self.fill(event[1], event[2])
+        elif kind == REMOVE:
+            self.remove(event[1])
+        else:
+            raise ValueError(f'Unknown book event {kind}')
+        self.seq += 1
+
+    def snapshot(self) -> bytes:
+        """
+        Compressed state of the book, time priority inside levels is kept
+        """
+        rows = [
+            entry.to_row() for is_buy in (True, False)
+            for price in self._prices[is_buy]
+            for entry in self._levels[is_buy][price].orders
+        ]
+        return zlib.compress(
+            json.dumps({
+                'seq': self.seq,
+                'orders': rows
+            }).encode())
+
+    @classmethod
+    def restore(cls, instrument_id, snapshot: bytes) -> 'OrderBook':
+        data = json.loads(zlib.decompress(snapshot))
+        book = cls(instrument_id)
+        for row in data['orders']:
+            book.add(BookEntry.from_row(row))
+        book.seq = data['seq']
+        return book
+
+    def _drop_level(self, is_buy, price):
+        del self._levels[is_buy][price]
+        prices = self._prices[is_buy]
+        del prices[bisect.bisect_left(prices, price)]
+
+
+class OrderBooks:
+    """
+    Process wide registry of order books, books are loaded lazily
+    """
+
+    def __init__(self):
+        self._books = {}
+        self._lock = threading.Lock()
+
+    def get(self, instrument_id, loader) -> OrderBook:
+        book = self._books.get(instrument_id)
+        if book is not None:
+            return book
+        with self._lock:
+            book = self._books.get(instrument_id)
+            if book is None:
+                book = self._books[instrument_id] = loader(instrument_id)
+            return book
+
+    def discard(self, instrument_id):
+        with self._lock:
+            self._books.pop(instrument_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._books.clear()
+
+
+order_books = OrderBooks()
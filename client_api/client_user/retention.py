@@ -0,0 +1,148 @@
+import csv
+import gzip
+import math
+import os
+from datetime import timedelta
+from enum import Enum
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+
+class Summary(Enum):
+    # mean of replaced points, for rates and prices
+    AVG = 'avg'
+    # last of replaced points, for levels like placed assets
+    LAST = 'last'
+
+
+def _value_field(model) -> str:
+    if model._meta.model_name == 'orderpricehistory':
+        return 'price'
+    return 'value'
+
+
+def _batch_size() -> int:
+    return getattr(settings, 'STATS_RETENTION_BATCH_SIZE', 1000)
+
+
+def _rows(model, **filters) -> models.QuerySet:
+    return model.objects.filter(**filters).order_by(
+        'created_at_dt', 'id').values_list('id', 'uuid',
+                                           'instrument_id', 'created_at_dt',
+                                           _value_field(model))
+
+
+def _archive(model, rows):
+    """
+    Appends raw rows to gzipped csv of their table. Rows are written
+    before their removal is committed, so archive may repeat some of them
+    """
+    path = settings.STATS_ARCHIVE_PATH
+    os.makedirs(path, exist_ok=True)
+    with gzip.open(os.path.join(path, f'{model._meta.db_table}.csv.gz'),
+                   'at',
+                   newline='') as file:
+        csv.writer(file).writerows(rows)
+
+
+def _delete(model, ids, archive):
+    for start in range(0, len(ids), _batch_size()):
+        batch = ids[start:start + _batch_size()]
+        if archive:
+            _archive(model, _rows(model, id__in=batch))
+        model.objects.filter(id__in=batch).delete()
+
+
+def expire(model, policy, now) -> int:
+    """
+    Deletes rounds whose last point is older than `delete_after` days,
+    every statement removes at most a batch of rows
+    :return: number of deleted rows
+    """
+    if policy.get('delete_after') is None:
+        return 0
+    rounds = model.objects.order_by().values('uuid').annotate(
+        last=models.Max('created_at_dt')).filter(
+            last__lt=now - timedelta(days=policy['delete_after']))
+    deleted = 0
+    for uuid in rounds.values_list('uuid', flat=True):
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    model.objects.filter(uuid=uuid).values_list(
+                        'id', flat=True)[:_batch_size()])
+                if not ids:
+                    break
+                _delete(model, ids, policy.get('archive', False))
+            deleted += len(ids)
+    return deleted
+
+
+def _summarize(model, field, summary: Summary, run):
+    values = [row[4] for row in run]
+    if summary == Summary.AVG:
+        value = sum(values) / len(values)
+    else:
+        value = values[-1]
+    return model(id=run[-1][0], **{field: value})
+
+
+def downsample(model, policy, now) -> int:
+    """
+    Replaces points of every instrument of rounds whose last point is older
+    than `downsample_after` days with at most `points` summary points.
+    Every run of consecutive points is summarized into its last one, so
+    timestamps and order of points are kept
+    :return: number of removed rows
+    """
+    if policy.get('downsample_after') is None:
+        return 0
+    points = policy['points']
+    summary = Summary(policy.get('summary', Summary.AVG.value))
+    field = _value_field(model)
+    groups = model.objects.order_by().values('uuid', 'instrument_id').annotate(
+        last=models.Max('created_at_dt'), count=models.Count('id')).filter(
+            last__lt=now - timedelta(days=policy['downsample_after']),
+            count__gt=points)
+    removed = 0
+    for group in groups:
+        size = math.ceil(group['count'] / points)
+        rows = _rows(model,
+                     uuid=group['uuid'],
+                     instrument_id=group['instrument_id'])
+        kept, dropped, run = [], [], []
+        with transaction.atomic():
+            if policy.get('archive', False):
+                _archive(model, rows.iterator(chunk_size=_batch_size()))
+            for row in rows.iterator(chunk_size=_batch_size()):
+                run.append(row)
+                if len(run) < size:
+                    continue
+                kept.append(_summarize(model, field, summary, run))
+                dropped.extend(row[0] for row in run[:-1])
+                run = []
+            if run:
+                kept.append(_summarize(model, field, summary, run))
+                dropped.extend(row[0] for row in run[:-1])
+            model.objects.bulk_update(kept, [field], batch_size=_batch_size())
+            _delete(model, dropped, archive=False)
+        removed += len(dropped)
+    return removed
+
+
+def apply_retention(now=None) -> {str: [int]}:
+    """
+    Applies `STATS_RETENTION` policies to emulation history tables
+    :return: numbers of rows removed by downsampling and by expiry per table
+    """
+    now = now or timezone.now()
+    result = {}
+    for name, policy in getattr(settings, 'STATS_RETENTION', {}).items():
+        model = apps.get_model('client_user', name)
+        # expired rounds are not worth downsampling
+        deleted = expire(model, policy, now)
+        result[name] = [downsample(model, policy, now), deleted]
+    return result
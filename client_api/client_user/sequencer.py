@@ -0,0 +1,470 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+import math
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from decimal import Decimal
+from enum import Enum
+
+import redis as _redis
+from django.conf import settings
+from django.db import close_old_connections
+
+from client_user import models
+from client_user.orderbook import order_books
+from client_user.shards import ShardMap
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'matching:orders:{}'
+RESULT_KEY = 'matching:result:{}'
+STATUS_KEY = 'matching:status:{}'
+CONSUMER_GROUP = 'matching'
+SHARDS_KEY = 'matching:shards'
+OWNER_KEY = 'matching:owner:{}'
+
+# lease of an instrument is changed only by the worker holding it
+RENEW_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SequencerMode(Enum):
+    OFF = 'off'
+    LOCAL = 'local'
+    REDIS = 'redis'
+
+
+class CommandStatus(Enum):
+    PENDING = 'pending'
+    DONE = 'done'
+    ERROR = 'error'
+
+
+class SequencerTimeout(Exception):
+    def __init__(self, command_id):
+        super().__init__(f'Command {command_id} is still being processed')
+        self.command_id = command_id
+
+
+class CommandError(Exception):
+    pass
+
+
+def place_order_command(order: models.Order) -> dict:
+    return {
+        'command': 'place',
+        'id': uuid.uuid4().hex,
+        'instrument_id': order.instrument_id,
+        'order': {
+            'user_id': order.user_id,
+            'type': order.type,
+            'kind': order.kind,
+            'price': str(order.price),
+            'total_sum': str(order.total_sum),
+            'expires_in': order.expires_in,
+            'emulation_uuid': order.emulation_uuid
+            and str(order.emulation_uuid),
+        },
+    }
+
+
+def reload_command(instrument_id) -> dict:
+    return {
+        'command': 'reload',
+        'id': uuid.uuid4().hex,
+        'instrument_id': instrument_id,
+    }
+
+
+def _place(command: dict) -> dict:
+    # placed before the worker crashed without acknowledging the command
+    order_id = models.Order.objects.filter(
+        command_id=command['id']).values_list('pk', flat=True).first()
+    if order_id is not None:
+        return {'status': CommandStatus.DONE.value, 'order_id': order_id}
+    data = command['order']
+    order = models.Order(user_id=data['user_id'],
+                         instrument_id=command['instrument_id'],
+                         type=data['type'],
+                         kind=data['kind'],
+                         price=Decimal(data['price']),
+                         total_sum=Decimal(data['total_sum']),
+                         remaining_sum=Decimal(data['total_sum']),
+                         expires_in=data['expires_in'],
+                         emulation_uuid=data['emulation_uuid'],
+                         command_id=command['id'])
+    # worker is the only writer of the instrument, so its book is exact
+    order = models.Order.place_order(
+        order, engine=models.OrderBookEngine.MEMORY.value)
+    return {'status': CommandStatus.DONE.value, 'order_id': order.pk}
+
+
+def _reload(command: dict) -> dict:
+    models.Order.discard_order_book(command['instrument_id'])
+    return {'status': CommandStatus.DONE.value}
+
+
+COMMANDS = {
+    'place': _place,
+    'reload': _reload,
+}
+
+
+def execute_command(command: dict) -> dict:
+    """
+    Executes command inside of matching worker
+    :param command:
+    :return: result that is sent back to the waiting client
+    """
+    try:
+        return COMMANDS[command['command']](command)
+    except ValueError as e:
+        return {'status': CommandStatus.ERROR.value, 'error': str(e)}
+    except Exception as e:
+        logger.exception('Command %s failed', command.get('id'))
+        return {'status': CommandStatus.ERROR.value, 'error': str(e)}
+    finally:
+        close_old_connections()
+
+
+class Sequencer(ABC):
+    """
+    Puts matching commands on per instrument queues, every queue is consumed
+    by exactly one worker, so orders of an instrument are matched one by one
+    """
+
+    @abstractmethod
+    def submit(self, command: dict):
+        pass
+
+    @abstractmethod
+    def wait(self, command_id: str, timeout: float) -> dict:
+        """
+        Blocks until command is executed, returns None on timeout
+        """
+
+    @abstractmethod
+    def result(self, command_id: str) -> dict:
+        """
+        Returns result of command without blocking, None if it is unknown
+        """
+
+    def place_order(self, order: models.Order) -> models.Order:
+        command = place_order_command(order)
+        self.submit(command)
+        result = self.wait(command['id'],
+                           getattr(settings, 'ORDER_SEQUENCER_TIMEOUT', 10))
+        if result is None:
+            raise SequencerTimeout(command['id'])
+        return self.resolve(result)
+
+    @staticmethod
+    def resolve(result: dict) -> models.Order:
+        if result['status'] == CommandStatus.ERROR.value:
+            raise CommandError(result['error'])
+        return models.Order.objects.get(pk=result['order_id'])
+
+
+class LocalSequencer(Sequencer):
+    """
+    In-process stand-in, runs a matching thread per instrument
+    """
+
+    def __init__(self, handler=execute_command):
+        self._handler = handler
+        self._queues = {}
+        self._results = {}
+        # (finished at, command id) in order of execution
+        self._finished = deque()
+        self._lock = threading.Lock()
+        self.result_ttl = getattr(settings, 'ORDER_SEQUENCER_RESULT_TTL', 3600)
+
+    def submit(self, command: dict):
+        future = Future()
+        with self._lock:
+            self._expire()
+            self._results[command['id']] = future
+            commands = self._queues.get(command['instrument_id'])
+            if commands is None:
+                commands = self._queues[
+                    command['instrument_id']] = queue.Queue()
+                threading.Thread(target=self._work,
+                                 args=(commands, ),
+                                 name=f'matching-{command["instrument_id"]}',
+                                 daemon=True).start()
+        commands.put(command)
+
+    def _work(self, commands: queue.Queue):
+        while True:
+            command = commands.get()
+            future = self._results[command['id']]
+            future.set_result(self._handler(command))
+            with self._lock:
+                self._finished.append((time.monotonic(), command['id']))
+
+    def _expire(self):
+        # results nobody collected, e.g. of reloads or of placements whose
+        # client gave up waiting, are dropped as redis results expire
+        deadline = time.monotonic() - self.result_ttl
+        while self._finished and self._finished[0][0] <= deadline:
+            self._results.pop(self._finished.popleft()[1], None)
+
+    def wait(self, command_id: str, timeout: float) -> dict:
+        try:
+            result = self._results[command_id].result(timeout)
+        except FutureTimeoutError:
+            return None
+        self._results.pop(command_id, None)
+        return result
+
+    def result(self, command_id: str) -> dict:
+        future = self._results.get(command_id)
+        if future is None:
+            return None
+        if not future.done():
+            return {'status': CommandStatus.PENDING.value}
+        self._results.pop(command_id, None)
+        return future.result()
+
+
+class RedisSequencer(Sequencer):
+    """
+    Command queues are redis streams, one per instrument. Every stream is
+    expected to be consumed by a single `run_matching_worker` process.
+    """
+
+    def __init__(self, connection=None):
+        self.redis = connection or _redis.Redis(host=settings.REDIS_HOST,
+                                                port=settings.REDIS_PORT,
+                                                db=settings.REDIS_DB)
+        self.result_ttl = getattr(settings, 'ORDER_SEQUENCER_RESULT_TTL', 3600)
+
+    def submit(self, command: dict):
+        pipe = self.redis.pipeline()
+        pipe.set(STATUS_KEY.format(command['id']),
+                 json.dumps({'status': CommandStatus.PENDING.value}),
+                 ex=self.result_ttl)
+        pipe.xadd(STREAM_KEY.format(command['instrument_id']),
+                  {'command': json.dumps(command)},
+                  maxlen=getattr(settings, 'ORDER_SEQUENCER_STREAM_MAXLEN',
+                                 100000),
+                  approximate=True)
+        pipe.execute()
+
+    def wait(self, command_id: str, timeout: float) -> dict:
+        # zero timeout means forever for BLPOP
+        item = self.redis.blpop(RESULT_KEY.format(command_id),
+                                timeout=max(1, math.ceil(timeout)))
+        if item is None:
+            return None
+        return json.loads(item[1])
+
+    def result(self, command_id: str) -> dict:
+        raw = self.redis.get(STATUS_KEY.format(command_id))
+        return json.loads(raw) if raw else None
+
+    def publish(self, command_id: str, result: dict):
+        pipe = self.redis.pipeline()
+        pipe.rpush(RESULT_KEY.format(command_id), json.dumps(result))
+        pipe.expire(RESULT_KEY.format(command_id), self.result_ttl)
+        pipe.set(STATUS_KEY.format(command_id),
+                 json.dumps(result),
+                 ex=self.result_ttl)
+        pipe.execute()
+
+    def run_worker(self,
+                   instrument_ids,
+                   consumer='worker',
+                   block=5000,
+                   handler=execute_command):
+        """
+        Consumes command streams of given instruments forever
+        :param instrument_ids:
+        :param consumer: name of consumer inside of the group
+        :param block: milliseconds to wait for new commands
+        :param handler:
+        """
+        last_ids = {}
+        for instrument_id in instrument_ids:
+            last_ids[self._join(instrument_id, consumer)] = '0'
+        while True:
+            self._consume(last_ids, consumer, block, handler)
+
+    def shard_map(self) -> ShardMap:
+        """
+        Shards stored in redis, ORDER_SHARDS setting until they are set
+        """
+        raw = self.redis.get(SHARDS_KEY)
+        shards = json.loads(raw) if raw else getattr(settings, 'ORDER_SHARDS',
+                                                     [])
+        return ShardMap(shards, getattr(settings, 'ORDER_SHARD_REPLICAS', 64))
+
+    def set_shards(self, shards):
+        """
+        Changes shard map, workers move instruments on their next refresh
+        """
+        self.redis.set(SHARDS_KEY, json.dumps(sorted(set(shards))))
+
+    def run_shard_worker(self,
+                         shard,
+                         consumer=None,
+                         block=5000,
+                         handler=execute_command):
+        """
+        Consumes command streams of every instrument the shard map assigns
+        to shard, forever. The map is read again every third of the lease
+        TTL. An instrument is matched only under its lease: a worker takes
+        an instrument over after the previous owner dropped it or crashed
+        and let the lease expire, so it never has two writers.
+        :param shard: name of the shard in the shard map
+        :param consumer: name of consumer inside of the group, shard by default
+        """
+        consumer = consumer or shard
+        ttl = getattr(settings, 'ORDER_SHARD_LEASE_TTL', 30)
+        owned, last_ids, refreshed_at = set(), {}, -ttl
+        while True:
+            if time.monotonic() - refreshed_at >= ttl / 3:
+                owned = self._rebalance(shard, owned, ttl)
+                keys = {STREAM_KEY.format(i) for i in owned}
+                for key in set(last_ids) - keys:
+                    del last_ids[key]
+                for instrument_id in owned:
+                    key = STREAM_KEY.format(instrument_id)
+                    if key not in last_ids:
+                        self._join(instrument_id, consumer, takeover=True)
+                        last_ids[key] = '0'
+                refreshed_at = time.monotonic()
+            if not last_ids:
+                time.sleep(block / 1000)
+                continue
+            self._consume(last_ids, consumer, block, handler)
+
+    def _rebalance(self, shard, owned: {int}, ttl) -> {int}:
+        """
+        Drops leases of instruments moved to other shards and takes leases
+        of instruments moved here
+        :return: instruments whose lease is held by the shard
+        """
+        instrument_ids = list(
+            models.Instrument.objects.values_list('id', flat=True))
+        close_old_connections()
+        wanted = set(self.shard_map().owned(shard, instrument_ids))
+        renew = self.redis.register_script(RENEW_LEASE)
+        release = self.redis.register_script(RELEASE_LEASE)
+        for instrument_id in owned - wanted:
+            # everything read from its stream was processed and acknowledged
+            release(keys=[OWNER_KEY.format(instrument_id)], args=[shard])
+            # book goes stale as soon as the new owner matches, the journal
+            # belongs to the new owner and is left alone
+            order_books.discard(instrument_id)
+        leased = set()
+        for instrument_id in wanted:
+            key = OWNER_KEY.format(instrument_id)
+            if renew(keys=[key], args=[shard, ttl]) or self.redis.set(
+                    key, shard, nx=True, ex=ttl):
+                leased.add(instrument_id)
+        return leased
+
+    def _join(self, instrument_id, consumer, takeover=False) -> str:
+        """
+        Creates consumer group of instrument stream
+        :param takeover: claims commands left unacknowledged by other
+        consumers, e.g. by crashed previous owner of the instrument. Those
+        it already executed are acknowledged without running them again
+        :return: stream key
+        """
+        key = STREAM_KEY.format(instrument_id)
+        try:
+            self.redis.xgroup_create(key, CONSUMER_GROUP, mkstream=True)
+        except _redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        if takeover:
+            pending = self.redis.xpending_range(key, CONSUMER_GROUP, '-', '+',
+                                                1000)
+            message_ids = [
+                p['message_id'] for p in pending
+                if _decode(p['consumer']) != consumer
+            ]
+            if message_ids:
+                self.redis.xclaim(key, CONSUMER_GROUP, consumer, 0,
+                                  message_ids)
+        return key
+
+    def _executed(self, command_id: str) -> bool:
+        result = self.result(command_id)
+        return result is not None and result['status'] in (
+            CommandStatus.DONE.value, CommandStatus.ERROR.value)
+
+    def _consume(self, last_ids: {str: str}, consumer, block, handler):
+        response = self.redis.xreadgroup(CONSUMER_GROUP,
+                                         consumer,
+                                         last_ids,
+                                         count=100,
+                                         block=block)
+        for key, messages in response or []:
+            key = _decode(key)
+            # commands left unacknowledged by previous run go first
+            if not messages and last_ids[key] != '>':
+                last_ids[key] = '>'
+            for message_id, fields in messages:
+                command = json.loads(fields[b'command'])
+                # delivery is at least once, commands whose result was
+                # published before a crash are only acknowledged
+                if not self._executed(command['id']):
+                    self.publish(command['id'], handler(command))
+                self.redis.xack(key, CONSUMER_GROUP, message_id)
+                if last_ids[key] != '>':
+                    last_ids[key] = message_id
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+_sequencers = {}
+
+
+def reload_order_books(instrument_ids):
+    """
+    Makes matching workers reload books of instruments changed outside of
+    the sequencer, e.g. by bulk cancellation
+    """
+    order_sequencer = get_sequencer()
+    if order_sequencer is None:
+        return
+    for instrument_id in instrument_ids:
+        order_sequencer.submit(reload_command(instrument_id))
+
+
+def get_sequencer() -> Sequencer:
+    """
+    Returns sequencer chosen by ORDER_SEQUENCER setting, None when disabled
+    """
+    mode = getattr(settings, 'ORDER_SEQUENCER', SequencerMode.OFF.value)
+    if mode == SequencerMode.OFF.value:
+        return None
+    if mode not in _sequencers:
+        if mode == SequencerMode.LOCAL.value:
+            _sequencers[mode] = LocalSequencer()
+        elif mode == SequencerMode.REDIS.value:
+            _sequencers[mode] = RedisSequencer()
+        else:
+            raise ValueError(f'Unknown sequencer mode {mode}')
+    return _sequencers[mode]
@@ -1,9 +1,15 @@
+from collections import OrderedDict
+from decimal import Decimal
+
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.contrib.auth.password_validation import validate_password
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
 
 from client_api import celery as celery_tasks
-from client_user import models
+from client_user import models, sequencer
+from client_user.fixedpoint import SCALE, to_units
 
 
 class ClientUserSerializer(serializers.ModelSerializer):
@@ -30,6 +36,18 @@ class ClientUserSerializer(serializers.ModelSerializer):
 class InstrumentSerializer(serializers.ModelSerializer):
     name = serializers.CharField(max_length=50, required=True)
     status = serializers.CharField(max_length=30, read_only=True)
+    matching_mode = serializers.ChoiceField(
+        choices=[tag.value for tag in models.MatchingMode],
+        default=models.MatchingMode.CONTINUOUS.value)
+    issuer = serializers.PrimaryKeyRelatedField(read_only=True)
+    tick_size = serializers.DecimalField(max_digits=20,
+                                         decimal_places=8,
+                                         min_value=Decimal('0.00000001'),
+                                         required=False)
+    lot_size = serializers.DecimalField(max_digits=20,
+                                        decimal_places=8,
+                                        min_value=Decimal('0.00000001'),
+                                        required=False)
     # these ones for underlying credit
     credit_created_at_d = serializers.DateTimeField(required=False)
     credit_expires_at_d = serializers.DateTimeField(required=False)
@@ -44,7 +62,19 @@ class InstrumentSerializer(serializers.ModelSerializer):
         model = models.Instrument
         fields = '__all__'
 
+    def validate(self, attrs):
+        tick_size = attrs.get('tick_size', models.DEFAULT_TICK_SIZE)
+        lot_size = attrs.get('lot_size', models.DEFAULT_LOT_SIZE)
+        # cost of every order on the grid has to be exact in 8 decimal places
+        if to_units(tick_size) * to_units(lot_size) % SCALE:
+            raise serializers.ValidationError(
+                'Product of tick size and lot size has more than 8 decimal places'
+            )
+        return attrs
+
     def create(self, validated_data):
+        # whoever creates instrument issues it and holds unplaced assets
+        validated_data['issuer'] = self.context['request'].user
         return models.Instrument.objects.create(**validated_data)
 
     def update(self, instance, validated_data):
@@ -56,6 +86,14 @@ class InstrumentSerializer(serializers.ModelSerializer):
 class OrderSerializer(serializers.ModelSerializer):
     type = serializers.ChoiceField(
         choices=[tag.value for tag in models.OrderType])
+    kind = serializers.ChoiceField(
+        choices=[tag.value for tag in models.OrderKind],
+        default=models.OrderKind.LIMIT.value)
+    # market orders get their price from the book
+    price = serializers.DecimalField(max_digits=20,
+                                     decimal_places=8,
+                                     min_value=Decimal('0.00000001'),
+                                     required=False)
     status = serializers.ChoiceField(
         choices=[tag.value for tag in models.OrderStatus], read_only=True)
     instrument = InstrumentSerializer(read_only=True)
@@ -66,36 +104,55 @@ class OrderSerializer(serializers.ModelSerializer):
                                              read_only=True)
     total_sum = serializers.DecimalField(max_digits=20,
                                          decimal_places=8,
+                                         min_value=Decimal('0.00000001'),
                                          write_only=True)
     actual_price = serializers.DecimalField(max_digits=20,
                                             decimal_places=8,
                                             read_only=True)
+    expires_at_dt = serializers.DateTimeField(read_only=True)
 
     class Meta:
         model = models.Order
         fields = [
             'remaining_sum', 'type', 'status', 'expires_in', 'created_at_dt',
             'updated_at_dt', 'total_sum', 'instrument_id', 'instrument',
-            'user', 'price', 'actual_price'
+            'user', 'price', 'actual_price', 'expires_at_dt', 'kind',
+            'emulation_uuid'
         ]
 
+    def validate(self, attrs):
+        if attrs['kind'] != models.OrderKind.MARKET.value and attrs.get(
+                'price') is None:
+            raise serializers.ValidationError(
+                {'price': 'This field is required.'})
+        return attrs
+
+    @staticmethod
+    def build_order(validated_data, user_id) -> models.Order:
+        """
+        Creates unsaved order, market orders are priced from the book
+        """
+        order = models.Order(user_id=user_id, **validated_data)
+        order.remaining_sum = order.total_sum
+        if order.kind == models.OrderKind.MARKET.value:
+            order.price = models.Order.price_market_order(order)
+            if order.price is None:
+                raise serializers.ValidationError(
+                    'No counter orders for market order')
+        return order
+
     def create(self, validated_data):
         user = self.context['request'].user
-        if validated_data['type'] == models.OrderType.BUY.value:
-            balance = models.FiatBalance.objects.get(
-                user=user, currency__title='USD')  # TODO HARDCODE USD
-            if balance.amount < validated_data['total_sum'] * validated_data[
-                    'price']:
-                raise serializers.ValidationError('Not enough fiat balance')
-        elif validated_data['type'] == models.OrderType.SELL.value:
-            balance = models.InstrumentBalance.objects.get(
-                user=user, instrument=validated_data['instrument_id'])
-            if balance.amount < validated_data['total_sum']:
-                raise serializers.ValidationError(
-                    'Not enough instrument balance')
-        order = models.Order(user=user, **validated_data)
-        order.remaining_sum = order.total_sum
-        return models.Order.place_order(order)
+        order = self.build_order(validated_data, user.id)
+        order.user = user
+        # funds are held while the order is placed
+        order_sequencer = sequencer.get_sequencer()
+        try:
+            if order_sequencer is None:
+                return models.Order.place_order(order)
+            return order_sequencer.place_order(order)
+        except (models.OrderRejected, sequencer.CommandError) as e:
+            raise serializers.ValidationError(str(e))
 
     def update(self, instance, validated_data):
         instance.type = validated_data.get('type', instance.type)
@@ -113,9 +170,219 @@ class OrderSerializer(serializers.ModelSerializer):
         return instance
 
 
+class OrderBatchSerializer(serializers.Serializer):
+    """
+    Validates and places a list of orders. Orders are matched in submission
+    order, orders of one instrument share a single transaction.
+    Privileged users may place orders on behalf of others with `user_id`.
+    """
+    orders = serializers.ListField(child=serializers.DictField(),
+                                   allow_empty=False)
+
+    _available = F('amount') - F('reserved')
+
+    @staticmethod
+    def _error(errors):
+        return {'status': 'error', 'result': errors}
+
+    def create(self, validated_data):
+        request = self.context['request']
+        results = [None] * len(validated_data['orders'])
+        pending = []
+        for index, data in enumerate(validated_data['orders']):
+            data = dict(data)
+            try:
+                user_id = serializers.IntegerField().run_validation(
+                    data.pop('user_id', request.user.id))
+            except serializers.ValidationError as e:
+                results[index] = self._error({'user_id': e.detail})
+                continue
+            if user_id != request.user.id and not request.user.is_superuser:
+                results[index] = self._error(
+                    'Not allowed to place orders for other users')
+                continue
+            serializer = OrderSerializer(data=data)
+            if not serializer.is_valid():
+                results[index] = self._error(serializer.errors)
+                continue
+            try:
+                order = OrderSerializer.build_order(serializer.validated_data,
+                                                    user_id)
+            except serializers.ValidationError as e:
+                results[index] = self._error(e.detail)
+                continue
+            pending.append((index, order))
+        pending = self._check_users(pending, results)
+        pending = self._check_funds(pending, results)
+        order_sequencer = sequencer.get_sequencer()
+        if order_sequencer is None:
+            self._place(pending, results)
+        else:
+            self._place_through_sequencer(order_sequencer, pending, results)
+        return results
+
+    def _check_users(self, pending, results):
+        """
+        Checks users orders are placed for with one query
+        """
+        user_ids = set(
+            models.ClientUser.objects.filter(
+                id__in={order.user_id
+                        for _, order in pending}).values_list('id', flat=True))
+        accepted = []
+        for index, order in pending:
+            if order.user_id not in user_ids:
+                results[index] = self._error({'user_id': 'User not found'})
+                continue
+            accepted.append((index, order))
+        return accepted
+
+    def _check_funds(self, pending, results):
+        """
+        Checks available balances of all orders with one query per balance
+        model, orders of the same user consume the balance in submission
+        order. Funds are held later, when each order is placed.
+        """
+        instruments = models.Instrument.objects.in_bulk(
+            {order.instrument_id
+             for _, order in pending})
+        user_ids = {order.user_id for _, order in pending}
+        fiat_balances = dict(
+            models.FiatBalance.objects.filter(
+                user_id__in=user_ids,
+                currency__title=models.TRADING_CURRENCY).annotate(
+                    available=self._available).values_list(
+                        'user_id', 'available'))
+        instrument_balances = {
+            (user_id, instrument_id): amount
+            for user_id, instrument_id, amount in models.InstrumentBalance.
+            objects.filter(user_id__in=user_ids,
+                           instrument_id__in=list(instruments)).annotate(
+                               available=self._available).values_list(
+                                   'user_id', 'instrument_id', 'available')
+        }
+        accepted = []
+        for index, order in pending:
+            if order.instrument_id not in instruments:
+                results[index] = self._error('Instrument not found')
+                continue
+            order.instrument = instruments[order.instrument_id]
+            if order.type == models.OrderType.BUY.value:
+                balances, key = fiat_balances, order.user_id
+                required = order.total_sum * order.price
+                error = 'Not enough fiat balance'
+            else:
+                balances, key = instrument_balances, (order.user_id,
+                                                      order.instrument_id)
+                required = order.total_sum
+                error = 'Not enough instrument balance'
+            if balances.get(key, 0) < required:
+                results[index] = self._error(error)
+                continue
+            balances[key] -= required
+            accepted.append((index, order))
+        return accepted
+
+    def _place(self, pending, results):
+        by_instrument = OrderedDict()
+        for index, order in pending:
+            by_instrument.setdefault(order.instrument_id, []).append(
+                (index, order))
+        engine = getattr(settings, 'ORDER_BOOK_ENGINE',
+                         models.OrderBookEngine.DATABASE.value)
+        for orders in by_instrument.values():
+            if engine == models.OrderBookEngine.MEMORY.value:
+                # in-memory books change right after the trades of every
+                # order are committed, an outer transaction would leave
+                # them with fills that may still be rolled back
+                self._place_orders(orders, results)
+                continue
+            with transaction.atomic():
+                self._place_orders(orders, results)
+
+    def _place_orders(self, orders, results):
+        for index, order in orders:
+            try:
+                with transaction.atomic():
+                    order = models.Order.place_order(order)
+            except ValueError as e:
+                results[index] = self._error(str(e))
+                continue
+            results[index] = {
+                'status': 'ok',
+                'result': OrderSerializer(order).data
+            }
+
+    def _place_through_sequencer(self, order_sequencer, pending, results):
+        commands = []
+        for index, order in pending:
+            command = sequencer.place_order_command(order)
+            order_sequencer.submit(command)
+            commands.append((index, command['id']))
+        timeout = getattr(settings, 'ORDER_SEQUENCER_TIMEOUT', 10)
+        for index, command_id in commands:
+            result = order_sequencer.wait(command_id, timeout)
+            if result is None:
+                results[index] = {
+                    'status': sequencer.CommandStatus.PENDING.value,
+                    'command_id': command_id
+                }
+                continue
+            try:
+                order = order_sequencer.resolve(result)
+            except sequencer.CommandError as e:
+                results[index] = self._error(str(e))
+                continue
+            results[index] = {
+                'status': 'ok',
+                'result': OrderSerializer(order).data
+            }
+
+
+class OrderCancelSerializer(serializers.Serializer):
+    """
+    Scope of bulk cancellation, ordinary users may only cancel own orders
+    """
+    instrument_id = serializers.IntegerField(required=False)
+    user_id = serializers.IntegerField(required=False)
+    type = serializers.ChoiceField(
+        choices=[tag.value for tag in models.OrderType], required=False)
+    emulation_uuid = serializers.UUIDField(required=False)
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        filters = dict(validated_data)
+        if not user.is_superuser:
+            if filters.get('user_id', user.id) != user.id:
+                raise exceptions.PermissionDenied(
+                    'Not allowed to cancel orders of other users')
+            filters['user_id'] = user.id
+        cancelled, instrument_ids = models.Order.cancel_orders(**filters)
+        sequencer.reload_order_books(instrument_ids)
+        return cancelled
+
+
+def _update_amount(instance, amount):
+    """
+    Sets balance amount with one conditional UPDATE, so it can not drop
+    below funds held by orders placed at the same time. Reserved belongs
+    to matching and is never written here.
+    """
+    updated = type(instance).objects.filter(
+        pk=instance.pk, reserved__lte=amount).update(amount=amount)
+    if not updated:
+        raise serializers.ValidationError(
+            {'amount': 'Amount is lower than funds held by active orders'})
+    instance.amount = amount
+    return instance
+
+
 class FiatBalanceSerializer(serializers.ModelSerializer):
     currency = serializers.StringRelatedField(read_only=True)
     user = serializers.ReadOnlyField(source='user.id')
+    reserved = serializers.DecimalField(max_digits=20,
+                                        decimal_places=8,
+                                        read_only=True)
 
     class Meta:
         model = models.FiatBalance
@@ -123,14 +390,15 @@ class FiatBalanceSerializer(serializers.ModelSerializer):
         lookup_field = 'id'
 
     def update(self, instance, validated_data):
-        instance.amount = validated_data.get('amount', 0)
-        instance.save()
-        return instance
+        return _update_amount(instance, validated_data.get('amount', 0))
 
 
 class InstrumentBalanceSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.id')
     instrument = serializers.ReadOnlyField(source='instrument.id')
+    reserved = serializers.DecimalField(max_digits=20,
+                                        decimal_places=8,
+                                        read_only=True)
 
     class Meta:
         model = models.InstrumentBalance
@@ -138,24 +406,4 @@ class InstrumentBalanceSerializer(serializers.ModelSerializer):
         lookup_field = 'id'
 
     def update(self, instance, validated_data):
-        instance.amount = validated_data.get('amount', 0)
-        instance.save()
-        return instance
-
-
-class OrderPriceHistorySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = models.OrderPriceHistory
-        fields = ('price', )
-
-
-class LiquidityRateSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = models.LiquidityHistory
-        fields = ('value', )
-
-
-class PlacementRateSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = models.PlacedAssetsHistory
-        fields = ('value', )
+        return _update_amount(instance, validated_data.get('amount', 0))
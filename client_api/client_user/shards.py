@@ -0,0 +1,43 @@
+import bisect
+import hashlib
+
+
+def _hash(key: str) -> int:
+    # built-in hash() is salted per process, workers have to agree
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class ShardMap:
+    """
+    Consistent hash ring assigning instruments to matching shards.
+    Every shard is put on the ring `replicas` times and an instrument
+    belongs to the first shard point following its own hash, so adding or
+    removing one of N shards moves only about 1/N of instruments.
+    """
+
+    def __init__(self, shards, replicas=64):
+        self.shards = sorted(set(shards))
+        self.replicas = replicas
+        points = sorted((_hash(f'{shard}#{replica}'), shard)
+                        for shard in self.shards
+                        for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def __len__(self):
+        return len(self.shards)
+
+    def owner(self, instrument_id) -> str:
+        if not self._hashes:
+            raise ValueError('Shard map has no shards')
+        index = bisect.bisect(self._hashes, _hash(str(instrument_id)))
+        return self._shards[index % len(self._shards)]
+
+    def owned(self, shard, instrument_ids) -> [int]:
+        return [i for i in instrument_ids if self.owner(i) == shard]
+
+    def assignment(self, instrument_ids) -> {str: [int]}:
+        result = {shard: [] for shard in self.shards}
+        for instrument_id in instrument_ids:
+            result[self.owner(instrument_id)].append(instrument_id)
+        return result
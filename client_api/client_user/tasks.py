@@ -0,0 +1,22 @@
+from client_api.celery import app
+from client_user import models, retention
+
+
+@app.task(name='expire_orders')
+def expire_orders_task():
+    return models.Order.expire_orders()
+
+
+@app.task(name='clear_auctions')
+def clear_auctions_task():
+    instrument_ids = models.Instrument.objects.filter(
+        status=models.InstrumentStatus.ACTIVE.value,
+        matching_mode=models.MatchingMode.AUCTION.value).values_list('id',
+                                                                     flat=True)
+    for instrument_id in instrument_ids:
+        models.Order.clear_auction(instrument_id)
+
+
+@app.task(name='apply_stats_retention')
+def apply_stats_retention_task():
+    return retention.apply_retention()
@@ -0,0 +1,112 @@
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from client_user import book_journal, models
+from client_user.fixedpoint import to_units
+from client_user.orderbook import BookEntry, OrderBook, order_books
+from client_user.tests_module.utils import Fixtures, OrderBooksMixin
+
+
+class BookJournalTestCase(SimpleTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.journal = book_journal.FileBookJournal(self.path,
+                                                    snapshot_every=3)
+        self.book = OrderBook(instrument_id=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _apply(self, *events):
+        for event in events:
+            self.book.apply(event)
+        self.journal.record(self.book, list(events))
+
+    def _add_event(self, order_id, is_buy, price, amount):
+        return self.book.add_event(
+            BookEntry(order_id=order_id,
+                      user_id=1,
+                      is_buy=is_buy,
+                      price=to_units(price),
+                      remaining_sum=to_units(amount),
+                      created_at_dt=timezone.now()))
+
+    def test_snapshot_and_log_restore_book(self):
+        self.journal.save_snapshot(self.book)
+        self._apply(self._add_event(1, False, '1', 10),
+                    self._add_event(2, False, '1', 5))
+        self._apply(self.book.fill_event(1, to_units(4)),
+                    self._add_event(3, True, '0.9', 7))
+        # fourth event triggered a snapshot, log is empty again
+        self.assertEqual(self.journal.read(1)[1], [])
+        self._apply(self.book.remove_event(3))
+        recovered = self.journal.recover(1)
+        self.assertEqual(recovered.seq, self.book.seq)
+        fills = recovered.match(True, to_units(1), to_units(100))
+        self.assertEqual([(e.order_id, e.remaining_sum) for e, _ in fills],
+                         [(1, to_units(6)), (2, to_units(5))])
+        self.assertIsNone(recovered.best_bid())
+
+    def test_gap_in_log_fails_recovery(self):
+        self.journal.save_snapshot(self.book)
+        self.book.apply(self._add_event(1, False, '1', 10))
+        self._apply(self._add_event(2, False, '1', 5))
+        self.assertIsNone(self.journal.recover(1))
+
+    def test_incomplete_journal_can_not_be_created(self):
+        class AppendOnly(book_journal.BookJournal):
+            def append(self, instrument_id, events):
+                pass
+
+        with self.assertRaises(TypeError):
+            AppendOnly()
+
+
+@override_settings(ORDER_BOOK_ENGINE=models.OrderBookEngine.MEMORY.value,
+                   ORDER_BOOK_JOURNAL=book_journal.JournalMode.FILE.value)
+class BookRecoveryTestCase(OrderBooksMixin, TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        book_journal._journals.clear()
+        super().setUp()
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 0)
+        self.instrument = Fixtures.create_instrument()
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 100)
+        Fixtures.change_fiat_balance(self.user2, 100)
+
+    def tearDown(self):
+        super().tearDown()
+        book_journal._journals.clear()
+        shutil.rmtree(self.path)
+
+    def test_book_is_recovered_from_journal(self):
+        with self.settings(ORDER_BOOK_JOURNAL_PATH=self.path):
+            Fixtures.place_order(self.user1, self.instrument,
+                                 models.OrderType.SELL.value, 50, 2)
+            Fixtures.place_order(self.user2, self.instrument,
+                                 models.OrderType.BUY.value, 20, 2)
+            Fixtures.place_order(self.user2, self.instrument,
+                                 models.OrderType.BUY.value, 10, 1)
+            # restart of the process
+            order_books.clear()
+            with self.assertNumQueries(1):
+                book = order_books.get(self.instrument.id,
+                                       models.Order.load_order_book)
+            self.assertEqual((book.best_bid(), book.best_ask()),
+                             (to_units(1), to_units(2)))
+            self.assertEqual(book.total(), to_units(40))
+
+    def test_stale_journal_falls_back_to_orders(self):
+        with self.settings(ORDER_BOOK_JOURNAL_PATH=self.path):
+            Fixtures.place_order(self.user1, self.instrument,
+                                 models.OrderType.SELL.value, 50, 2)
+            order_books.clear()
+            # change the journal knows nothing about
+            models.Order.objects.update(remaining_sum=30)
+            book = order_books.get(self.instrument.id,
+                                   models.Order.load_order_book)
+            self.assertEqual(book.total(), to_units(30))
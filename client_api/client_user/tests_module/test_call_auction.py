@@ -0,0 +1,112 @@
+from decimal import Decimal
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from client_user import auction, models
+from client_user.fixedpoint import from_units, to_units
+from client_user.tests_module.utils import Fixtures
+
+
+class ClearingPriceTestCase(SimpleTestCase):
+    def _clear(self, bids, asks, tick='0.0001'):
+        price, volume = auction.clearing_price(
+            auction.as_array(to_units(p) for p, _ in bids),
+            auction.as_array(to_units(s) for _, s in bids),
+            auction.as_array(to_units(p) for p, _ in asks),
+            auction.as_array(to_units(s) for _, s in asks), to_units(tick))
+        if price is None:
+            return None, 0
+        return from_units(price), from_units(volume)
+
+    def test_maximizes_volume(self):
+        price, volume = self._clear(bids=[('3', '10'), ('2', '10')],
+                                    asks=[('1', '5'), ('2', '10'),
+                                          ('4', '10')])
+        self.assertEqual((price, volume), (2, 15))
+
+    def test_ties_are_cleared_at_candidate_price(self):
+        self.assertEqual(self._clear(bids=[('3', '10')], asks=[('1', '10')]),
+                         (1, 10))
+        self.assertEqual(
+            self._clear(bids=[('1.0001', '1')], asks=[('1', '1')]), (1, 1))
+
+    def test_price_is_on_tick_grid(self):
+        # volume is the one traded at the snapped price
+        self.assertEqual(
+            self._clear(bids=[('3.5', '10')], asks=[('3.5', '10')], tick=1),
+            (3, 0))
+
+    def test_book_not_crossed(self):
+        self.assertEqual(self._clear(bids=[('1', '10')], asks=[('2', '10')]),
+                         (None, 0))
+        self.assertEqual(
+            auction.clearing_price(*[np.array([], dtype=np.int64)] * 4),
+            (None, 0))
+
+
+class CallAuctionTestCase(TestCase):
+    def setUp(self):
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 0)
+        self.instrument = Fixtures.create_instrument()
+        self.instrument.matching_mode = models.MatchingMode.AUCTION.value
+        self.instrument.save()
+
+    def test_orders_are_cleared_at_one_price(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 30)
+        Fixtures.change_fiat_balance(self.user2, 100)
+        sells = [
+            Fixtures.place_order(self.user1, self.instrument,
+                                 models.OrderType.SELL.value, 10, price)
+            for price in (1, 2, 4)
+        ]
+        buys = [
+            Fixtures.place_order(self.user2, self.instrument,
+                                 models.OrderType.BUY.value, 10, price)
+            for price in (3, 2)
+        ]
+        # nothing trades until the auction is cleared
+        self.assertFalse(models.Trade.objects.exists())
+        price, volume = models.Order.clear_auction(self.instrument.id)
+        self.assertEqual((price, volume), (2, 20))
+        for order in sells + buys:
+            order.refresh_from_db()
+        self.assertEqual([o.status for o in sells], [
+            models.OrderStatus.COMPLETED.value,
+            models.OrderStatus.COMPLETED.value, models.OrderStatus.ACTIVE.value
+        ])
+        self.assertTrue(
+            all(o.status == models.OrderStatus.COMPLETED.value for o in buys))
+        self.assertTrue(all(t.price == 2 for t in models.Trade.objects.all()))
+        fiat = models.FiatBalance.objects.get(user=self.user2)
+        self.assertEqual(fiat.amount, 60)
+        self.assertEqual(fiat.reserved, 0)
+        self.assertEqual(
+            models.FiatBalance.objects.get(user=self.user1).amount, 40)
+        balance = models.InstrumentBalance.objects.get(
+            user=self.user1, instrument=self.instrument)
+        self.assertEqual((balance.amount, balance.reserved), (10, 10))
+
+    def test_tied_auction_trades_on_tick_grid(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 1)
+        Fixtures.change_fiat_balance(self.user2, 2)
+        Fixtures.place_order(self.user1, self.instrument,
+                             models.OrderType.SELL.value, 1, 1)
+        Fixtures.place_order(self.user2, self.instrument,
+                             models.OrderType.BUY.value, 1, Decimal('1.0001'))
+        self.assertEqual(models.Order.clear_auction(self.instrument.id),
+                         (1, 1))
+        self.assertEqual(models.Trade.objects.get().price, 1)
+
+    def test_only_limit_orders_are_collected(self):
+        Fixtures.change_fiat_balance(self.user2, 100)
+        with self.assertRaises(models.OrderRejected):
+            Fixtures.place_order(self.user2,
+                                 self.instrument,
+                                 models.OrderType.BUY.value,
+                                 10,
+                                 1,
+                                 kind=models.OrderKind.IOC.value)
+        self.assertEqual(models.Order.clear_auction(self.instrument.id),
+                         (None, 0))
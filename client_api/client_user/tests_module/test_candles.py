@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from client_user import models
+from client_user.candles import Bar, roll_up, trade_bars
+from client_user.tests_module.utils import Fixtures
+
+START = datetime(2020, 1, 1, 11, 58, 30, tzinfo=timezone.utc)
+
+
+class RollUpTestCase(SimpleTestCase):
+    def test_trades_are_rolled_up(self):
+        bars = trade_bars([
+            (START, Decimal(2), Decimal(1)),
+            (START + timedelta(seconds=20), Decimal(5), Decimal(2)),
+            (START + timedelta(seconds=40), Decimal(1), Decimal(3)),
+            (START + timedelta(minutes=2), Decimal(3), Decimal(4)),
+        ])
+        minute = START.replace(second=0)
+        self.assertEqual(bars['1m'], [
+            Bar(minute, 2, 5, 2, 5, 3),
+            Bar(minute + timedelta(minutes=1), 1, 1, 1, 1, 3),
+            Bar(minute + timedelta(minutes=2), 3, 3, 3, 3, 4),
+        ])
+        self.assertEqual(bars['5m'], [
+            Bar(START.replace(minute=55, second=0), 2, 5, 1, 1, 6),
+            Bar(START.replace(hour=12, minute=0, second=0), 3, 3, 3, 3, 4),
+        ])
+        self.assertEqual(bars['1d'], [
+            Bar(START.replace(hour=0, minute=0, second=0), 2, 5, 1, 3, 10),
+        ])
+        self.assertEqual(roll_up(bars['1h'], '1d'), bars['1d'])
+
+
+class CandleTestCase(TestCase):
+    url = '/api/v1/user/candles/'
+
+    def setUp(self):
+        self.seller = Fixtures.create_user('pes@mail.ru', 0)
+        self.buyer = Fixtures.create_user('psina@mail.ru', 1000)
+        self.instrument = Fixtures.create_instrument()
+        Fixtures.change_instrument_balance(self.seller, self.instrument, 100)
+        # market data is public, like prices and depth
+        self.client = APIClient()
+
+    def _trade(self, moment, amount, price):
+        with mock.patch('django.utils.timezone.now', return_value=moment):
+            for user, type in ((self.seller, models.OrderType.SELL.value),
+                               (self.buyer, models.OrderType.BUY.value)):
+                Fixtures.place_order(user, self.instrument, type, amount,
+                                     price)
+
+    def _bars(self, **params):
+        response = self.client.get(self.url, {
+            'instrument_id': self.instrument.id,
+            **params
+        })
+        self.assertEqual(response.status_code, 200)
+        return [(bar['open'], bar['high'], bar['low'], bar['close'],
+                 bar['volume']) for bar in response.data['result']]
+
+    def test_fills_update_candles(self):
+        self._trade(START, 10, 2)
+        self._trade(START + timedelta(seconds=10), 5, 3)
+        self._trade(START + timedelta(minutes=1), 1, 1)
+        self.assertEqual(self._bars(), [(2, 3, 2, 3, 15), (1, 1, 1, 1, 1)])
+        self.assertEqual(self._bars(resolution='5m'), [(2, 3, 1, 1, 16)])
+        self.assertEqual(self._bars(limit=1), [(1, 1, 1, 1, 1)])
+        self.assertEqual(
+            self._bars(**{
+                'from': START.replace(second=0).isoformat(),
+                'limit': 1
+            }), [(2, 3, 2, 3, 15)])
+        self.assertEqual(
+            self._bars(to=(START + timedelta(seconds=30)).isoformat()),
+            [(2, 3, 2, 3, 15)])
+
+        fields = ('resolution', 'start_dt', 'open', 'high', 'low', 'close',
+                  'volume')
+        bars = models.Candle.objects.order_by(*fields[:2]).values_list(*fields)
+        incremental = list(bars)
+        self.assertEqual(models.Candle.rebuild(), len(incremental))
+        self.assertEqual(list(bars), incremental)
+
+    def test_bad_resolution(self):
+        response = self.client.get(self.url, {
+            'instrument_id': self.instrument.id,
+            'resolution': '2m'
+        })
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'instrument_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
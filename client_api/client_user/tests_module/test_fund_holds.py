@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from client_user import models
+from client_user.tests_module.utils import Fixtures, OrderBooksMixin
+
+
+class FundHoldsTestCase(OrderBooksMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 0)
+        self.instrument = Fixtures.create_instrument()
+
+    def _fiat(self, user):
+        return models.FiatBalance.objects.get(user=user)
+
+    def _instrument(self, user):
+        return models.InstrumentBalance.objects.get(user=user,
+                                                    instrument=self.instrument)
+
+    def test_resting_order_holds_funds(self):
+        Fixtures.change_fiat_balance(self.user2, 100)
+        order = Fixtures.place_order(self.user2, self.instrument,
+                                     models.OrderType.BUY.value, 40, 2)
+        self.assertEqual(order.held_sum, 80)
+        self.assertEqual(self._fiat(self.user2).reserved, 80)
+        with self.assertRaises(models.InsufficientFunds):
+            Fixtures.place_order(self.user2, self.instrument,
+                                 models.OrderType.BUY.value, 30, 1)
+        self.assertEqual(self._fiat(self.user2).reserved, 80)
+
+    def test_fill_consumes_hold(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 100)
+        Fixtures.change_fiat_balance(self.user2, 300)
+        sell_order = Fixtures.place_order(self.user1, self.instrument,
+                                          models.OrderType.SELL.value, 100, 1)
+        self.assertEqual(self._instrument(self.user1).reserved, 100)
+        # buyer holds its limit price and trades at the better resting one
+        Fixtures.place_order(self.user2, self.instrument,
+                             models.OrderType.BUY.value, 60, 2)
+        sell_order.refresh_from_db()
+        self.assertEqual(sell_order.held_sum, 40)
+        self.assertEqual(self._instrument(self.user1).reserved, 40)
+        fiat = self._fiat(self.user2)
+        self.assertEqual(fiat.amount, 240)
+        self.assertEqual(fiat.reserved, 0)
+
+    def test_cancel_and_expiry_release_holds(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 10)
+        Fixtures.change_fiat_balance(self.user2, 10)
+        Fixtures.place_order(self.user1, self.instrument,
+                             models.OrderType.SELL.value, 10, 5)
+        Fixtures.place_order(self.user2, self.instrument,
+                             models.OrderType.BUY.value, 10, 1)
+        models.Order.cancel_orders(user_id=self.user1.id)
+        self.assertEqual(self._instrument(self.user1).reserved, 0)
+        self.assertEqual(self._fiat(self.user2).reserved, 10)
+        models.Order.expire_orders(timezone.now() + timedelta(hours=2))
+        self.assertEqual(self._fiat(self.user2).reserved, 0)
+        self.assertFalse(models.Order.objects.filter(held_sum__gt=0).exists())
+
+    def test_other_currencies_are_left_alone(self):
+        self.user2.assign_fiat_balance('EUR')
+        models.FiatBalance.objects.filter(user=self.user2).update(amount=100)
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 10)
+        Fixtures.place_order(self.user2, self.instrument,
+                             models.OrderType.BUY.value, 40, 2)
+        Fixtures.place_order(self.user1, self.instrument,
+                             models.OrderType.SELL.value, 10, 2)
+        models.Order.cancel_orders(user_id=self.user2.id)
+        rows = models.FiatBalance.objects.filter(user=self.user2).values_list(
+            'currency__title', 'amount', 'reserved')
+        balances = {
+            title: (amount, reserved)
+            for title, amount, reserved in rows
+        }
+        self.assertEqual(balances, {
+            models.TRADING_CURRENCY: (80, 0),
+            'EUR': (100, 0)
+        })
+
+    def test_ioc_remainder_is_released(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 5)
+        Fixtures.change_fiat_balance(self.user2, 10)
+        Fixtures.place_order(self.user1, self.instrument,
+                             models.OrderType.SELL.value, 5, 1)
+        order = Fixtures.place_order(self.user2,
+                                     self.instrument,
+                                     models.OrderType.BUY.value,
+                                     10,
+                                     1,
+                                     kind=models.OrderKind.IOC.value)
+        self.assertEqual(order.status, models.OrderStatus.CANCELLED.value)
+        self.assertEqual(order.held_sum, 0)
+        fiat = self._fiat(self.user2)
+        self.assertEqual(fiat.amount, 5)
+        self.assertEqual(fiat.reserved, 0)
+
+    def test_failed_hold_writes_nothing(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 10)
+        Fixtures.change_fiat_balance(self.user2, 5)
+        Fixtures.place_order(self.user1, self.instrument,
+                             models.OrderType.SELL.value, 10, 1)
+        with self.assertRaises(models.InsufficientFunds):
+            Fixtures.place_order(self.user2, self.instrument,
+                                 models.OrderType.BUY.value, 10, 1)
+        self.assertEqual(self._fiat(self.user2).amount, 5)
+        self.assertEqual(self._instrument(self.user1).reserved, 10)
+        self.assertFalse(models.Trade.objects.exists())
+
+    def test_balance_put_keeps_reserved_funds(self):
+        Fixtures.change_fiat_balance(self.user2, 100)
+        Fixtures.place_order(self.user2, self.instrument,
+                             models.OrderType.BUY.value, 40, 2)
+        client = APIClient()
+        client.force_authenticate(self.user2)
+        response = client.put('/api/v1/user/fiat-balance/', {'amount': 50},
+                              format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._fiat(self.user2).amount, 100)
+        response = client.put('/api/v1/user/fiat-balance/', {'amount': 80},
+                              format='json')
+        self.assertEqual(response.status_code, 200)
+        fiat = self._fiat(self.user2)
+        self.assertEqual((fiat.amount, fiat.reserved), (80, 80))
+
+    def test_orders_should_be_positive(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 10)
+        with self.assertRaises(models.OrderRejected):
+            Fixtures.place_order(self.user1, self.instrument,
+                                 models.OrderType.SELL.value, -5, 1)
+        with self.assertRaises(models.OrderRejected):
+            Fixtures.place_order(self.user1, self.instrument,
+                                 models.OrderType.SELL.value, 5, 0)
+        client = APIClient()
+        client.force_authenticate(self.user1)
+        for total_sum, price in ((-5, 1), (5, -1)):
+            data = {
+                'type': models.OrderType.SELL.value,
+                'instrument_id': self.instrument.id,
+                'total_sum': total_sum,
+                'price': price,
+                'expires_in': 3600,
+            }
+            response = client.post('/api/v1/user/orders/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.Order.objects.exists())
+        balance = models.InstrumentBalance.objects.get(
+            user=self.user1, instrument=self.instrument)
+        self.assertEqual((balance.amount, balance.reserved), (10, 0))
@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from client_user import models
+from client_user.tests_module.utils import Fixtures, OrderBooksMixin
+
+
+class OrderBatchTestCase(OrderBooksMixin, TestCase):
+    url = '/api/v1/user/orders/batch/'
+
+    def setUp(self):
+        super().setUp()
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 150)
+        self.service = models.ClientUser.objects.create_superuser(
+            'service@mail.ru', 'password')
+        self.instrument = Fixtures.create_instrument()
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 100)
+        self.client = APIClient()
+
+    def _order(self, type, amount, price, **extra):
+        return dict(type=type,
+                    total_sum=amount,
+                    price=price,
+                    expires_in=60,
+                    instrument_id=self.instrument.id,
+                    **extra)
+
+    def test_batch_is_matched_in_submission_order(self):
+        self.client.force_authenticate(self.service)
+        orders = [
+            self._order('sell', 100, 1, user_id=self.user1.id),
+            self._order('buy', 100, 1, user_id=self.user2.id),
+            self._order('buy', 100, 1, user_id=self.user2.id),
+            self._order('buy', 100, 1),
+        ]
+        response = self.client.post(self.url, orders, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['result']
+        self.assertEqual([r['status'] for r in results],
+                         ['ok', 'ok', 'error', 'error'])
+        self.assertEqual(results[1]['result']['status'],
+                         models.OrderStatus.COMPLETED.value)
+        self.assertEqual(
+            models.Order.objects.get(user=self.user1).status,
+            models.OrderStatus.COMPLETED.value)
+        self.assertEqual(results[2]['result'], 'Not enough fiat balance')
+        self.assertEqual(
+            models.FiatBalance.objects.get(user=self.user1).amount, 100)
+
+    def test_ordinary_user_can_not_place_for_others(self):
+        self.client.force_authenticate(self.user2)
+        orders = [
+            self._order('buy', 10, 1, user_id=self.user1.id),
+            self._order('buy', 10, 1),
+            self._order('buy', 10, None),
+        ]
+        response = self.client.post(self.url, {'orders': orders},
+                                    format='json')
+        results = response.data['result']
+        self.assertEqual([r['status'] for r in results],
+                         ['error', 'ok', 'error'])
+        self.assertIn('price', results[2]['result'])
+
+    def test_user_id_is_validated(self):
+        self.client.force_authenticate(self.service)
+        orders = [
+            self._order('sell', 10, 1, user_id=str(self.user1.id)),
+            self._order('sell', 10, 1, user_id=self.user2.id + 100),
+            self._order('sell', 10, 1, user_id='abc'),
+        ]
+        response = self.client.post(self.url, orders, format='json')
+        results = response.data['result']
+        self.assertEqual([r['status'] for r in results],
+                         ['ok', 'error', 'error'])
+        self.assertIn('user_id', results[1]['result'])
+        self.assertIn('user_id', results[2]['result'])
+
+    def test_memory_engine_places_orders_in_own_transactions(self):
+        self.client.force_authenticate(self.service)
+        place_order = models.Order.place_order
+        depths = []
+
+        def place(order):
+            depths.append(len(connection.savepoint_ids))
+            return place_order(order)
+
+        with mock.patch.object(models.Order, 'place_order', side_effect=place):
+            for engine in models.OrderBookEngine:
+                with self.settings(ORDER_BOOK_ENGINE=engine.value):
+                    self.client.post(
+                        self.url,
+                        [self._order('sell', 10, 5, user_id=self.user1.id)],
+                        format='json')
+        database, memory = depths
+        # no transaction of the whole instrument around memory placements
+        self.assertEqual(memory, database - 1)
+        self.assertEqual(models.Order.objects.count(), 2)
@@ -0,0 +1,97 @@
+from django.test import TestCase, override_settings
+
+from client_user import models
+from client_user.fixedpoint import to_units
+from client_user.orderbook import BookEntry, OrderBook, order_books
+from client_user.tests_module.utils import Fixtures, OrderBooksMixin
+
+
+class OrderBookTestCase(TestCase):
+    def setUp(self):
+        self.book = OrderBook(instrument_id=1)
+
+    def _entry(self, order_id, is_buy, price, amount):
+        return BookEntry(order_id=order_id,
+                         user_id=1,
+                         is_buy=is_buy,
+                         price=to_units(price),
+                         remaining_sum=to_units(amount),
+                         created_at_dt=None)
+
+    def test_best_prices(self):
+        self.book.add(self._entry(1, True, '0.9', 10))
+        self.book.add(self._entry(2, True, '0.95', 10))
+        self.book.add(self._entry(3, False, '1.1', 10))
+        self.book.add(self._entry(4, False, '1.05', 10))
+        self.assertEqual(self.book.best_bid(), to_units('0.95'))
+        self.assertEqual(self.book.best_ask(), to_units('1.05'))
+        self.book.remove(2)
+        self.assertEqual(self.book.best_bid(), to_units('0.9'))
+
+    def test_match_price_time_priority(self):
+        self.book.add(self._entry(1, False, '1.1', 10))
+        self.book.add(self._entry(2, False, '1', 10))
+        self.book.add(self._entry(3, False, '1', 10))
+        fills = self.book.match(True, to_units('1.1'), to_units(25))
+        self.assertEqual([(entry.order_id, amount) for entry, amount in fills],
+                         [(2, to_units(10)), (3, to_units(10)),
+                          (1, to_units(5))])
+        self.assertEqual(len(self.book), 3)
+
+    def test_match_does_not_cross_limit(self):
+        self.book.add(self._entry(1, True, '0.9', 10))
+        self.assertEqual(self.book.match(False, to_units('1'), to_units(5)),
+                         [])
+
+    def test_fill_removes_completed_order(self):
+        self.book.add(self._entry(1, False, '1', 10))
+        self.book.fill(1, to_units(4))
+        self.assertEqual(self.book.get(1).remaining_sum, to_units(6))
+        self.book.fill(1, to_units(6))
+        self.assertNotIn(1, self.book)
+        self.assertIsNone(self.book.best_ask())
+
+
+@override_settings(ORDER_BOOK_ENGINE=models.OrderBookEngine.MEMORY.value)
+class MemoryEngineTestCase(OrderBooksMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 0)
+        self.instrument = Fixtures.create_instrument()
+
+    def test_place_and_match(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 900)
+        Fixtures.change_fiat_balance(self.user2, 900)
+        buy_orders = [
+            Fixtures.place_order(self.user2, self.instrument,
+                                 models.OrderType.BUY.value, 300, 1)
+            for _ in range(2)
+        ]
+        book = order_books.get(self.instrument.id, None)
+        self.assertEqual(book.best_bid(), to_units(1))
+        sell_order = Fixtures.place_order(self.user1, self.instrument,
+                                          models.OrderType.SELL.value, 900, 1)
+        for order in buy_orders:
+            order.refresh_from_db()
+            self.assertEqual(order.status, models.OrderStatus.COMPLETED.value)
+        self.assertEqual(sell_order.status, models.OrderStatus.ACTIVE.value)
+        self.assertEqual(sell_order.remaining_sum, 300)
+        self.assertIsNone(book.best_bid())
+        self.assertEqual(book.best_ask(), to_units(1))
+        self.assertEqual(
+            models.FiatBalance.objects.get(user=self.user1).amount, 600)
+        self.assertEqual(
+            models.InstrumentBalance.objects.get(
+                user=self.user2, instrument=self.instrument).amount, 600)
+
+    def test_failed_trade_keeps_book(self):
+        Fixtures.change_fiat_balance(self.user2, 100)
+        Fixtures.place_order(self.user2, self.instrument,
+                             models.OrderType.BUY.value, 100, 1)
+        book = order_books.get(self.instrument.id, None)
+        with self.assertRaises(ValueError):
+            Fixtures.place_order(self.user1, self.instrument,
+                                 models.OrderType.SELL.value, 100, 1)
+        self.assertEqual(book.best_bid(), to_units(1))
+        self.assertEqual(len(book), 1)
@@ -0,0 +1,92 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from client_user import models
+from client_user.orderbook import order_books
+from client_user.tests_module.utils import Fixtures, OrderBooksMixin
+
+
+class OrderCancelTestCase(OrderBooksMixin, TestCase):
+    url = '/api/v1/user/orders/cancel/'
+
+    def setUp(self):
+        super().setUp()
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 0)
+        self.service = models.ClientUser.objects.create_superuser(
+            'service@mail.ru', 'password')
+        self.instrument = Fixtures.create_instrument()
+        self.other_instrument = Fixtures.create_instrument()
+        self.client = APIClient()
+
+    def _statuses(self, user):
+        return sorted(
+            models.Order.objects.filter(user=user).values_list('status',
+                                                               flat=True))
+
+    def test_user_cancels_own_orders_by_instrument(self):
+        for user in (self.user1, self.user2):
+            for instrument in (self.instrument, self.other_instrument):
+                Fixtures.create_order(user, instrument,
+                                      models.OrderType.BUY.value, 10, 1)
+        self.client.force_authenticate(self.user1)
+        response = self.client.post(self.url,
+                                    {'instrument_id': self.instrument.id},
+                                    format='json')
+        self.assertEqual(response.data['result']['cancelled'], 1)
+        self.assertEqual(self._statuses(self.user1), ['active', 'cancelled'])
+        self.assertEqual(self._statuses(self.user2), ['active', 'active'])
+        self.assertEqual(models.Order.objects.count(), 4)
+
+    def test_only_superuser_cancels_orders_of_others(self):
+        Fixtures.create_order(self.user2, self.instrument,
+                              models.OrderType.SELL.value, 10, 1)
+        self.client.force_authenticate(self.user1)
+        response = self.client.post(self.url, {'user_id': self.user2.id},
+                                    format='json')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_authenticate(self.service)
+        data = {'user_id': self.user2.id, 'type': models.OrderType.SELL.value}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.data['result']['cancelled'], 1)
+        self.assertEqual(self._statuses(self.user2), ['cancelled'])
+
+    @override_settings(ORDER_BOOK_ENGINE=models.OrderBookEngine.MEMORY.value)
+    def test_cancelled_orders_leave_memory_book(self):
+        Fixtures.change_fiat_balance(self.user2, 10)
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 10)
+        Fixtures.place_order(self.user2,
+                             self.instrument,
+                             models.OrderType.BUY.value,
+                             10,
+                             1,
+                             expires_in=60)
+        models.Order.cancel_orders(user_id=self.user2.id)
+        order = Fixtures.place_order(self.user1,
+                                     self.instrument,
+                                     models.OrderType.SELL.value,
+                                     10,
+                                     1,
+                                     expires_in=60)
+        self.assertEqual(order.remaining_sum, 10)
+        self.assertEqual(self._statuses(self.user2), ['cancelled'])
+
+    @override_settings(ORDER_BOOK_ENGINE=models.OrderBookEngine.MEMORY.value)
+    def test_stale_memory_book_is_reloaded(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 10)
+        buy_order = Fixtures.create_order(self.user2, self.instrument,
+                                          models.OrderType.BUY.value, 10, 1)
+        order_books.get(self.instrument.id, models.Order.load_order_book)
+        # cancelled by another process, this book does not know about it
+        models.Order.objects.filter(pk=buy_order.pk).update(
+            status=models.OrderStatus.CANCELLED.value)
+        order = Fixtures.place_order(self.user1,
+                                     self.instrument,
+                                     models.OrderType.SELL.value,
+                                     10,
+                                     1,
+                                     expires_in=60)
+        self.assertEqual(order.remaining_sum, 10)
+        self.assertNotIn(
+            buy_order.pk,
+            order_books.get(self.instrument.id, models.Order.load_order_book))
@@ -0,0 +1,65 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from client_user import models
+from client_user.tests_module.utils import Fixtures
+
+
+class OrderDepthTestCase(TestCase):
+    url = '/api/v1/user/depth/'
+
+    def setUp(self):
+        cache.clear()
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 100)
+        self.instrument = Fixtures.create_instrument()
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 100)
+        self.client = APIClient()
+
+    def _depth(self, levels=10):
+        response = self.client.get(self.url, {
+            'instrument_id': self.instrument.id,
+            'levels': levels
+        })
+        self.assertEqual(response.status_code, 200)
+        return {
+            side: [(float(level['price']), float(level['remaining_sum']),
+                    level['orders']) for level in levels]
+            for side, levels in response.data['result'].items()
+        }
+
+    def test_levels_are_aggregated(self):
+        for price in (2, 2, 3):
+            Fixtures.place_order(self.user1, self.instrument,
+                                 models.OrderType.SELL.value, 10, price)
+        Fixtures.place_order(self.user2, self.instrument,
+                             models.OrderType.BUY.value, 5, 1)
+        self.assertEqual(self._depth(), {
+            'buy': [(1, 5, 1)],
+            'sell': [(2, 20, 2), (3, 10, 1)]
+        })
+        self.assertEqual(self._depth(levels=1)['sell'], [(2, 20, 2)])
+
+    def test_cache_is_dropped_on_change(self):
+        Fixtures.place_order(self.user1, self.instrument,
+                             models.OrderType.SELL.value, 10, 2)
+        self._depth()
+        with self.assertNumQueries(0):
+            models.Order.get_depth(self.instrument.id)
+        Fixtures.place_order(self.user2, self.instrument,
+                             models.OrderType.BUY.value, 4, 2)
+        self.assertEqual(self._depth()['sell'], [(2, 6, 1)])
+        models.Order.cancel_orders(user_id=self.user1.id)
+        self.assertEqual(self._depth()['sell'], [])
+
+    def test_levels_are_validated(self):
+        response = self.client.get(self.url, {
+            'instrument_id': self.instrument.id,
+            'levels': 0
+        })
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {
+            'instrument_id': 'abc',
+        })
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from client_user import models
+from client_user.orderbook import order_books
+from client_user.tests_module.utils import Fixtures, OrderBooksMixin
+
+
+class OrderExpiryTestCase(OrderBooksMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 0)
+        self.instrument = Fixtures.create_instrument()
+
+    def test_deadline_is_set_on_save(self):
+        order = Fixtures.create_order(self.user1, self.instrument,
+                                      models.OrderType.SELL.value, 10, 1)
+        self.assertAlmostEqual(order.expires_at_dt,
+                               order.created_at_dt + timedelta(days=1),
+                               delta=timedelta(seconds=1))
+
+    def test_expire_orders(self):
+        order = Fixtures.create_order(self.user1, self.instrument,
+                                      models.OrderType.SELL.value, 10, 1)
+        completed = Fixtures.create_order(self.user1, self.instrument,
+                                          models.OrderType.SELL.value, 10, 1)
+        completed.status = models.OrderStatus.COMPLETED.value
+        completed.save()
+        self.assertEqual(models.Order.expire_orders(), 0)
+        later = timezone.now() + timedelta(days=2)
+        self.assertEqual(models.Order.expire_orders(later), 1)
+        order.refresh_from_db()
+        completed.refresh_from_db()
+        self.assertEqual(order.status, models.OrderStatus.EXPIRED.value)
+        self.assertEqual(completed.status, models.OrderStatus.COMPLETED.value)
+
+    def test_expired_order_is_not_matched(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 10)
+        Fixtures.change_fiat_balance(self.user2, 10)
+        Fixtures.create_order(self.user1, self.instrument,
+                              models.OrderType.SELL.value, 10, 1)
+        models.Order.expire_orders(timezone.now() + timedelta(days=2))
+        order = Fixtures.place_order(self.user2,
+                                     self.instrument,
+                                     models.OrderType.BUY.value,
+                                     10,
+                                     1,
+                                     expires_in=60)
+        self.assertEqual(order.remaining_sum, 10)
+
+    @override_settings(ORDER_BOOK_ENGINE=models.OrderBookEngine.MEMORY.value)
+    def test_memory_book_drops_expired_orders(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 10)
+        Fixtures.change_fiat_balance(self.user2, 10)
+        sell_order = Fixtures.place_order(self.user1,
+                                          self.instrument,
+                                          models.OrderType.SELL.value,
+                                          10,
+                                          1,
+                                          expires_in=0)
+        buy_order = Fixtures.place_order(self.user2,
+                                         self.instrument,
+                                         models.OrderType.BUY.value,
+                                         10,
+                                         1,
+                                         expires_in=60)
+        sell_order.refresh_from_db()
+        self.assertEqual(buy_order.remaining_sum, 10)
+        self.assertEqual(sell_order.status, models.OrderStatus.EXPIRED.value)
+        book = order_books.get(self.instrument.id, None)
+        self.assertNotIn(sell_order.pk, book)
+        self.assertIn(buy_order.pk, book)
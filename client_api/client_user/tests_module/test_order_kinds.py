@@ -0,0 +1,72 @@
+from django.test import TestCase
+
+from client_user import models
+from client_user.tests_module.utils import Fixtures
+
+
+class OrderKindsTestCase(TestCase):
+    def setUp(self):
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 0)
+        self.instrument = Fixtures.create_instrument()
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 300)
+        Fixtures.change_fiat_balance(self.user2, 1000)
+        for price in (1, 2):
+            Fixtures.create_order(self.user1, self.instrument,
+                                  models.OrderType.SELL.value, 100, price)
+
+    def _fiat(self, user):
+        return models.FiatBalance.objects.get(user=user).amount
+
+    def test_ioc_remainder_is_cancelled(self):
+        order = Fixtures.place_order(self.user2,
+                                     self.instrument,
+                                     models.OrderType.BUY.value,
+                                     150,
+                                     1,
+                                     kind=models.OrderKind.IOC.value)
+        self.assertEqual(order.status, models.OrderStatus.CANCELLED.value)
+        self.assertEqual(order.remaining_sum, 50)
+        self.assertFalse(
+            models.Order.objects.filter(
+                user=self.user2, status=models.OrderStatus.ACTIVE.value))
+        self.assertEqual(self._fiat(self.user2), 900)
+
+    def test_fok_is_killed_without_enough_depth(self):
+        order = Fixtures.place_order(self.user2,
+                                     self.instrument,
+                                     models.OrderType.BUY.value,
+                                     250,
+                                     2,
+                                     kind=models.OrderKind.FOK.value)
+        self.assertEqual(order.status, models.OrderStatus.CANCELLED.value)
+        self.assertEqual(order.remaining_sum, 250)
+        self.assertEqual(self._fiat(self.user2), 1000)
+
+    def test_fok_is_filled(self):
+        order = Fixtures.place_order(self.user2,
+                                     self.instrument,
+                                     models.OrderType.BUY.value,
+                                     200,
+                                     2,
+                                     kind=models.OrderKind.FOK.value)
+        self.assertEqual(order.status, models.OrderStatus.COMPLETED.value)
+        self.assertEqual(self._fiat(self.user2), 700)
+
+    def test_market_order_price(self):
+        order = models.Order(type=models.OrderType.BUY.value,
+                             instrument=self.instrument,
+                             remaining_sum=150)
+        self.assertEqual(models.Order.price_market_order(order), 2)
+        order.remaining_sum = 500
+        self.assertEqual(models.Order.price_market_order(order), 2)
+        order.type = models.OrderType.SELL.value
+        self.assertIsNone(models.Order.price_market_order(order))
+        order = Fixtures.place_order(self.user2,
+                                     self.instrument,
+                                     models.OrderType.BUY.value,
+                                     500,
+                                     2,
+                                     kind=models.OrderKind.MARKET.value)
+        self.assertEqual(order.status, models.OrderStatus.CANCELLED.value)
+        self.assertEqual(order.remaining_sum, 300)
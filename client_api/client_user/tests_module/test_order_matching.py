@@ -1,7 +1,10 @@
 from datetime import timedelta
 from decimal import Decimal
 
-from django.test import TestCase
+from django.contrib import admin
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 
 from client_user import models
 
@@ -157,3 +160,85 @@ class BaseTestCase(TestCase):
             buy_order, sell_order)
         self.assertEqual(order1.actual_price, Decimal(str(0.9)))
         self.assertEqual(order2.actual_price, Decimal(str(0.9)))
+
+    def test_sweep_writes_are_batched(self):
+        buyers = [
+            Fixtures.create_user(f'buyer{i}@mail.ru', 100) for i in range(5)
+        ]
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 500)
+        for buyer in buyers:
+            Fixtures.create_order(buyer, self.instrument,
+                                  models.OrderType.BUY.value, 100, 1)
+        sell_order = models.Order(user=self.user1,
+                                  instrument=self.instrument,
+                                  type=models.OrderType.SELL.value,
+                                  total_sum=500,
+                                  remaining_sum=500,
+                                  price=1,
+                                  expires_in=timedelta(days=1).total_seconds())
+        with CaptureQueriesContext(connection) as queries:
+            models.Order.place_order(sell_order)
+        updates = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('UPDATE')
+        ]
+        # counter orders, totals of the new order and of completed counter
+        # orders, candles of all resolutions and one per balance model
+        self.assertEqual(len(updates), 6)
+        balance_reads = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('SELECT') and 'balance' in q['sql']
+        ]
+        # balances are changed by conditional updates without being read
+        self.assertEqual(len(balance_reads), 0)
+        trade_inserts = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('INSERT') and 'trade' in q['sql']
+        ]
+        self.assertEqual(len(trade_inserts), 1)
+        candle_inserts = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('INSERT') and 'candle' in q['sql']
+        ]
+        self.assertEqual(len(candle_inserts), 1)
+        self.assertEqual(sell_order.status, models.OrderStatus.COMPLETED.value)
+        trades = models.Trade.objects.filter(taker=sell_order)
+        self.assertEqual(trades.count(), 5)
+        self.assertEqual({trade.maker.user for trade in trades}, set(buyers))
+        self.assertTrue(all(trade.quantity == 100 for trade in trades))
+        for buyer in buyers:
+            self.assertEqual(
+                models.InstrumentBalance.objects.get(
+                    user=buyer, instrument=self.instrument).amount, 100)
+
+    def test_inactive_orders_are_not_matched(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 100)
+        Fixtures.change_fiat_balance(self.user2, 100)
+        buy_order = Fixtures.create_order(self.user2, self.instrument,
+                                          models.OrderType.BUY.value, 100, 1)
+        buy_order.status = models.OrderStatus.DELETED.value
+        buy_order.save()
+        sell_order = models.Order(user=self.user1,
+                                  instrument=self.instrument,
+                                  type=models.OrderType.SELL.value,
+                                  total_sum=100,
+                                  remaining_sum=100,
+                                  price=1,
+                                  expires_in=timedelta(days=1).total_seconds())
+        sell_order = models.Order.place_order(sell_order)
+        buy_order.refresh_from_db()
+        self.assertEqual(sell_order.status, models.OrderStatus.ACTIVE.value)
+        self.assertEqual(sell_order.remaining_sum, 100)
+        self.assertEqual(buy_order.remaining_sum, 100)
+
+    def test_trades_are_read_only_in_admin(self):
+        trade_admin = admin.site._registry[models.Trade]
+        request = RequestFactory().get('/admin/')
+        request.user = models.ClientUser.objects.create_superuser(
+            'admin@mail.ru', 'password')
+        # admin is only open to superusers in debug mode
+        with self.settings(DEBUG=True):
+            self.assertTrue(trade_admin.has_view_permission(request))
+            self.assertFalse(trade_admin.has_add_permission(request))
+            self.assertFalse(trade_admin.has_change_permission(request))
+            self.assertFalse(trade_admin.has_delete_permission(request))
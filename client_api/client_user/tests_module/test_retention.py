@@ -0,0 +1,76 @@
+import csv
+import gzip
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from client_user import models, retention
+from client_user.tests_module.utils import Fixtures
+
+POLICY = {
+    'downsample_after': 7,
+    'points': 3,
+    'summary': 'avg',
+    'delete_after': 30,
+}
+
+
+class RetentionTestCase(TestCase):
+    def setUp(self):
+        self.instrument = Fixtures.create_instrument()
+        self.now = timezone.now()
+
+    def _round(self, model, field, days_ago, values):
+        emulation_uuid = uuid.uuid4()
+        for i, value in enumerate(values):
+            moment = self.now - timedelta(days=days_ago, minutes=-i)
+            with mock.patch('django.utils.timezone.now', return_value=moment):
+                model.objects.create(instrument=self.instrument,
+                                     uuid=emulation_uuid,
+                                     **{field: value})
+        return emulation_uuid
+
+    def _values(self, model, field, emulation_uuid):
+        rows = model.objects.filter(uuid=emulation_uuid)
+        return list(
+            rows.order_by('created_at_dt').values_list(field, flat=True))
+
+    @override_settings(STATS_RETENTION={'OrderPriceHistory': POLICY},
+                       STATS_RETENTION_BATCH_SIZE=2)
+    def test_old_rounds_are_downsampled_and_expired(self):
+        model = models.OrderPriceHistory
+        recent = self._round(model, 'price', 1, range(1, 11))
+        old = self._round(model, 'price', 10, range(1, 11))
+        expired = self._round(model, 'price', 40, range(1, 6))
+        last = model.objects.filter(uuid=old).latest('created_at_dt')
+        self.assertEqual(retention.apply_retention(self.now),
+                         {'OrderPriceHistory': [7, 5]})
+        self.assertEqual(self._values(model, 'price', recent),
+                         list(range(1, 11)))
+        self.assertEqual(self._values(model, 'price', old), [2.5, 6.5, 9.5])
+        self.assertEqual(
+            model.objects.filter(uuid=old).latest('created_at_dt'), last)
+        self.assertFalse(model.objects.filter(uuid=expired).exists())
+        self.assertEqual(retention.apply_retention(self.now),
+                         {'OrderPriceHistory': [0, 0]})
+
+    def test_last_summary_and_archive(self):
+        model = models.PlacedAssetsHistory
+        old = self._round(model, 'value', 10, range(1, 8))
+        with tempfile.TemporaryDirectory() as path:
+            policy = {**POLICY, 'summary': 'last', 'archive': True}
+            with override_settings(
+                    STATS_RETENTION={'PlacedAssetsHistory': policy},
+                    STATS_ARCHIVE_PATH=path):
+                retention.apply_retention(self.now)
+            archive = os.path.join(path, f'{model._meta.db_table}.csv.gz')
+            with gzip.open(archive, 'rt', newline='') as file:
+                archived = list(csv.reader(file))
+        self.assertEqual(self._values(model, 'value', old), [3, 6, 7])
+        values = [float(row[4]) for row in archived]
+        self.assertEqual(values, list(range(1, 8)))
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from client_user import models, sequencer
+from client_user.tests_module.utils import Fixtures, OrderBooksMixin
+
+
+class LocalSequencerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.executed = []
+        self.release = threading.Event()
+        self.sequencer = sequencer.LocalSequencer(handler=self._handler)
+
+    def _handler(self, command):
+        self.release.wait(5)
+        self.executed.append(
+            (threading.current_thread().name, command['order']['price']))
+        return {'status': sequencer.CommandStatus.DONE.value, 'order_id': 1}
+
+    def _command(self, instrument_id, price):
+        order = models.Order(user_id=1,
+                             instrument_id=instrument_id,
+                             type=models.OrderType.BUY.value,
+                             price=Decimal(price),
+                             total_sum=Decimal(1),
+                             expires_in=60)
+        command = sequencer.place_order_command(order)
+        self.sequencer.submit(command)
+        return command['id']
+
+    def test_commands_are_serialized_per_instrument(self):
+        ids = [self._command(1, p) for p in ('1', '2', '3')]
+        other = self._command(2, '4')
+        self.release.set()
+        for command_id in ids + [other]:
+            self.assertEqual(
+                self.sequencer.wait(command_id, 5)['status'],
+                sequencer.CommandStatus.DONE.value)
+        self.assertEqual(
+            [p for name, p in self.executed if name == 'matching-1'],
+            ['1', '2', '3'])
+        self.assertEqual(
+            [p for name, p in self.executed if name == 'matching-2'], ['4'])
+
+    def test_wait_timeout_and_poll(self):
+        command_id = self._command(1, '1')
+        self.assertIsNone(self.sequencer.wait(command_id, 0.01))
+        self.assertEqual(
+            self.sequencer.result(command_id)['status'],
+            sequencer.CommandStatus.PENDING.value)
+        self.release.set()
+        self.assertEqual(
+            self.sequencer.wait(command_id, 5)['status'],
+            sequencer.CommandStatus.DONE.value)
+        self.assertIsNone(self.sequencer.result(command_id))
+
+    def test_uncollected_results_expire(self):
+        self.sequencer.result_ttl = 0
+        self.release.set()
+        command_id = self._command(1, '1')
+        self.sequencer._results[command_id].result(5)
+        # the result is kept until the worker records it finished
+        for _ in range(100):
+            if self.sequencer._finished:
+                break
+            time.sleep(0.01)
+        other = self._command(1, '2')
+        self.assertIsNone(self.sequencer.result(command_id))
+        self.assertEqual(
+            self.sequencer.wait(other, 5)['status'],
+            sequencer.CommandStatus.DONE.value)
+
+
+class SequencerTestCase(SimpleTestCase):
+    def test_incomplete_sequencer_can_not_be_created(self):
+        class SubmitOnly(sequencer.Sequencer):
+            def submit(self, command):
+                pass
+
+        with self.assertRaises(TypeError):
+            SubmitOnly()
+
+
+class RedeliveryTestCase(OrderBooksMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = Fixtures.create_user('pes@mail.ru', 100)
+        self.instrument = Fixtures.create_instrument()
+        order = models.Order(user=self.user,
+                             instrument=self.instrument,
+                             type=models.OrderType.BUY.value,
+                             price=Decimal(1),
+                             total_sum=Decimal(10),
+                             expires_in=60)
+        self.command = sequencer.place_order_command(order)
+
+    def _consume(self, status):
+        connection = mock.MagicMock()
+        connection.get.return_value = json.dumps({'status': status})
+        key = sequencer.STREAM_KEY.format(self.instrument.id)
+        messages = [(b'1-0', {b'command': json.dumps(self.command)})]
+        connection.xreadgroup.return_value = [(key.encode(), messages)]
+        handler = mock.Mock(return_value={'status': 'done'})
+        sequencer.RedisSequencer(connection)._consume({key: '0'}, 'worker', 0,
+                                                      handler)
+        connection.xack.assert_called_once_with(key, sequencer.CONSUMER_GROUP,
+                                                b'1-0')
+        return handler.called
+
+    def test_finished_commands_are_only_acknowledged(self):
+        self.assertTrue(self._consume(sequencer.CommandStatus.PENDING.value))
+        self.assertFalse(self._consume(sequencer.CommandStatus.DONE.value))
+        self.assertFalse(self._consume(sequencer.CommandStatus.ERROR.value))
+
+    def test_redelivered_order_is_placed_once(self):
+        first = sequencer.execute_command(self.command)
+        self.assertEqual(sequencer.execute_command(self.command), first)
+        self.assertEqual(models.Order.objects.get().pk, first['order_id'])
+        self.assertEqual(
+            models.FiatBalance.objects.get(user=self.user).reserved, 10)
+
+    def test_commands_taken_over_are_not_executed_twice(self):
+        connection = mock.MagicMock()
+        connection.xpending_range.return_value = [{
+            'message_id': b'1-0',
+            'consumer': b'previous'
+        }]
+        order_sequencer = sequencer.RedisSequencer(connection)
+        key = order_sequencer._join(self.instrument.id, 'next', takeover=True)
+        connection.xclaim.assert_called_once_with(key,
+                                                  sequencer.CONSUMER_GROUP,
+                                                  'next', 0, [b'1-0'])
+        # previous owner committed the order but crashed before publishing
+        first = sequencer.execute_command(self.command)
+        connection.get.return_value = None
+        messages = [(b'1-0', {b'command': json.dumps(self.command)})]
+        connection.xreadgroup.return_value = [(key.encode(), messages)]
+        order_sequencer._consume({key: '0'}, 'next', 0,
+                                 sequencer.execute_command)
+        self.assertEqual(models.Order.objects.get().pk, first['order_id'])
+        connection.xack.assert_called_once_with(key, sequencer.CONSUMER_GROUP,
+                                                b'1-0')
@@ -0,0 +1,36 @@
+from collections import Counter
+
+from django.test import SimpleTestCase
+
+from client_user.shards import ShardMap
+
+
+class ShardMapTestCase(SimpleTestCase):
+    instrument_ids = range(1, 1001)
+
+    def test_owner_is_stable(self):
+        shard_map = ShardMap(['b', 'a', 'c'])
+        self.assertEqual(shard_map.shards, ['a', 'b', 'c'])
+        other = ShardMap(['c', 'b', 'a'])
+        for instrument_id in self.instrument_ids:
+            self.assertEqual(shard_map.owner(instrument_id),
+                             other.owner(instrument_id))
+
+    def test_instruments_are_spread(self):
+        shard_map = ShardMap([f'shard-{i}' for i in range(4)])
+        counts = Counter(map(shard_map.owner, self.instrument_ids))
+        self.assertEqual(len(counts), 4)
+        self.assertTrue(all(count > 150 for count in counts.values()))
+
+    def test_new_shard_moves_only_its_instruments(self):
+        before = ShardMap([f'shard-{i}' for i in range(4)])
+        after = ShardMap([f'shard-{i}' for i in range(5)])
+        moved = [
+            i for i in self.instrument_ids if before.owner(i) != after.owner(i)
+        ]
+        self.assertTrue(all(after.owner(i) == 'shard-4' for i in moved))
+        self.assertLess(len(moved), 350)
+
+    def test_empty_map(self):
+        with self.assertRaises(ValueError):
+            ShardMap([]).owner(1)
@@ -1,6 +1,10 @@
+import json
+import uuid
 from decimal import Decimal
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
 from client_user import models
 from client_user.tests_module.utils import Fixtures
@@ -8,10 +12,11 @@ from client_user.tests_module.utils import Fixtures
 
 class BaseTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.user1 = Fixtures.create_user('pes@mail.ru', 0)
         self.user2 = Fixtures.create_user('psina@mail.ru', 0)
         self.bank = Fixtures.create_user('bank1@mail.ru', 500)
-        self.instrument = Fixtures.create_instrument()
+        self.instrument = Fixtures.create_instrument(issuer=self.bank)
 
     def test_statisticks_ok(self):
         Fixtures.change_fiat_balance(self.user1, 500)
@@ -54,3 +59,175 @@ class BaseTestCase(TestCase):
         _ = models.Order._trade_orders(order1, order2)
         price = models.Order.get_avg_price(self.instrument)
         self.assertEqual(price, 1)
+
+    def test_average_price_follows_cancel_and_delete(self):
+        Fixtures.create_order(self.user1, self.instrument,
+                              models.OrderType.SELL.value, 100, 1)
+        order = Fixtures.create_order(self.user2, self.instrument,
+                                      models.OrderType.BUY.value, 100, 3)
+        self.assertEqual(models.Order.get_avg_price(self.instrument), 2)
+        models.Order.cancel_orders(pk=order.pk)
+        self.assertEqual(models.Order.get_avg_price(self.instrument), 1)
+        other = Fixtures.create_order(self.user2, self.instrument,
+                                      models.OrderType.BUY.value, 300, 2)
+        self.assertEqual(models.Order.get_avg_price(self.instrument), 1.75)
+        other.delete()
+        self.assertEqual(models.Order.get_avg_price(self.instrument), 1)
+
+    def test_totals_follow_bulk_delete_and_status_change(self):
+        Fixtures.create_order(self.user1, self.instrument,
+                              models.OrderType.SELL.value, 100, 1)
+        order = Fixtures.create_order(self.user2, self.instrument,
+                                      models.OrderType.BUY.value, 100, 3)
+        order = models.Order.objects.get(pk=order.pk)
+        order.status = models.OrderStatus.COMPLETED.value
+        order.save(update_fields=['status'])
+        self.assertEqual(models.Order.get_liquidity_rate(self.instrument), 0.5)
+        models.Order.objects.filter(pk=order.pk).delete()
+        self.assertEqual(models.Order.get_avg_price(self.instrument), 1)
+        self.assertEqual(models.Order.get_liquidity_rate(self.instrument), 0)
+        self.assertEqual(models.OrderTotals.rebuild(), [])
+
+    def test_rebuild_order_totals(self):
+        Fixtures.create_order(self.user1, self.instrument,
+                              models.OrderType.SELL.value, 100, 2)
+        models.OrderTotals.objects.filter(instrument=self.instrument).update(
+            volume=0, price_volume=0)
+        self.assertEqual(models.Order.get_avg_price(self.instrument), 0)
+        self.assertEqual(models.OrderTotals.rebuild(), [self.instrument.id])
+        self.assertEqual(models.Order.get_avg_price(self.instrument), 2)
+        self.assertEqual(models.OrderTotals.rebuild(), [])
+
+    def test_liquidity_rate_follows_order_status(self):
+        self.assertEqual(models.Order.get_liquidity_rate(self.instrument), 0)
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 100)
+        Fixtures.change_fiat_balance(self.user2, 300)
+        Fixtures.place_order(self.user1, self.instrument,
+                             models.OrderType.SELL.value, 100, 1)
+        Fixtures.place_order(self.user2, self.instrument,
+                             models.OrderType.BUY.value, 100, 1)
+        resting = Fixtures.place_order(self.user2, self.instrument,
+                                       models.OrderType.BUY.value, 200, 1)
+        self.assertEqual(models.Order.get_liquidity_rate(self.instrument), 0.5)
+        models.Order.cancel_orders(pk=resting.pk)
+        self.assertEqual(models.Order.get_liquidity_rate(self.instrument), 1)
+        self.assertEqual(models.OrderTotals.rebuild(), [])
+
+    def test_placed_assets_of_issuer(self):
+        Fixtures.change_instrument_balance(self.bank, self.instrument, 500)
+        # email does not make anyone an issuer
+        other_bank = Fixtures.create_user('bank2@mail.ru', 0)
+        Fixtures.change_instrument_balance(other_bank, self.instrument, 7)
+        self.assertEqual(models.Order.get_placed_assets_rate(self.instrument),
+                         500)
+        Fixtures.change_instrument_balance(self.bank, self.instrument, -100)
+        self.assertEqual(models.Order.get_placed_assets_rate(self.instrument),
+                         400)
+        self.assertEqual(
+            models.Order.get_placed_assets_rate(Fixtures.create_instrument()),
+            0)
+
+    def test_record_statistics_of_several_instruments(self):
+        other = Fixtures.create_instrument()
+        emulation_uuid = str(uuid.uuid4())
+        Fixtures.change_instrument_balance(self.bank, self.instrument, 500)
+        Fixtures.create_order(self.user1, self.instrument,
+                              models.OrderType.SELL.value, 100, 2)
+        client = APIClient()
+        data = {
+            'instrument_ids': [self.instrument.id, other.id],
+            'emulation_uuid': emulation_uuid,
+        }
+        response = client.post('/api/v1/user/stats/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        # nothing traded on the other instrument and no price before
+        self.assertEqual(
+            list(
+                models.OrderPriceHistory.objects.values_list(
+                    'instrument_id', 'price')), [(self.instrument.id, 2)])
+        placed_assets = models.PlacedAssetsHistory.objects.values_list(
+            'instrument_id', 'value')
+        self.assertEqual(dict(placed_assets), {
+            self.instrument.id: 500,
+            other.id: 0
+        })
+        self.assertEqual(models.LiquidityHistory.objects.count(), 2)
+
+        models.Order.objects.all().delete()
+        # without orders the last price of the round is repeated
+        self.assertEqual(models.Order.get_avg_price(self.instrument), 0)
+        models.Order.record_statistics([self.instrument.id], emulation_uuid)
+        self.assertEqual(
+            list(
+                models.OrderPriceHistory.objects.filter(
+                    instrument=self.instrument).order_by('id').values_list(
+                        'price', flat=True)), [2, 2])
+
+    def test_record_statistics_of_unknown_instrument(self):
+        client = APIClient()
+        data = {
+            'instrument_ids': [self.instrument.id, self.instrument.id + 1],
+            'emulation_uuid': str(uuid.uuid4()),
+        }
+        response = client.post('/api/v1/user/stats/', data, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(models.LiquidityHistory.objects.exists())
+        response = client.post('/api/v1/user/stats/',
+                               {'instrument_id': self.instrument.id},
+                               format='json')
+        self.assertEqual(response.status_code, 400)
+        data = {
+            'instrument_id': self.instrument.id,
+            'emulation_uuid': 'not-a-uuid',
+        }
+        response = client.post('/api/v1/user/stats/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.LiquidityHistory.objects.exists())
+
+    def _stats(self, **params):
+        response = APIClient().get('/api/v1/user/stats/', params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))['result']
+
+    @override_settings(STATS_CURSOR_LAG=0)
+    def test_stats_are_streamed_since_last_poll(self):
+        emulation_uuid = str(uuid.uuid4())
+        Fixtures.change_instrument_balance(self.bank, self.instrument, 500)
+        Fixtures.create_order(self.user1, self.instrument,
+                              models.OrderType.SELL.value, 100, 2)
+        models.Order.record_statistics([self.instrument.id], emulation_uuid)
+        result = self._stats(uuid=emulation_uuid)
+        self.assertEqual(result['price_stats'], [2])
+        self.assertEqual(result['liquidity_stats'], [0])
+        self.assertEqual(result['placement_stats'], [500])
+
+        Fixtures.create_order(self.user1, self.instrument,
+                              models.OrderType.SELL.value, 100, 4)
+        models.Order.record_statistics([self.instrument.id], emulation_uuid)
+        polled = self._stats(uuid=emulation_uuid, since=result['until'])
+        self.assertEqual(polled['price_stats'], [3])
+        self.assertEqual(len(polled['placement_stats']), 1)
+        self.assertEqual(
+            self._stats(uuid=emulation_uuid)['price_stats'], [2, 3])
+        self.assertEqual(
+            self._stats(uuid=emulation_uuid,
+                        since=polled['until'])['price_stats'], [])
+        self.assertEqual(
+            self._stats(uuid=emulation_uuid,
+                        instrument_id=self.instrument.id)['price_stats'],
+            [2, 3])
+        response = APIClient().get('/api/v1/user/stats/', {
+            'uuid': emulation_uuid,
+            'instrument_id': 'abc'
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_recent_stats_wait_for_cursor_lag(self):
+        emulation_uuid = str(uuid.uuid4())
+        models.Order.record_statistics([self.instrument.id], emulation_uuid)
+        # may still be committed by another round of record_statistics
+        result = self._stats(uuid=emulation_uuid)
+        self.assertEqual(result['placement_stats'], [])
+        with self.settings(STATS_CURSOR_LAG=0):
+            result = self._stats(uuid=emulation_uuid, since=result['until'])
+        self.assertEqual(len(result['placement_stats']), 1)
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase
+
+from client_user import models, serializers
+from client_user.fixedpoint import from_units, multiply, to_units
+from client_user.tests_module.utils import Fixtures, OrderBooksMixin
+
+
+class FixedPointTestCase(SimpleTestCase):
+    def test_units_round_trip(self):
+        self.assertEqual(to_units(Decimal('0.0001')), 10000)
+        self.assertEqual(from_units(to_units(Decimal('12.34567891'))),
+                         Decimal('12.34567891'))
+
+    def test_multiply_rounds_half_to_even(self):
+        self.assertEqual(multiply(to_units(3), to_units('0.1')),
+                         to_units('0.3'))
+        self.assertEqual(multiply(5, to_units('0.5')), 2)
+        self.assertEqual(multiply(7, to_units('0.5')), 4)
+
+
+class TickLotTestCase(OrderBooksMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = Fixtures.create_user('pes@mail.ru', 0)
+        self.user2 = Fixtures.create_user('psina@mail.ru', 0)
+        self.instrument = Fixtures.create_instrument()
+
+    def test_off_grid_orders_are_rejected(self):
+        Fixtures.change_fiat_balance(self.user2, 100)
+        with self.assertRaises(models.OrderRejected):
+            Fixtures.place_order(self.user2, self.instrument,
+                                 models.OrderType.BUY.value, 1,
+                                 Decimal('1.00005'))
+        with self.assertRaises(models.OrderRejected):
+            Fixtures.place_order(self.user2,
+                                 self.instrument, models.OrderType.BUY.value,
+                                 Decimal('0.00001'), 1)
+        self.assertFalse(models.Order.objects.exists())
+
+    def test_trade_is_exact(self):
+        Fixtures.change_instrument_balance(self.user1, self.instrument, 3)
+        Fixtures.change_fiat_balance(self.user2, 1)
+        Fixtures.place_order(self.user1, self.instrument,
+                             models.OrderType.SELL.value, 3, Decimal('0.1'))
+        order = Fixtures.place_order(self.user2, self.instrument,
+                                     models.OrderType.BUY.value, 3,
+                                     Decimal('0.1'))
+        self.assertEqual(order.status, models.OrderStatus.COMPLETED.value)
+        self.assertEqual(order.actual_price, Decimal('0.1'))
+        fiat = models.FiatBalance.objects.get(user=self.user2)
+        self.assertEqual((fiat.amount, fiat.reserved), (Decimal('0.7'), 0))
+        self.assertEqual(
+            models.FiatBalance.objects.get(user=self.user1).amount,
+            Decimal('0.3'))
+
+    def test_instrument_grid_is_validated(self):
+        serializer = serializers.InstrumentSerializer(data={
+            'name': 'fine',
+            'tick_size': '0.0001',
+            'lot_size': '0.0001',
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer = serializers.InstrumentSerializer(data={
+            'name': 'too fine',
+            'tick_size': '0.00001',
+            'lot_size': '0.0001',
+        })
+        self.assertFalse(serializer.is_valid())
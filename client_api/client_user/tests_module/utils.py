@@ -2,6 +2,7 @@ from datetime import timedelta
 from itertools import count
 
 from client_user import models
+from client_user.orderbook import order_books
 
 
 def get_instrument_name_generator(basename='instrument'):
@@ -23,13 +24,13 @@ class Fixtures:
         return user
 
     @classmethod
-    def create_instrument(cls):
+    def create_instrument(cls, issuer=None):
         """
         Create instrument and set balances for every user
         :return:
         """
-        instrument = models.Instrument.objects.create(
-            name=next(cls.instrument_name_generator))
+        name = next(cls.instrument_name_generator)
+        instrument = models.Instrument.objects.create(name=name, issuer=issuer)
         users = models.ClientUser.objects.filter()
         # for user in users:
         #     models.InstrumentBalance.objects.create(instrument=instrument, user=user)
@@ -60,3 +61,41 @@ class Fixtures:
             remaining_sum=amount,
             price=price,
             expires_in=timedelta(days=1).total_seconds())
+
+    @classmethod
+    def place_order(cls,
+                    user,
+                    instrument,
+                    type,
+                    amount,
+                    price,
+                    expires_in=3600,
+                    **kwargs):
+        """
+        Place order through matching, as API does
+        :return: placed order
+        """
+        order = models.Order(user=user,
+                             instrument=instrument,
+                             type=type,
+                             total_sum=amount,
+                             remaining_sum=amount,
+                             price=price,
+                             expires_in=expires_in,
+                             **kwargs)
+        return models.Order.place_order(order)
+
+
+class OrderBooksMixin:
+    """
+    Starts and ends every test with no in-memory order books, so books
+    of rolled back orders are not seen by other tests
+    """
+
+    def setUp(self):
+        super().setUp()
+        order_books.clear()
+
+    def tearDown(self):
+        order_books.clear()
+        super().tearDown()
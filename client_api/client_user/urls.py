@@ -20,8 +20,12 @@ urlpatterns = [
         views.InstrumentBalanceApiView.as_view()),
     url(r'orders/delete-all/',
         views.OrdersViewSet.as_view(actions={'delete': 'destroy_all'})),
+    url(r'orders/commands/(?P<command_id>[0-9a-f]+)/',
+        views.OrderCommandAPIView.as_view()),
     url(r'stats/', views.StatisticsAPIView.as_view()),
     url(r'price/', views.PricesApiView.as_view()),
+    url(r'depth/', views.DepthApiView.as_view()),
+    url(r'candles/', views.CandlesApiView.as_view()),
     url(r'^', include(router.urls)),
 ]
 
@@ -1,19 +1,32 @@
 import logging
+from datetime import timedelta
+from itertools import islice
+from uuid import UUID
 
 import django_filters
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import generics, permissions, status, views, viewsets
+from rest_framework.decorators import action
 from rest_framework.mixins import ListModelMixin, UpdateModelMixin
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework_jwt.serializers import JSONWebTokenSerializer
 from rest_framework_jwt.views import ObtainJSONWebToken
 
-from client_user import models, serializers
+from client_user import models, sequencer, serializers
+from client_user.candles import RESOLUTION_SECONDS
 
 from .filters import FiatBalanceFilter, InstrumentBalanceFilter
 
 logger = logging.getLogger('django.views')
 
+# history rows fetched from the cursor and encoded at once by stats endpoint
+STATS_CHUNK_SIZE = 2000
+
 
 class ObtainJWTWithTotop(ObtainJSONWebToken):
     serializer_class = JSONWebTokenSerializer
@@ -44,6 +57,23 @@ class InstrumentsViewSet(viewsets.ModelViewSet):
     queryset = models.Instrument.objects.all()
     lookup_field = 'id'
 
+    @action(detail=True, methods=['post'])
+    def auction(self, request, *args, **kwargs):
+        """
+        Clears collected orders of instrument in call auction mode
+        """
+        instrument = self.get_object()
+        if instrument.matching_mode != models.MatchingMode.AUCTION.value:
+            return Response({'result': 'instrument is not in auction mode'},
+                            status=400)
+        price, volume = models.Order.clear_auction(instrument.id)
+        sequencer.reload_order_books([instrument.id])
+        return Response({'result': {
+            'price': price,
+            'volume': volume
+        }},
+                        status=200)
+
 
 class OrdersViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.OrderSerializer
@@ -56,14 +86,81 @@ class OrdersViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         if 'instrument' in request.data and 'instrument_id' not in request.data:
             request.data['instrument_id'] = request.data['instrument']
-        return super().create(request, *args, **kwargs)
+        try:
+            return super().create(request, *args, **kwargs)
+        except sequencer.SequencerTimeout as e:
+            return Response(
+                {
+                    'status': sequencer.CommandStatus.PENDING.value,
+                    'command_id': e.command_id
+                },
+                status=202)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request, *args, **kwargs):
+        """
+        Places list of orders in one request, returns result per order
+        """
+        data = request.data
+        if isinstance(data, list):
+            data = {'orders': data}
+        serializer = serializers.OrderBatchSerializer(
+            data=data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        return Response({'result': serializer.save()}, status=200)
+
+    @action(detail=False, methods=['post'])
+    def cancel(self, request, *args, **kwargs):
+        """
+        Cancels active orders by instrument, user, side or emulation run
+        """
+        serializer = serializers.OrderCancelSerializer(
+            data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        return Response({'result': {
+            'cancelled': serializer.save()
+        }},
+                        status=200)
 
     def destroy_all(self, request, *args, **kwargs):
-        orders = models.Order.objects.all()
-        orders.delete()
+        """
+        Cancels active orders, takes the same filters as query params
+        """
+        serializer = serializers.OrderCancelSerializer(
+            data=request.query_params, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
         return Response({'result': 'ok'}, status=200)
 
 
+class OrderCommandAPIView(views.APIView):
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def get(self, request, command_id, *args, **kwargs) -> Response:
+        """
+        Polls result of order placed through the matching sequencer
+        """
+        order_sequencer = sequencer.get_sequencer()
+        result = None
+        if order_sequencer:
+            result = order_sequencer.result(command_id)
+        if result is None:
+            return Response({'result': 'command not found'}, status=404)
+        if result['status'] == sequencer.CommandStatus.PENDING.value:
+            return Response(result, status=202)
+        try:
+            order = order_sequencer.resolve(result)
+        except sequencer.CommandError as e:
+            return Response({
+                'status': result['status'],
+                'result': str(e)
+            },
+                            status=400)
+        if order.user_id != request.user.id:
+            return Response({'result': 'command not found'}, status=404)
+        return Response(serializers.OrderSerializer(order).data, status=200)
+
+
 class FiatBalanceApiView(UpdateModelMixin, generics.GenericAPIView):
     serializer_class = serializers.FiatBalanceSerializer
     permission_classes = (permissions.IsAuthenticated, )
@@ -116,6 +213,97 @@ class PricesApiView(views.APIView):
         return Response({'result': avg_price}, status=200)
 
 
+class DepthApiView(views.APIView):
+    permission_classes = (permissions.AllowAny, )
+
+    def get(self, request, *args, **kwargs):
+        """
+        Aggregated price levels of the book, best first
+        """
+        instrument_id = self.request.query_params.get('instrument_id')
+        if not instrument_id:
+            return Response(
+                {
+                    'status': 'error',
+                    'result': 'instrument id was not provided'
+                },
+                status=404)
+        try:
+            instrument_id = _int_param(self.request.query_params,
+                                       'instrument_id')
+        except ValueError as e:
+            return Response({'status': 'error', 'result': str(e)}, status=400)
+        max_levels = getattr(settings, 'ORDER_BOOK_DEPTH_LEVELS', 50)
+        try:
+            levels = int(self.request.query_params.get('levels', 10))
+        except ValueError:
+            levels = 0
+        if not 0 < levels <= max_levels:
+            return Response(
+                {
+                    'status': 'error',
+                    'result': f'levels should be from 1 to {max_levels}'
+                },
+                status=400)
+        instrument = get_object_or_404(models.Instrument, id=instrument_id)
+        return Response(
+            {'result': models.Order.get_depth(instrument.id, levels)},
+            status=200)
+
+
+def _int_param(params, name):
+    """
+    Integer query parameter, None when it is not given
+    """
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} should be an integer')
+
+
+def _datetime_param(params, name):
+    """
+    Aware datetime from ISO 8601 query parameter, None when it is not given
+    """
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValueError(f'{name} is not a valid datetime')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _stream_stats(streams, until):
+    """
+    Writes `{"result": {...}}` piece by piece, values go from database
+    cursor straight into JSON without model instances or serializers
+    """
+    # same encoder Response renders with, decimals become numbers
+    encoder = JSONEncoder()
+    yield '{"result": {'
+    for key, queryset in streams:
+        yield f'"{key}": ['
+        rows = queryset.iterator(chunk_size=STATS_CHUNK_SIZE)
+        separator = ''
+        while True:
+            chunk = list(islice(rows, STATS_CHUNK_SIZE))
+            if not chunk:
+                break
+            yield separator + encoder.encode(chunk)[1:-1]
+            separator = ', '
+        yield '], '
+    yield f'"until": {encoder.encode(until)}}}}}'
+
+
 class StatisticsAPIView(views.APIView):
     permission_classes = (permissions.AllowAny, )
 
@@ -123,64 +311,133 @@ class StatisticsAPIView(views.APIView):
         """
         Tell API to write statistics about current emulation round
         """
-        instrument_id = self.request.data.get('instrument_id')
         emulation_uuid = self.request.data.get('emulation_uuid')
         if not emulation_uuid:
             return Response({'result': 'emulation_uuid was not provided'},
                             status=400)
-        if not instrument_id:
-            instrument = models.Instrument.objects.order_by(
-                'created_at_dt').last()
-        else:
-            instrument = models.Instrument.objects.get(id=instrument_id)
-
-        avg_price = models.Order.get_avg_price(instrument)
-        if avg_price != 0:
-            models.OrderPriceHistory.objects.create(price=avg_price,
-                                                    instrument=instrument,
-                                                    uuid=emulation_uuid)
-        else:
-            # In case current price is 0 because of empty orderbook
-            last_price = models.OrderPriceHistory.objects.filter(
-                uuid=emulation_uuid,
-                instrument=instrument).latest('created_at_dt')
-            last_price.pk = None
-            last_price.save()
-
-        liquidity_rate = models.Order.get_liquidity_rate(instrument)
-        placed_assets_rate = models.Order.get_placed_assets_rate(instrument)
-
-        models.LiquidityHistory.objects.create(value=liquidity_rate,
-                                               instrument=instrument,
-                                               uuid=emulation_uuid)
-        models.PlacedAssetsHistory.objects.create(value=placed_assets_rate,
-                                                  instrument=instrument,
-                                                  uuid=emulation_uuid)
+        try:
+            emulation_uuid = UUID(str(emulation_uuid))
+        except ValueError:
+            return Response({'result': 'emulation_uuid is not valid'},
+                            status=400)
+        instrument_ids = self.request.data.get('instrument_ids')
+        if instrument_ids is None:
+            instrument_id = self.request.data.get('instrument_id')
+            if instrument_id:
+                instrument_ids = [instrument_id]
+            else:
+                instrument_ids = list(
+                    models.Instrument.objects.order_by(
+                        '-created_at_dt').values_list('id', flat=True)[:1])
+        if not isinstance(instrument_ids, list) or not instrument_ids:
+            return Response(
+                {'result': 'instrument_ids should be a non-empty list'},
+                status=400)
+        try:
+            instrument_ids = set(map(int, instrument_ids))
+        except (TypeError, ValueError):
+            return Response({'result': 'instrument_ids should be integers'},
+                            status=400)
+        found = models.Instrument.objects.filter(pk__in=instrument_ids).count()
+        if found < len(instrument_ids):
+            return Response({'result': 'instrument not found'}, status=404)
+        models.Order.record_statistics(instrument_ids, emulation_uuid)
 
         return Response({'result': 'ok'}, status=200)
 
-    def get(self, request, *args, **kwargs) -> Response:
+    def get(self, request, *args, **kwargs):
         """
-        Retrieve stats about current emulation round
+        Retrieve stats about current emulation round, oldest first.
+        `since` returns only points recorded after the `until` of an
+        earlier response. `until` lags behind now, so points stamped
+        before it and committed later are not skipped by the next poll
         """
         uuid = self.request.query_params.get('uuid')
         if not uuid:
             return Response({'result': 'uuid was not provided'}, status=400)
-        price_stats = serializers.OrderPriceHistorySerializer(
-            models.OrderPriceHistory.objects.filter(uuid=uuid), many=True)
-        liquidity_stats = serializers.LiquidityRateSerializer(
-            models.LiquidityHistory.objects.filter(uuid=uuid), many=True)
-        placement_stats = serializers.PlacementRateSerializer(
-            models.PlacedAssetsHistory.objects.filter(uuid=uuid), many=True)
-        return Response(
-            {
-                'result': {
-                    'price_stats':
-                    [v.get('price', 0) for v in price_stats.data],
-                    'liquidity_stats':
-                    [v.get('value', 0) for v in liquidity_stats.data],
-                    'placement_stats':
-                    [v.get('value', 0) for v in placement_stats.data],
-                }
-            },
-            status=200)
+        try:
+            UUID(uuid)
+        except ValueError:
+            return Response({'result': 'uuid is not valid'}, status=400)
+        until = timezone.now() - timedelta(
+            seconds=getattr(settings, 'STATS_CURSOR_LAG', 5))
+        filters = {'uuid': uuid, 'created_at_dt__lte': until}
+        try:
+            instrument_id = _int_param(self.request.query_params,
+                                       'instrument_id')
+            since = _datetime_param(self.request.query_params, 'since')
+        except ValueError as e:
+            return Response({'result': str(e)}, status=400)
+        if instrument_id is not None:
+            filters['instrument_id'] = instrument_id
+        if since:
+            filters['created_at_dt__gt'] = since
+        streams = [(key, model.objects.filter(
+            **filters).order_by('created_at_dt').values_list(field, flat=True))
+                   for key, model, field in (
+                       ('price_stats', models.OrderPriceHistory, 'price'),
+                       ('liquidity_stats', models.LiquidityHistory, 'value'),
+                       ('placement_stats', models.PlacedAssetsHistory,
+                        'value'),
+                   )]
+        return StreamingHttpResponse(_stream_stats(streams, until),
+                                     content_type='application/json')
+
+
+class CandlesApiView(views.APIView):
+    permission_classes = (permissions.AllowAny, )
+
+    def get(self, request, *args, **kwargs):
+        """
+        Precomputed OHLCV bars of instrument starting from `from` up to
+        `to`, the latest bars before `to` without `from`
+        """
+        params = self.request.query_params
+        instrument_id = params.get('instrument_id')
+        if not instrument_id:
+            return Response(
+                {
+                    'status': 'error',
+                    'result': 'instrument id was not provided'
+                },
+                status=404)
+        resolution = params.get('resolution',
+                                models.CandleResolution.MINUTE.value)
+        if resolution not in RESOLUTION_SECONDS:
+            return Response(
+                {
+                    'status':
+                    'error',
+                    'result':
+                    f'resolution should be one of {list(RESOLUTION_SECONDS)}'
+                },
+                status=400)
+        max_bars = getattr(settings, 'CANDLES_MAX_BARS', 1000)
+        try:
+            instrument_id = _int_param(params, 'instrument_id')
+            limit = int(params.get('limit', max_bars))
+            start = _datetime_param(params, 'from')
+            end = _datetime_param(params, 'to')
+        except ValueError as e:
+            return Response({'status': 'error', 'result': str(e)}, status=400)
+        if not 0 < limit <= max_bars:
+            return Response(
+                {
+                    'status': 'error',
+                    'result': f'limit should be from 1 to {max_bars}'
+                },
+                status=400)
+        instrument = get_object_or_404(models.Instrument, id=instrument_id)
+        bars = models.Candle.objects.filter(instrument=instrument,
+                                            resolution=resolution)
+        if end:
+            bars = bars.filter(start_dt__lt=end)
+        fields = ('start_dt', 'open', 'high', 'low', 'close', 'volume')
+        if start:
+            bars = list(
+                bars.filter(start_dt__gte=start).order_by('start_dt').values(
+                    *fields)[:limit])
+        else:
+            bars = list(bars.order_by('-start_dt').values(*fields)[:limit])
+            bars.reverse()
+        return Response({'result': bars}, status=200)